@@ -0,0 +1,140 @@
+# agent/answer_cache.py
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag.schema import RagAnswer
+
+class SemanticAnswerCache:
+    """
+    PASSed answers keyed by question embedding. A new question whose cosine
+    similarity to a stored one is >= `threshold` gets the stored answer back.
+
+    Lookup is one mat-vec over a preallocated [maxsize, d] matrix of unit
+    vectors, which at a few thousand entries is well under a millisecond.
+    Entries expire after `ttl` seconds; when full, the least recently used
+    slot is reused. Each entry remembers the content hash of every KB chunk it
+    cited, so `invalidate(rows)` can drop answers whose evidence has changed.
+    """
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 2048, ttl: Optional[float] = 86400):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None   # allocated on first put, once the dim is known
+        self._live = np.zeros(maxsize, dtype=bool)
+        self._stored_at = np.zeros(maxsize, dtype=np.float64)
+        self._used_at = np.zeros(maxsize, dtype=np.float64)
+        self._entries: List[Optional[dict]] = [None] * maxsize
+
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.lookup_ms = 0.0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def _expire(self, now: float) -> None:
+        if self.ttl is None:
+            return
+        old = self._live & (now - self._stored_at >= self.ttl)
+        if old.any():
+            self.evictions += int(old.sum())
+            self._live[old] = False
+            for i in np.flatnonzero(old):
+                self._entries[i] = None
+
+    def get(self, vector) -> Optional[Tuple[RagAnswer, float]]:
+        """(answer copy, similarity) of the closest live entry above the threshold, else None."""
+        start = time.perf_counter()
+        with self._lock:
+            hit = None
+            if self._vectors is not None and self._live.any():
+                now = time.monotonic()
+                self._expire(now)
+                sims = self._vectors @ self._unit(vector)
+                sims[~self._live] = -np.inf
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._used_at[best] = now
+                    hit = (self._entries[best]["answer"].model_copy(deep=True), float(sims[best]))
+            if hit is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.lookup_ms += (time.perf_counter() - start) * 1000.0
+            return hit
+
+    def put(self, question: str, vector, answer: RagAnswer, cited: Dict[str, str]) -> None:
+        """`cited`: {manifest row key: content hash} of the KB chunks the answer cites (see cited_hashes)."""
+        if self.maxsize <= 0:
+            return
+        v = self._unit(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, v.shape[0]), dtype=np.float32)
+            now = time.monotonic()
+            self._expire(now)
+            free = np.flatnonzero(~self._live)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._used_at))
+                self.evictions += 1
+            self._vectors[slot] = v
+            self._live[slot] = True
+            self._stored_at[slot] = self._used_at[slot] = now
+            self._entries[slot] = {"question": question, "answer": answer.model_copy(deep=True), "cited": dict(cited)}
+
+    def invalidate(self, rows: Dict[str, list]) -> int:
+        """
+        Drop entries citing a chunk whose hash differs from `rows` (the KB
+        index manifest's {key: [doc id, hash]}) or that is gone. Returns the count.
+        """
+        with self._lock:
+            dropped = 0
+            for slot in np.flatnonzero(self._live):
+                cited = self._entries[slot]["cited"]
+                if any(rows.get(key, [None, None])[1] != h for key, h in cited.items()):
+                    self._live[slot] = False
+                    self._entries[slot] = None
+                    dropped += 1
+            self.invalidations += dropped
+            return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._live[:] = False
+            self._entries = [None] * self.maxsize
+
+    def __len__(self) -> int:
+        return int(self._live.sum())
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": int(self._live.sum()),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+                "avg_lookup_ms": self.lookup_ms / total if total else 0.0,
+            }
+
+def answer_cache_from_env() -> SemanticAnswerCache:
+    ttl = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    return SemanticAnswerCache(
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "2048")),
+        ttl=ttl if ttl > 0 else None,
+    )
@@ -1,33 +1,44 @@
 # agent/graph.py
-from langgraph.graph import StateGraph, END
+import os
+import time
+from typing import Dict, Optional
 
-from agent.state import GraphState
-from rag.embeddings import get_embeddings_model
-from rag.vectorstore import build_faiss_index, query_index
-from rag.generator import generate_answer
-from agent.validator import validate_with_llm
-from langgraph.graph import StateGraph, END
-from agent.state import GraphState
-from agent.retrieval import retrieve_kb, retrieve_tickets, ticket_docs_to_cases
-from rag.generator import generate_answer
-from agent.validator import validate_with_llm
-
-# --- For now we reuse the tiny in-memory docs to learn the loop.
-# In the next phase, this becomes a real ingestion pipeline + persistent FAISS.
 from langchain_core.documents import Document
 
+from agent.answer_cache import SemanticAnswerCache, answer_cache_from_env
+from agent.hard_checks import evidence_mentions_escalation
+from agent.state import GraphState
+from agent.retrieval import (
+    INDEX_PATHS, aembed_query, aretrieve_candidates, current_version, embed_query,
+    normalize_query, retrieve_candidates, ticket_docs_to_cases,
+)
+from agent.retrieval import warm_up as warm_up_retrieval
+from rag.evidence_packer import pack_evidence
+from rag.telemetry import current_span, inc, span
+from rag.generator import agenerate_answer, agenerate_answer_stream, generate_answer, generate_answer_stream, get_llm
+from agent.validator import avalidate_tiered, validate_tiered
+from rag.vectorstore import read_manifest, stored_id
+
+# Tiny in-memory docs used by the hello_* demos; kept here as the reference corpus.
+# Nothing is embedded at import time: real retrieval goes through the lazily
+# loaded indexes in agent.retrieval.
 TOY_DOCS = [
     Document(page_content="Refunds take 5-10 business days. EU refunds may take longer.", metadata={"source":"policy.md", "chunk_id": 0}),
     Document(page_content="If a user is locked out, advise password reset and verify email.", metadata={"source":"runbook.md", "chunk_id": 0}),
     Document(page_content="Escalate billing issues if charge is duplicated or pending > 7 days.", metadata={"source":"runbook.md", "chunk_id": 1}),
 ]
 
-_embeddings = get_embeddings_model()
-_index = build_faiss_index(TOY_DOCS, _embeddings)
+def warm_up() -> dict:
+    """
+    Preload embeddings, both FAISS indexes and the LLM clients. Optional:
+    everything also loads on first use; long-running servers call this at startup.
+    """
+    timings = warm_up_retrieval()
+    get_llm()
+    return timings
 
 def strip_unsupported_escalation(answer_obj, kb_docs):
-    kb_text = "\n".join(d.page_content for d in kb_docs).lower()
-    if "escalat" in answer_obj.answer.lower() and "escalat" not in kb_text:
+    if "escalat" in answer_obj.answer.lower() and not evidence_mentions_escalation(kb_docs):
         # Remove escalation language and downgrade confidence
         answer_obj.answer = answer_obj.answer.replace("escalate", "follow up with support")
         answer_obj.confidence = "low" if answer_obj.confidence == "high" else answer_obj.confidence
@@ -35,50 +46,191 @@ def strip_unsupported_escalation(answer_obj, kb_docs):
             answer_obj.missing_info = "Escalation steps are not provided in the knowledge base for this issue."
     return answer_obj
 
+def add_timings(state: GraphState, timings: dict) -> None:
+    # Accumulate across retries so the totals reflect the whole request
+    acc = dict(state.get("timings") or {})
+    for key, ms in timings.items():
+        acc[key] = acc.get(key, 0.0) + ms
+    state["timings"] = acc
+
+# Retrieval over-fetches this many ranked candidates per index and keeps them in
+# state; a retry that only raises k pages further into the same list, no new search.
+CANDIDATE_DEPTH = int(os.getenv("CANDIDATE_DEPTH", "10"))
+
+def _wanted(state: GraphState) -> Dict[str, int]:
+    return {"kb": state["kb_k"], "tickets": state["tickets_k"]}
+
+def _to_search(state: GraphState) -> Dict[str, int]:
+    """Search depth for each index whose stored candidates can't serve this query and k."""
+    nq = normalize_query(state["query"])
+    stored = state.get("candidates") or {}
+    depths = {}
+    for name, k in _wanted(state).items():
+        c = stored.get(name)
+        if k <= 0 or (c and c["query"] == nq and (len(c["docs"]) >= k or c["exhausted"])):
+            continue
+        depths[name] = max(k, CANDIDATE_DEPTH)
+    return depths
+
+def _set_evidence(state: GraphState, depths: Dict[str, int], found: Dict[str, list], timings: dict) -> GraphState:
+    nq = normalize_query(state["query"])
+    stored = dict(state.get("candidates") or {})
+    for name, docs in found.items():
+        stored[name] = {"query": nq, "docs": docs, "exhausted": len(docs) < depths[name]}
+    state["candidates"] = stored
+    evidence = {name: stored[name]["docs"][:k] if name in stored and k > 0 else [] for name, k in _wanted(state).items()}
+    state["kb_evidence"] = evidence["kb"]
+    state["ticket_evidence"] = evidence["tickets"]
+    add_timings(state, timings)
+    current_span().set(searched=sorted(depths), kb_k=state["kb_k"], tickets_k=state["tickets_k"],
+                       kb_evidence=len(evidence["kb"]), ticket_evidence=len(evidence["tickets"]))
+    return state
+
+# One retry max for today (bounded agent, production-style)
+MAX_RETRIES = 1
+
+def _count_retry(state: GraphState) -> None:
+    # Retrieval after a RETRY decision is the retry actually being performed
+    if state.get("decision") == "RETRY_WITH_MORE_CONTEXT":
+        state["retries"] = state["retries"] + 1
+
 def retrieve_node(state: GraphState) -> GraphState:
-    q = state["query"]
-    state["kb_evidence"] = retrieve_kb(q, k=state["kb_k"])
-    state["ticket_evidence"] = retrieve_tickets(q, k=state["tickets_k"])
+    _count_retry(state)
+    with span("node.retrieve", retry=state["retries"]):
+        start = time.perf_counter()
+        depths = _to_search(state)
+        found, timings = retrieve_candidates(state["query"], depths) if depths else ({}, {})
+        timings["retrieve_ms"] = (time.perf_counter() - start) * 1000.0
+        return _set_evidence(state, depths, found, timings)
+
+async def aretrieve_node(state: GraphState) -> GraphState:
+    _count_retry(state)
+    with span("node.retrieve", retry=state["retries"]):
+        start = time.perf_counter()
+        depths = _to_search(state)
+        found, timings = await aretrieve_candidates(state["query"], depths) if depths else ({}, {})
+        timings["retrieve_ms"] = (time.perf_counter() - start) * 1000.0
+        return _set_evidence(state, depths, found, timings)
+
+def _stream_events(state: GraphState):
+    """(on_event, finish) pair forwarding parser events to the graph's custom stream."""
+    from langgraph.config import get_stream_writer
+    write = get_stream_writer()
+    start = time.perf_counter()
+    first = []
+
+    def on_event(event):
+        kind = event[0]
+        if kind == "delta":
+            if not first:
+                first.append((time.perf_counter() - start) * 1000.0)
+            write({"event": "answer_delta", "text": event[2], "retry": state["retries"]})
+        elif kind == "field":
+            write({"event": "field", "name": event[1], "value": event[2], "retry": state["retries"]})
+
+    def finish():
+        add_timings(state, {"generate_ttft_ms": first[0] if first else 0.0,
+                            "generate_ms": (time.perf_counter() - start) * 1000.0})
+    return on_event, finish
+
+def _set_answer(state: GraphState, answer) -> GraphState:
+    state["answer"] = strip_unsupported_escalation(answer, state["kb_evidence"])
+    current_span().set(confidence=state["answer"].confidence, citations=len(state["answer"].citations))
     return state
 
+def _packed_evidence(state: GraphState):
+    """KB docs and ticket cases for the prompt, fitted to the token budget (see rag.evidence_packer)."""
+    start = time.perf_counter()
+    kb_docs, cases, stats = pack_evidence(
+        state["question"], state["kb_evidence"], ticket_docs_to_cases(state["ticket_evidence"])
+    )
+    add_timings(state, {"pack_ms": (time.perf_counter() - start) * 1000.0})
+    state["pack_stats"] = list(state.get("pack_stats") or []) + [stats]
+    current_span().set(kb_docs=len(kb_docs), cases=len(cases), tokens_saved=stats["tokens_saved"],
+                       evidence_tokens=stats["kb_tokens_out"] + stats["cases_tokens_out"])
+    return kb_docs, cases
+
 def generate_node(state: GraphState) -> GraphState:
-    cases = ticket_docs_to_cases(state["ticket_evidence"])
-    state["answer"] = generate_answer(state["question"], state["kb_evidence"], cases)
-    state["answer"] = strip_unsupported_escalation(state["answer"], state["kb_evidence"])
-    return state
+    with span("node.generate", retry=state["retries"], stream=bool(state.get("stream"))):
+        kb_docs, cases = _packed_evidence(state)
+        if not state.get("stream"):
+            start = time.perf_counter()
+            answer = generate_answer(state["question"], kb_docs, cases)
+            add_timings(state, {"generate_ms": (time.perf_counter() - start) * 1000.0})
+            return _set_answer(state, answer)
+        # Returns once the JSON object closes, so validation starts right away
+        on_event, finish = _stream_events(state)
+        answer = generate_answer_stream(state["question"], kb_docs, cases, on_event)
+        finish()
+        return _set_answer(state, answer)
 
-# validate_node can stay the same, but we should pass kb evidence into the validator
-def validate_node(state: GraphState) -> GraphState:
-    answer_json = state["answer"].model_dump_json()
-    result = validate_with_llm(state["question"], answer_json, state["kb_evidence"])
+async def agenerate_node(state: GraphState) -> GraphState:
+    with span("node.generate", retry=state["retries"], stream=bool(state.get("stream"))):
+        kb_docs, cases = _packed_evidence(state)
+        if not state.get("stream"):
+            start = time.perf_counter()
+            answer = await agenerate_answer(state["question"], kb_docs, cases)
+            add_timings(state, {"generate_ms": (time.perf_counter() - start) * 1000.0})
+            return _set_answer(state, answer)
+        on_event, finish = _stream_events(state)
+        answer = await agenerate_answer_stream(state["question"], kb_docs, cases, on_event)
+        finish()
+        return _set_answer(state, answer)
 
+def _apply_decision(state: GraphState, outcome, start: float) -> GraphState:
+    result, info = outcome
+    add_timings(state, {"validate_ms": (time.perf_counter() - start) * 1000.0})
+    state["validation_info"] = list(state.get("validation_info") or []) + [info]
     state["decision"] = result.decision
     state["validator_feedback"] = result.feedback
+    current_span().set(decision=result.decision, tier=info.get("tier"))
+    inc("validations_total", 1, "Validator outcomes by tier", tier=info.get("tier"), decision=result.decision)
+    if state.get("stream"):
+        from langgraph.config import get_stream_writer
+        get_stream_writer()({"event": "decision", "decision": result.decision, "retry": state["retries"]})
 
-    if result.decision == "RETRY_WITH_MORE_CONTEXT":
+    if result.decision == "RETRY_WITH_MORE_CONTEXT" and state["retries"] < MAX_RETRIES:
         state["query"] = result.suggested_query or state["query"]
         state["kb_k"] = result.suggested_k or max(state["kb_k"], 8)
-        state["retries"] = state["retries"] + 1
 
     return state
 
+# Tiered: hard checks, then the local support scorer; the LLM judge only for ambiguous answers
+def validate_node(state: GraphState) -> GraphState:
+    with span("node.validate", retry=state["retries"]):
+        start = time.perf_counter()
+        answer_json = state["answer"].model_dump_json()
+        return _apply_decision(state, validate_tiered(state["question"], answer_json, state["kb_evidence"]), start)
+
+async def avalidate_node(state: GraphState) -> GraphState:
+    with span("node.validate", retry=state["retries"]):
+        start = time.perf_counter()
+        answer_json = state["answer"].model_dump_json()
+        outcome = await avalidate_tiered(state["question"], answer_json, state["kb_evidence"])
+        return _apply_decision(state, outcome, start)
+
 def route_after_validate(state: GraphState):
+    from langgraph.graph import END
     if state["decision"] == "PASS":
         return END
     if state["decision"] == "REFUSE":
         return END
-    # RETRY
-    if state["retries"] >= 1:
-        # one retry max for today (bounded agent, production-style)
+    # RETRY; `retries` counts the ones already performed (see _count_retry)
+    if state["retries"] >= MAX_RETRIES:
         return END
     return "retrieve"
 
 def build_graph():
+    # langgraph is imported on first build, not when this module is imported
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import StateGraph
     g = StateGraph(GraphState)
 
-    g.add_node("retrieve", retrieve_node)
-    g.add_node("generate", generate_node)
-    g.add_node("validate", validate_node)
+    # Each node has a sync and an async body: graph.invoke runs the former,
+    # graph.ainvoke / astream the latter, without blocking the event loop
+    g.add_node("retrieve", RunnableLambda(retrieve_node, afunc=aretrieve_node, name="retrieve"))
+    g.add_node("generate", RunnableLambda(generate_node, afunc=agenerate_node, name="generate"))
+    g.add_node("validate", RunnableLambda(validate_node, afunc=avalidate_node, name="validate"))
 
     g.set_entry_point("retrieve")
     g.add_edge("retrieve", "generate")
@@ -86,3 +238,98 @@ def build_graph():
     g.add_conditional_edges("validate", route_after_validate)
 
     return g.compile()
+
+def cited_hashes(answer, kb_docs, rows: Dict[str, list]) -> Optional[Dict[str, str]]:
+    """
+    {row key: content hash} for every KB citation, as stored in the index
+    manifest's `rows` ({key: [doc id, hash]}); None if a citation isn't in the
+    evidence or its row isn't in the manifest. Keys come from the manifest, not
+    doc_key(), so repeated texts keep their ~n suffix.
+    """
+    by_cite = {(d.metadata.get("source"), d.metadata.get("chunk_id")): d for d in kb_docs}
+    by_id = {_id: (key, h) for key, (_id, h) in rows.items()}
+    cited = {}
+    for c in answer.citations:
+        d = by_cite.get((c.source, c.chunk_id))
+        row = by_id.get(stored_id(d)) if d is not None else None
+        if row is None:
+            return None
+        cited[row[0]] = row[1]
+    return cited
+
+class CachedGraph:
+    """
+    The compiled graph behind a semantic answer cache: a paraphrase of an
+    already PASSed question returns the stored answer without retrieval or
+    any LLM call. Answers are invalidated when a chunk they cite changes in
+    the KB index.
+    """
+
+    def __init__(self, graph, cache: SemanticAnswerCache):
+        self.graph = graph
+        self.cache = cache
+        self._kb_version = None
+        self._kb_rows: Dict[str, list] = {}
+        self._hit_ms = self._miss_ms = 0.0
+
+    def _check_kb(self) -> None:
+        version = current_version("kb")
+        if version != self._kb_version:
+            self._kb_rows = read_manifest(INDEX_PATHS["kb"]).get("rows", {})
+            if self._kb_version is not None:
+                self.cache.invalidate(self._kb_rows)
+            self._kb_version = version
+
+    def invoke(self, state: GraphState, *args, **kwargs) -> GraphState:
+        start = time.perf_counter()
+        self._check_kb()
+        # Same memoized embedding the retrieve node uses, so a miss costs no extra API call
+        vector = embed_query(state["question"])
+        hit = self._hit(state, vector, start)
+        if hit is not None:
+            return hit
+
+        out = self.graph.invoke(state, *args, **kwargs)
+        return self._store(state, vector, out, start)
+
+    async def ainvoke(self, state: GraphState, *args, **kwargs) -> GraphState:
+        start = time.perf_counter()
+        self._check_kb()
+        vector = await aembed_query(state["question"])
+        hit = self._hit(state, vector, start)
+        if hit is not None:
+            return hit
+        out = await self.graph.ainvoke(state, *args, **kwargs)
+        return self._store(state, vector, out, start)
+
+    def _store(self, state: GraphState, vector, out: GraphState, start: float) -> GraphState:
+        if out.get("decision") == "PASS" and out.get("answer") is not None:
+            cited = cited_hashes(out["answer"], out.get("kb_evidence") or [], self._kb_rows)
+            if cited is not None:
+                self.cache.put(state["question"], vector, out["answer"], cited)
+        self._miss_ms += (time.perf_counter() - start) * 1000.0
+        return out
+
+    def _hit(self, state: GraphState, vector, start: float) -> Optional[GraphState]:
+        hit = self.cache.get(vector)
+        if hit is None:
+            return None
+        answer, similarity = hit
+        out = dict(state)
+        out["answer"] = answer
+        out["decision"] = "PASS"
+        out["validator_feedback"] = f"Served from answer cache (similarity {similarity:.3f})."
+        ms = (time.perf_counter() - start) * 1000.0
+        add_timings(out, {"answer_cache_ms": ms})
+        self._hit_ms += ms
+        return out
+
+    def stats(self) -> dict:
+        s = self.cache.stats()
+        s["avg_hit_ms"] = self._hit_ms / s["hits"] if s["hits"] else 0.0
+        s["avg_miss_ms"] = self._miss_ms / s["misses"] if s["misses"] else 0.0
+        return s
+
+def build_cached_graph(cache: Optional[SemanticAnswerCache] = None) -> CachedGraph:
+    """build_graph() behind a semantic answer cache (ANSWER_CACHE_THRESHOLD / _SIZE / _TTL)."""
+    return CachedGraph(build_graph(), cache or answer_cache_from_env())
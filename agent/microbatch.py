@@ -0,0 +1,95 @@
+# agent/microbatch.py
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List
+
+from rag.metrics import SIZE_BUCKETS, Histogram
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into batches. submit(item) returns a Future;
+    a collector thread waits up to `window_ms` after the first queued item
+    (or until `max_batch` items) and runs fn(items) -> results, in order, on
+    one of `max_in_flight` worker threads. While every worker is busy, items
+    keep queueing, so batches grow with load and stay at ~1 when idle.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = 32,
+                 window_ms: float = 2.0, max_in_flight: int = 4, name: str = "microbatch"):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.window = window_ms / 1000.0
+        self.name = name
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._slots = threading.Semaphore(max_in_flight)
+        self._workers = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=name)
+        self._start_lock = threading.Lock()
+        self._collector = None
+
+        self.batch_size = Histogram(SIZE_BUCKETS)
+        self.queue_ms = Histogram()     # submit -> batch starts running
+        self.run_ms = Histogram()       # fn(batch) wall time
+        self.errors = 0
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        self._queue.put((item, fut, time.perf_counter()))
+        if self._collector is None:
+            self._start()
+        return fut
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name=f"{self.name}-collector", daemon=True)
+                self._collector.start()
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            self._slots.acquire()
+            # If we waited for a worker the window may be over already; take what is queued
+            deadline = batch[0][2] + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+            self._workers.submit(self._run, batch)
+
+    def _run(self, batch: list) -> None:
+        start = time.perf_counter()
+        try:
+            # Callers that gave up (e.g. a cancelled asyncio task) are dropped from the batch
+            live = [(item, fut) for item, fut, t in batch if fut.set_running_or_notify_cancel()]
+            for _, _, t in batch:
+                self.queue_ms.observe((start - t) * 1000.0)
+            if not live:
+                return
+            self.batch_size.observe(len(live))
+            try:
+                results = self.fn([item for item, _ in live])
+            except BaseException as e:
+                self.errors += 1
+                for _, fut in live:
+                    fut.set_exception(e)
+                return
+            for (_, fut), result in zip(live, results):
+                fut.set_result(result)
+        finally:
+            self.run_ms.observe((time.perf_counter() - start) * 1000.0)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batch_size.count,
+            "items": int(self.batch_size.sum),
+            "avg_batch": self.batch_size.sum / self.batch_size.count if self.batch_size.count else 0.0,
+            "errors": self.errors,
+            "batch_size": self.batch_size.snapshot(),
+            "queue_ms": self.queue_ms.snapshot(),
+            "run_ms": self.run_ms.snapshot(),
+        }
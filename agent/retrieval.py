@@ -1,18 +1,360 @@
 # agent/retrieval.py
 from __future__ import annotations
-from typing import List
-from rag.embeddings import get_embeddings_model
-from rag.vectorstore import load_faiss_index
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
-_embeddings = get_embeddings_model()
-_kb = load_faiss_index("data/index/kb_faiss", _embeddings)
-_tickets = load_faiss_index("data/index/tickets_faiss", _embeddings)
+import numpy as np
+from agent.microbatch import MicroBatcher
+from agent.retrieval_cache import MISS, TTLCache
+from rag.bm25 import BM25Index, reciprocal_rank_fusion
+from rag.mmr import mmr_select
+from rag.resources import get_embeddings, registry
+from rag.telemetry import inc, span
+from rag.vectorstore import (
+    batch_query_index_by_vectors, get_documents, index_version, load_index, query_index_by_vector,
+    stored_id, stored_vectors,
+)
 
-def retrieve_kb(query: str, k: int = 5):
-    return _kb.similarity_search(query, k=k)
+# Either format works here; point these at *_mmap dirs (scripts/convert_index_to_mmap.py)
+# to share index pages across worker processes.
+INDEX_PATHS = {
+    "kb": os.getenv("KB_INDEX_PATH", "data/index/kb_faiss"),
+    "tickets": os.getenv("TICKETS_INDEX_PATH", "data/index/tickets_faiss"),
+}
 
-def retrieve_tickets(query: str, k: int = 3):
-    return _tickets.similarity_search(query, k=k)
+# Hybrid retrieval: fuse dense hits with the BM25 sidecar (when one was built) via
+# reciprocal-rank fusion. Each side contributes its top k * HYBRID_FETCH candidates.
+HYBRID = os.getenv("HYBRID_RETRIEVAL", "1") != "0"
+HYBRID_FETCH = int(os.getenv("HYBRID_FETCH", "3"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Diversification: rerank a pool of k * MMR_FETCH candidates with maximal marginal
+# relevance so near-duplicate passages don't crowd out other evidence.
+MMR = os.getenv("MMR", "1") != "0"
+MMR_FETCH = int(os.getenv("MMR_FETCH", "4"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+
+# Micro-batching: concurrent requests whose queries arrive within MICROBATCH_WINDOW_MS
+# share one embeddings request and one matrix search per index (MICROBATCH_MAX per batch).
+MICROBATCH = os.getenv("MICROBATCH", "1") != "0"
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS", "2"))
+MICROBATCH_MAX = int(os.getenv("MICROBATCH_MAX", "32"))
+
+# Version of each index as of when it was loaded; part of every result-cache key
+_versions: dict = {}
+
+def _index_factory(name: str):
+    def load():
+        path = INDEX_PATHS[name]
+        _versions[name] = index_version(path)
+        return load_index(path, get_embeddings())
+    return load
+
+def _bm25_factory(name: str):
+    def load():
+        return BM25Index.load(INDEX_PATHS[name]) if HYBRID else None
+    return load
+
+for _name in INDEX_PATHS:
+    registry.register(f"{_name}_index", _index_factory(_name))
+    registry.register(f"{_name}_bm25", _bm25_factory(_name))
+
+def _embed_batch(queries: List[str]) -> list:
+    unique = list(dict.fromkeys(queries))
+    with span("embeddings.embed", batch=len(queries), unique=len(unique)):
+        vectors = dict(zip(unique, get_embeddings().embed_documents(unique)))
+    return [vectors[q] for q in queries]
+
+def _search_batch(name: str):
+    def run(items: list) -> list:
+        # Looked up per batch, so a reloaded index is used from the next batch on
+        start = time.perf_counter()
+        with span("faiss.search", index=name, batch=len(items), k=max(k for _, k in items)):
+            results = batch_query_index_by_vectors(_index(name), [v for v, _ in items], [k for _, k in items])
+        ms = _ms(start)
+        return [(docs, ms) for docs in results]
+    return run
+
+def _batcher(fn, name: str):
+    return lambda: MicroBatcher(fn, MICROBATCH_MAX, MICROBATCH_WINDOW_MS, name=name)
+
+registry.register("query_embed_batcher", _batcher(_embed_batch, "embed-batch"))
+for _name in INDEX_PATHS:
+    registry.register(f"{_name}_search_batcher", _batcher(_search_batch(_name), f"{_name}-search-batch"))
+
+def _index(name: str):
+    return registry.get(f"{name}_index")
+
+def _bm25(name: str):
+    return registry.get(f"{name}_bm25")
+
+def _version(name: str):
+    _index(name)  # make sure it is loaded so the version is known
+    return _versions[name]
+
+# Tier 1: normalized query -> embedding. Tier 2: (index, normalized query, k, index version) -> docs.
+_query_vectors = TTLCache(
+    maxsize=int(os.getenv("QUERY_EMBED_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("QUERY_EMBED_CACHE_TTL", "86400")),
+)
+_results = TTLCache(
+    maxsize=int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "900")),
+)
+
+# How often (seconds) to look at disk for a rebuilt index
+_CHECK_EVERY = float(os.getenv("INDEX_CHECK_SECONDS", "30"))
+_last_check = time.monotonic()
+_reload_lock = threading.Lock()
+
+# FAISS releases the GIL during search, so the two indexes really run side by side;
+# BM25 lookups need no embedding and run while the query is being embedded
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+def _submit(fn, *args) -> Future:
+    # Run in the caller's context so the search's span joins the request's trace
+    return _search_pool.submit(contextvars.copy_context().run, fn, *args)
+
+def _ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000.0
+
+def normalize_query(query: str) -> str:
+    # Whitespace only: embeddings are case-sensitive ("IRS" vs "irs"), and both cache
+    # tiers must agree on what counts as the same query
+    return " ".join(query.split())
+
+def reload_indexes(names=None) -> None:
+    """Reload indexes from disk and drop every cached result computed against the old ones."""
+    with _reload_lock:
+        for name in names or INDEX_PATHS:
+            registry.reset(f"{name}_index")
+            registry.reset(f"{name}_bm25")
+            _index(name)
+        _results.clear()
+
+def current_version(name: str):
+    """Version of the `name` index being served now (after picking up a rebuilt one)."""
+    _reload_if_rebuilt()
+    return _version(name)
+
+def _reload_if_rebuilt() -> None:
+    global _last_check
+    now = time.monotonic()
+    if now - _last_check < _CHECK_EVERY:
+        return
+    _last_check = now
+    changed = [
+        name for name, path in INDEX_PATHS.items()
+        if name in _versions and index_version(path) != _versions[name]
+    ]
+    if changed:
+        reload_indexes(changed)
+
+def _count_embed_lookup(hit: bool) -> None:
+    inc("query_embed_cache_total", 1, "Query embedding cache lookups", result="hit" if hit else "miss")
+
+def embed_query(query: str) -> list[float]:
+    key = normalize_query(query)
+    vector = _query_vectors.get(key)
+    _count_embed_lookup(vector is not MISS)
+    if vector is MISS:
+        with span("embeddings.embed_query", microbatch=MICROBATCH):
+            if MICROBATCH:
+                vector = registry.get("query_embed_batcher").submit(key).result()
+            else:
+                vector = get_embeddings().embed_query(key)
+        _query_vectors.put(key, vector)
+    return vector
+
+def _timed_search(name: str, vector, k: int):
+    start = time.perf_counter()
+    with span("faiss.search", index=name, batch=1, k=k):
+        docs = query_index_by_vector(_index(name), vector, k=k)
+    return docs, _ms(start)
+
+def _dense_search(name: str, vector, k: int) -> Future:
+    """Future of (docs, search ms): batched with concurrent queries, or on the search pool."""
+    if MICROBATCH:
+        return registry.get(f"{name}_search_batcher").submit((vector, k))
+    return _submit(_timed_search, name, vector, k)
+
+def _timed_bm25(name: str, query: str, k: int):
+    start = time.perf_counter()
+    bm25 = _bm25(name)
+    if bm25 is None:
+        return None, _ms(start)
+    with span("bm25.search", index=name, k=k):
+        hits = [i for i, _ in bm25.search(query, k)]
+    return hits, _ms(start)
+
+def _fuse(name: str, dense: list, lexical: list, k: int) -> Tuple[list, list]:
+    """Top-k of the RRF fusion as (docs, fused scores)."""
+    by_id = {stored_id(d): d for d in dense}
+    ranked = reciprocal_rank_fusion([list(by_id), lexical], k=RRF_K)[:k]
+    # Lexical-only hits are not in the dense results; fetch them from the docstore
+    extra = {stored_id(d): d for d in get_documents(_index(name), [i for i, _ in ranked if i not in by_id])}
+    by_id.update(extra)
+    kept = [(by_id[i], score) for i, score in ranked if i in by_id]
+    return [d for d, _ in kept], [score for _, score in kept]
+
+def _diversify(name: str, vector, docs: list, scores: Optional[list], k: int) -> list:
+    if len(docs) <= k:
+        return docs
+    vectors = stored_vectors(_index(name), [stored_id(d) for d in docs])
+    # Fused scores keep the hybrid notion of relevance; otherwise MMR uses cosine to the query
+    relevance = np.asarray(scores, dtype=np.float32) / max(scores) if scores else None
+    picked = mmr_select(np.asarray(vector, dtype=np.float32), vectors, k, MMR_LAMBDA, relevance)
+    return [docs[i] for i in picked]
+
+def _pool_size(k: int, diversify: bool) -> int:
+    return k * max(HYBRID_FETCH if HYBRID else 1, MMR_FETCH if diversify else 1)
+
+def _plan(query: str, wanted: Dict[str, int], diversify: bool):
+    """Result-cache lookups; returns (cache keys, found docs, names still to search)."""
+    _reload_if_rebuilt()
+    nq = normalize_query(query)
+    keys = {name: (name, nq, k, diversify, _version(name)) for name, k in wanted.items() if k > 0}
+    found = {name: _results.get(keys[name]) if k > 0 else [] for name, k in wanted.items()}
+    missing = [name for name, docs in found.items() if docs is MISS]
+    for name in keys:
+        inc("retrieval_cache_total", 1, "Retrieval result cache lookups",
+            index=name, result="miss" if name in missing else "hit")
+    return keys, found, missing
+
+def _finish(name: str, vector, dense, lexical, k: int, fetch: int, diversify: bool, timings: dict) -> list:
+    """Fuse (RRF) and diversify (MMR) one index's candidates; records timings."""
+    docs, ms = dense
+    timings[f"{name}_search_ms"] = ms
+    hits, bm25_ms = lexical if lexical is not None else (None, 0.0)
+    scores = None
+    if hits is not None:
+        timings[f"{name}_bm25_ms"] = bm25_ms
+        docs, scores = _fuse(name, docs, hits, fetch)
+    if diversify:
+        t = time.perf_counter()
+        docs = _diversify(name, vector, docs, scores, k)
+        timings[f"{name}_mmr_ms"] = _ms(t)
+    return docs[:k]
+
+def retrieve_candidates(query: str, depths: Dict[str, int],
+                        diversify: Optional[bool] = None) -> Tuple[Dict[str, list], Dict[str, float]]:
+    """
+    Ranked docs for each index in `depths` ({"kb": 10, ...}), best first.
+    The query is embedded once (memoized) and the indexes are searched
+    concurrently; where an index has a BM25 sidecar, its lexical hits are
+    fused with the dense ones (RRF). With `diversify` (default: $MMR, on) the
+    pool is reranked by MMR over the stored vectors. Repeat (query, depth)
+    pairs against an unchanged index are served from the result cache.
+    """
+    start = time.perf_counter()
+    diversify = MMR if diversify is None else diversify
+    keys, found, missing = _plan(query, depths, diversify)
+    timings = {"embed_ms": 0.0, **{f"{name}_search_ms": 0.0 for name in depths}}
+
+    if missing:
+        fetch = {name: _pool_size(depths[name], diversify) for name in missing}
+        lexical = {name: _submit(_timed_bm25, name, query, fetch[name]) for name in missing} if HYBRID else {}
+
+        t = time.perf_counter()
+        vector = embed_query(query)
+        timings["embed_ms"] = _ms(t)
+
+        futures = {name: _dense_search(name, vector, fetch[name]) for name in missing}
+        for name, fut in futures.items():
+            hits = lexical[name].result() if name in lexical else None
+            docs = _finish(name, vector, fut.result(), hits, depths[name], fetch[name], diversify, timings)
+            _results.put(keys[name], docs)
+            found[name] = docs
+
+    timings["retrieve_total_ms"] = _ms(start)
+    return {name: list(docs) for name, docs in found.items()}, timings
+
+def retrieve_evidence(query: str, kb_k: int = 5, tickets_k: int = 3,
+                      diversify: Optional[bool] = None) -> Tuple[list, list, Dict[str, float]]:
+    """retrieve_candidates for both indexes. Returns (kb_docs, ticket_docs, timings_ms)."""
+    found, timings = retrieve_candidates(query, {"kb": kb_k, "tickets": tickets_k}, diversify)
+    return found["kb"], found["tickets"], timings
+
+async def aembed_query(query: str) -> list[float]:
+    key = normalize_query(query)
+    vector = _query_vectors.get(key)
+    _count_embed_lookup(vector is not MISS)
+    if vector is MISS:
+        with span("embeddings.embed_query", microbatch=MICROBATCH):
+            if MICROBATCH:
+                vector = await asyncio.wrap_future(registry.get("query_embed_batcher").submit(key))
+            else:
+                vector = await get_embeddings().aembed_query(key)
+        _query_vectors.put(key, vector)
+    return vector
+
+async def aretrieve_candidates(query: str, depths: Dict[str, int],
+                               diversify: Optional[bool] = None) -> Tuple[Dict[str, list], Dict[str, float]]:
+    """
+    Async retrieve_candidates: the embedding call is awaited on the event loop;
+    index loading, FAISS/BM25 searches and fusion run on worker threads.
+    """
+    start = time.perf_counter()
+    diversify = MMR if diversify is None else diversify
+    # May load or reload an index on first use; keep that off the event loop
+    keys, found, missing = await asyncio.to_thread(_plan, query, depths, diversify)
+    timings = {"embed_ms": 0.0, **{f"{name}_search_ms": 0.0 for name in depths}}
+
+    if missing:
+        fetch = {name: _pool_size(depths[name], diversify) for name in missing}
+        lexical = {
+            name: asyncio.wrap_future(_submit(_timed_bm25, name, query, fetch[name]))
+            for name in missing
+        } if HYBRID else {}
+
+        t = time.perf_counter()
+        vector = await aembed_query(query)
+        timings["embed_ms"] = _ms(t)
+
+        futures = {name: asyncio.wrap_future(_dense_search(name, vector, fetch[name])) for name in missing}
+        for name, fut in futures.items():
+            dense = await fut
+            hits = await lexical[name] if name in lexical else None
+            docs = await asyncio.to_thread(
+                _finish, name, vector, dense, hits, depths[name], fetch[name], diversify, timings)
+            _results.put(keys[name], docs)
+            found[name] = docs
+
+    timings["retrieve_total_ms"] = _ms(start)
+    return {name: list(docs) for name, docs in found.items()}, timings
+
+async def aretrieve_evidence(query: str, kb_k: int = 5, tickets_k: int = 3,
+                             diversify: Optional[bool] = None) -> Tuple[list, list, Dict[str, float]]:
+    found, timings = await aretrieve_candidates(query, {"kb": kb_k, "tickets": tickets_k}, diversify)
+    return found["kb"], found["tickets"], timings
+
+def retrieve_kb(query: str, k: int = 5, diversify: Optional[bool] = None):
+    return retrieve_evidence(query, kb_k=k, tickets_k=0, diversify=diversify)[0]
+
+def retrieve_tickets(query: str, k: int = 3, diversify: Optional[bool] = None):
+    return retrieve_evidence(query, kb_k=0, tickets_k=k, diversify=diversify)[1]
+
+def warm_up() -> dict:
+    """Load the embeddings client, both indexes and their BM25 sidecars now instead of on the first request."""
+    return registry.warm_up(["embeddings"] + [f"{name}_{kind}" for name in INDEX_PATHS for kind in ("index", "bm25")])
+
+def cache_stats() -> dict:
+    return {
+        "query_embeddings": _query_vectors.stats(),
+        "results": _results.stats(),
+        "index_versions": {name: v[0] for name, v in _versions.items()},
+        "loaded": [name for name in registry.names() if registry.is_loaded(name)],
+    }
+
+def batch_stats() -> dict:
+    """Batch-size, queueing-delay and run-time histograms of each loaded micro-batcher."""
+    names = ["query_embed_batcher"] + [f"{name}_search_batcher" for name in INDEX_PATHS]
+    return {name: registry.get(name).stats() for name in names if registry.is_loaded(name)}
 
 def ticket_docs_to_cases(ticket_docs) -> List[dict]:
     cases = []
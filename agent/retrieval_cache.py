@@ -0,0 +1,66 @@
+# agent/retrieval_cache.py
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+MISS = object()
+
+class TTLCache:
+    """
+    Small thread-safe LRU with optional time-to-live.
+    get() returns MISS (not None) on a miss so None can be cached.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                stored_at, value = item
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return MISS
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
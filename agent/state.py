@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Optional, Literal
+from typing import TypedDict, Dict, List, Optional, Literal
 from langchain_core.documents import Document
 from rag.schema import RagAnswer
 
@@ -15,3 +15,8 @@ class GraphState(TypedDict):
     decision: Optional[Decision]
     validator_feedback: Optional[str]
     retries: int
+    timings: Dict[str, float]      # per-stage wall time (ms), summed over retries
+    candidates: Dict[str, dict]    # per index: {"query", "docs" (ranked, over-fetched), "exhausted"}
+    validation_info: List[dict]    # one entry per validation: tier (hard/local/llm), support scores
+    pack_stats: List[dict]         # one entry per generation: evidence tokens in/out, dropped, trimmed
+    stream: bool                   # stream answer tokens/fields via graph.stream(stream_mode="custom")
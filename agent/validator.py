@@ -4,11 +4,15 @@ from __future__ import annotations
 from dotenv import load_dotenv
 load_dotenv()
 
+import json
 import os
+import re
+from functools import lru_cache
 from pydantic import BaseModel
-from typing import Literal, Optional
-from langchain_openai import ChatOpenAI
+from typing import Dict, Literal, Optional, Tuple
 from langchain_core.messages import SystemMessage, HumanMessage
+from rag.bm25 import content_tokens
+from rag.generator import ainvoke_structured, invoke_structured
 
 from agent.hard_checks import (
     hard_check_citations_whitelist,
@@ -35,14 +39,8 @@ def format_evidence(docs):
     return "\n".join(lines)
 
 
-def validate_with_llm(question: str, answer_json: str, kb_evidence_docs) -> ValidationResult:
-    """
-    Two-stage validation:
-      1) Deterministic hard checks (citation whitelist + domain mismatch + basic action grounding)
-      2) LLM-as-judge for nuanced faithfulness
-    """
-    import json
-
+def _hard_check(question: str, answer_json: str, kb_evidence_docs) -> Optional[ValidationResult]:
+    """Deterministic checks; a ValidationResult when they already decide, else None."""
     try:
         ans_obj = json.loads(answer_json)
         answer_text = ans_obj.get("answer", "")
@@ -75,9 +73,9 @@ def validate_with_llm(question: str, answer_json: str, kb_evidence_docs) -> Vali
             suggested_query=question,
             suggested_k=10,
         )
+    return None
 
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0).with_structured_output(ValidationResult)
-
+def _judge_messages(question: str, answer_json: str, kb_evidence_docs) -> list:
     system = SystemMessage(content=(
         "You are a strict QA validator for a RAG system.\n"
         "PASS only if EVERY actionable instruction is directly supported by KB evidence.\n"
@@ -92,5 +90,189 @@ def validate_with_llm(question: str, answer_json: str, kb_evidence_docs) -> Vali
         f"KB_EVIDENCE:\n{format_evidence(kb_evidence_docs)}\n\n"
         "Is the answer fully supported and on-topic?"
     ))
+    return [system, user]
+
+
+def validate_with_llm(question: str, answer_json: str, kb_evidence_docs) -> ValidationResult:
+    """
+    Two-stage validation:
+      1) Deterministic hard checks (citation whitelist + domain mismatch + basic action grounding)
+      2) LLM-as-judge for nuanced faithfulness
+    """
+    result = _hard_check(question, answer_json, kb_evidence_docs)
+    if result is not None:
+        return result
+    messages = _judge_messages(question, answer_json, kb_evidence_docs)
+    return invoke_structured(messages, ValidationResult, "gpt-4o-mini", temperature=0)
+
+
+async def avalidate_with_llm(question: str, answer_json: str, kb_evidence_docs) -> ValidationResult:
+    """Async validate_with_llm; the hard checks are CPU-only and run inline."""
+    result = _hard_check(question, answer_json, kb_evidence_docs)
+    if result is not None:
+        return result
+    messages = _judge_messages(question, answer_json, kb_evidence_docs)
+    return await ainvoke_structured(messages, ValidationResult, "gpt-4o-mini", temperature=0)
+
+
+# --- Tiered validation -------------------------------------------------------
+# A local lexical support score decides clear PASS / RETRY cases; only the
+# ambiguous middle goes to the LLM judge.
+
+def validator_config() -> dict:
+    return {
+        "tiered": os.getenv("VALIDATOR_TIERED", "1") != "0",
+        # PASS locally: mean support >= pass_support and at least pass_coverage of the
+        # claims individually supported (>= claim_support) by the cited chunks
+        "pass_support": float(os.getenv("VALIDATOR_PASS_SUPPORT", "0.75")),
+        "pass_coverage": float(os.getenv("VALIDATOR_PASS_COVERAGE", "1.0")),
+        "claim_support": float(os.getenv("VALIDATOR_CLAIM_SUPPORT", "0.5")),
+        # RETRY locally: the mean support of a cited answer falls below this
+        "retry_support": float(os.getenv("VALIDATOR_RETRY_SUPPORT", "0.2")),
+        # Claims with fewer content tokens ("Sorry to hear that.") are not scored
+        "min_claim_tokens": int(os.getenv("VALIDATOR_MIN_CLAIM_TOKENS", "3")),
+        # Also ask the judge about locally decided answers, to measure agreement
+        "shadow": os.getenv("VALIDATOR_SHADOW", "0") == "1",
+    }
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+@lru_cache(maxsize=4096)
+def _chunk_ngrams(text: str) -> Tuple[frozenset, frozenset]:
+    toks = content_tokens(text)
+    return frozenset(toks), frozenset(zip(toks, toks[1:]))
+
+# Numbers and quantities ("7", "5-10", "1,000", "2.5%", "two") must be copied from
+# the evidence: one wrong threshold barely moves n-gram recall, but it is exactly
+# the invented policy the judge prompt rejects.
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_NUMBER_WORDS = {
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+    "seven": "7", "eight": "8", "nine": "9", "ten": "10", "eleven": "11", "twelve": "12",
+    "fifteen": "15", "twenty": "20", "thirty": "30", "forty": "40", "fifty": "50",
+    "sixty": "60", "ninety": "90", "hundred": "100", "thousand": "1000",
+    "once": "1", "twice": "2", "single": "1", "double": "2", "half": "0.5", "dozen": "12",
+}
+_WORD = re.compile(r"[a-z]+")
+
+def numbers(text: str) -> frozenset:
+    """Numeric / quantity tokens of `text`, normalized ("1,000" -> "1000", "two" -> "2")."""
+    text = text.lower()
+    out = {m.replace(",", "") for m in _NUMBER.findall(text)}
+    out |= {_NUMBER_WORDS[w] for w in _WORD.findall(text) if w in _NUMBER_WORDS}
+    return frozenset(out)
+
+@lru_cache(maxsize=4096)
+def _chunk_numbers(text: str) -> frozenset:
+    return numbers(text)
+
+def _claim_support(claim: list, unigrams: frozenset, bigrams: frozenset) -> float:
+    uni = sum(t in unigrams for t in claim) / len(claim)
+    pairs = list(zip(claim, claim[1:]))
+    if not pairs:
+        return uni
+    return 0.5 * uni + 0.5 * sum(p in bigrams for p in pairs) / len(pairs)
+
+def support_score(ans_obj: dict, kb_evidence_docs, min_claim_tokens: int = 3,
+                  claim_support: float = 0.5) -> Dict:
+    """
+    Lexical support of each answer sentence and next step by the chunks the
+    answer cites: the mean of unigram and bigram recall over content tokens.
+    coverage = share of claims supported at >= claim_support.
+    unsupported_numbers = numbers in the answer that no cited chunk contains.
+    """
+    cited = {(c.get("source"), c.get("chunk_id")) for c in ans_obj.get("citations") or []}
+    unigrams, bigrams, evidence_numbers = set(), set(), set()
+    for d in kb_evidence_docs:
+        if (d.metadata.get("source", "unknown"), int(d.metadata.get("chunk_id", -1))) in cited:
+            u, b = _chunk_ngrams(d.page_content)
+            unigrams |= u
+            bigrams |= b
+            evidence_numbers |= _chunk_numbers(d.page_content)
+
+    texts = _SENTENCE_END.split(ans_obj.get("answer") or "") + list(ans_obj.get("next_steps") or [])
+    claims = [toks for toks in map(content_tokens, texts) if len(toks) >= min_claim_tokens]
+    scores = [_claim_support(c, unigrams, bigrams) for c in claims]
+    weights = [len(c) for c in claims]
+    # Every sentence and step, scored or not: "Wait 2 days." is short but still a threshold
+    unsupported = sorted(set().union(*map(numbers, texts)) - evidence_numbers) if texts else []
+    return {
+        "citations": len(cited),
+        "claims": len(claims),
+        "unsupported_numbers": unsupported,
+        "support": sum(s * w for s, w in zip(scores, weights)) / sum(weights) if claims else 0.0,
+        "min_support": min(scores) if scores else 0.0,
+        "coverage": sum(s >= claim_support for s in scores) / len(scores) if scores else 0.0,
+    }
+
+def _local_decision(question: str, ans_obj: dict, score: dict, cfg: dict) -> Optional[ValidationResult]:
+    if score["claims"] == 0:
+        return None
+    # A number the cited chunks don't contain never PASSes locally; the judge decides
+    if (score["citations"] and score["coverage"] >= cfg["pass_coverage"]
+            and score["support"] >= cfg["pass_support"] and not score["unsupported_numbers"]):
+        return ValidationResult(
+            decision="PASS",
+            feedback=f"Every claim is lexically supported by the cited KB chunks (support {score['support']:.2f}).",
+        )
+    # An uncited, low-confidence answer may be an honest "not in the KB"; leave that to the judge
+    if score["support"] < cfg["retry_support"] and (score["citations"] or ans_obj.get("confidence") != "low"):
+        return ValidationResult(
+            decision="RETRY_WITH_MORE_CONTEXT",
+            feedback=f"Answer is not supported by its cited KB chunks (support {score['support']:.2f}).",
+            suggested_query=question,
+            suggested_k=10,
+        )
+    return None
+
+def _tier(question: str, answer_json: str, kb_evidence_docs, cfg: dict):
+    """(result or None when the judge must decide, info)."""
+    result = _hard_check(question, answer_json, kb_evidence_docs)
+    if result is not None:
+        return result, {"tier": "hard", "decision": result.decision}
+    ans_obj = json.loads(answer_json)
+    score = support_score(ans_obj, kb_evidence_docs, cfg["min_claim_tokens"], cfg["claim_support"])
+    local = _local_decision(question, ans_obj, score, cfg)
+    info = {"tier": "local" if local is not None else "llm", **score}
+    if local is not None:
+        info["decision"] = local.decision
+    return local, info
+
+def _record_judge(result: ValidationResult, local: Optional[ValidationResult], info: dict) -> ValidationResult:
+    if local is None:
+        info["decision"] = result.decision
+        return result
+    info["judge_decision"] = result.decision
+    info["agrees"] = result.decision == local.decision
+    return local
+
+def validate_tiered(question: str, answer_json: str, kb_evidence_docs) -> Tuple[ValidationResult, dict]:
+    """
+    Hard checks, then the local support scorer; the LLM judge only sees what
+    neither decides (VALIDATOR_* thresholds). Returns (result, info) where
+    info["tier"] is "hard", "local" or "llm". With VALIDATOR_SHADOW=1 the
+    judge also scores local decisions and info["agrees"] records the match.
+    """
+    cfg = validator_config()
+    if not cfg["tiered"]:
+        result = validate_with_llm(question, answer_json, kb_evidence_docs)
+        return result, {"tier": "llm", "decision": result.decision}
+    local, info = _tier(question, answer_json, kb_evidence_docs, cfg)
+    if info["tier"] == "hard" or (local is not None and not cfg["shadow"]):
+        return local, info
+    messages = _judge_messages(question, answer_json, kb_evidence_docs)
+    judged = invoke_structured(messages, ValidationResult, "gpt-4o-mini", temperature=0)
+    return _record_judge(judged, local, info), info
 
-    return llm.invoke([system, user])
+async def avalidate_tiered(question: str, answer_json: str, kb_evidence_docs) -> Tuple[ValidationResult, dict]:
+    """Async validate_tiered."""
+    cfg = validator_config()
+    if not cfg["tiered"]:
+        result = await avalidate_with_llm(question, answer_json, kb_evidence_docs)
+        return result, {"tier": "llm", "decision": result.decision}
+    local, info = _tier(question, answer_json, kb_evidence_docs, cfg)
+    if info["tier"] == "hard" or (local is not None and not cfg["shadow"]):
+        return local, info
+    messages = _judge_messages(question, answer_json, kb_evidence_docs)
+    judged = await ainvoke_structured(messages, ValidationResult, "gpt-4o-mini", temperature=0)
+    return _record_judge(judged, local, info), info
@@ -0,0 +1,217 @@
+# eval/retrieval_bench.py
+"""
+Retrieval quality vs. latency vs. memory on labeled MS MARCO passages.
+
+  python -m scripts.download_kb_msmarco_subset          # saves query / query_id / is_selected
+  python -m eval.retrieval_bench --queries 500 --k 10
+  python -m eval.retrieval_bench --configs flat hnsw ivfpq flat+hybrid+mmr --out retrieval.json
+
+Every passage in the parquet is indexed once per index type (embeddings are
+computed once, through the on-disk embedding cache, and shared by all
+configurations). Each query with at least one is_selected passage is then
+run through agent.retrieval.retrieve_candidates under each configuration:
+
+  flat / ivf / hnsw / ivfpq    dense only (ivfpq is the quantized one)
+  +hybrid                      fused with the BM25 sidecar (RRF)
+  +mmr                         MMR-diversified
+
+and scored with recall@{1,5,k}, MRR@k and nDCG@k (binary relevance; a
+passage counts by its text, so duplicated passages aren't double-counted).
+Latency is retrieve_candidates wall time with the query vector already
+embedded; memory is the serialized FAISS index plus the BM25 sidecar when
+hybrid. The table marks the Pareto-optimal configurations: no other one is
+at least as good on nDCG, p50 latency and memory, and better on one of them.
+
+--fake-embeddings runs without API calls (hash vectors: dense scores are
+meaningless, but BM25 and the plumbing are exercised).
+"""
+from __future__ import annotations
+import argparse
+import json
+import math
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from langchain_core.embeddings import Embeddings
+
+DATA = "data/raw/kb_msmarco_passages.parquet"
+
+CONFIGS = {
+    "flat":            {"index": "flat",  "hybrid": False, "mmr": False},
+    "ivf":             {"index": "ivf",   "hybrid": False, "mmr": False},
+    "hnsw":            {"index": "hnsw",  "hybrid": False, "mmr": False},
+    "ivfpq":           {"index": "ivfpq", "hybrid": False, "mmr": False},
+    "flat+hybrid":     {"index": "flat",  "hybrid": True,  "mmr": False},
+    "flat+mmr":        {"index": "flat",  "hybrid": False, "mmr": True},
+    "flat+hybrid+mmr": {"index": "flat",  "hybrid": True,  "mmr": True},   # serving default
+    "hnsw+hybrid":     {"index": "hnsw",  "hybrid": True,  "mmr": False},
+    "ivfpq+hybrid":    {"index": "ivfpq", "hybrid": True,  "mmr": False},
+}
+
+class MemoEmbeddings(Embeddings):
+    """Embeds each distinct text once per process, so every index type reuses the same vectors."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+        self.vectors: Dict[str, List[float]] = {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = list(dict.fromkeys(t for t in texts if t not in self.vectors))
+        if missing:
+            self.vectors.update(zip(missing, self.inner.embed_documents(missing)))
+        return [self.vectors[t] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def load_labeled(path: str, limit: int | None = None) -> tuple[pd.DataFrame, Dict[str, set]]:
+    """(passage rows, {query: set of relevant passage texts}) for queries with >= 1 is_selected passage."""
+    df = pd.read_parquet(path)
+    if "query" not in df.columns:
+        raise SystemExit(f"{path} has no query column; re-run python -m scripts.download_kb_msmarco_subset")
+    df = df.dropna(subset=["text"]).reset_index(drop=True)
+    if limit:
+        df = df.head(limit)
+    relevant: Dict[str, set] = {}
+    for q, text in df.loc[df["is_selected"] == 1, ["query", "text"]].itertuples(index=False):
+        relevant.setdefault(q, set()).add(text)
+    return df, relevant
+
+def score(ranked_texts: List[str], relevant: set, k: int) -> Dict[str, float]:
+    seen, hits_at, first = set(), [], None
+    dcg = 0.0
+    for rank, text in enumerate(ranked_texts[:k], start=1):
+        if text in relevant and text not in seen:
+            seen.add(text)
+            dcg += 1.0 / math.log2(rank + 1)
+            first = first or rank
+        hits_at.append(len(seen))
+    ideal = sum(1.0 / math.log2(r + 1) for r in range(1, min(len(relevant), k) + 1))
+
+    def recall(at: int) -> float:
+        return (hits_at[min(at, len(hits_at)) - 1] if hits_at else 0) / len(relevant)
+
+    return {
+        "recall@1": recall(1),
+        "recall@5": recall(5),
+        f"recall@{k}": recall(k),
+        f"mrr@{k}": 1.0 / first if first else 0.0,
+        f"ndcg@{k}": dcg / ideal if ideal else 0.0,
+    }
+
+def index_bytes(path: Path, hybrid: bool) -> Dict[str, int]:
+    import faiss
+    from rag.bm25 import SIDECAR_FILES
+    raw = faiss.read_index(str(path / "index.faiss"))
+    out = {"faiss": int(faiss.serialize_index(raw).nbytes)}
+    if hybrid:
+        out["bm25"] = sum((path / f).stat().st_size for f in SIDECAR_FILES if (path / f).exists())
+    return out
+
+def pareto(rows: List[dict], k: int) -> None:
+    """Mark rows no other row beats on (nDCG@k up, p50 down, MB down)."""
+    key = lambda r: (r[f"ndcg@{k}"], -r["p50_ms"], -r["index_mb"])
+    for r in rows:
+        a = key(r)
+        r["pareto"] = not any(
+            all(x >= y for x, y in zip(key(o), a)) and key(o) != a for o in rows if o is not r
+        )
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", default=DATA)
+    ap.add_argument("--limit", type=int, default=None, help="index only the first N passages")
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    ap.add_argument("--fake-embeddings", action="store_true", help="hash vectors, no API calls")
+    ap.add_argument("--out", help="write per-config metrics as JSON")
+    args = ap.parse_args()
+
+    from agent import retrieval
+    from ingestion.kb_passages import kb_to_documents
+    from rag.ann import index_config
+    from rag.resources import registry
+    from rag.vectorstore import build_faiss_index, save_bm25_index, save_faiss_index
+
+    df, relevant = load_labeled(args.data, args.limit)
+    queries = sorted(relevant)[:args.queries]
+    docs = kb_to_documents(df)
+    print(f"passages={len(docs)} labeled queries={len(relevant)} evaluated={len(queries)} k={args.k}")
+
+    if args.fake_embeddings:
+        from scripts.fake_backends import FakeEmbeddings
+        inner = FakeEmbeddings()
+    else:
+        from rag.embeddings import get_embeddings_model
+        inner = get_embeddings_model(cache=True, scheduled=True)
+    embeddings = MemoEmbeddings(inner)
+    registry.override("embeddings", embeddings)
+    # One caller at a time: a micro-batching window would only add latency here
+    retrieval.MICROBATCH = False
+
+    t = time.perf_counter()
+    embeddings.embed_documents([d.page_content for d in docs] + queries)
+    print(f"embedded {len(embeddings.vectors)} texts in {time.perf_counter() - t:.1f}s")
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="retrieval_bench_") as tmp:
+        built: Dict[str, Path] = {}
+        for name in args.configs:
+            cfg = CONFIGS[name]
+            kind = cfg["index"]
+            if kind not in built:
+                t = time.perf_counter()
+                index = build_faiss_index(docs, embeddings, index_config(kind))
+                built[kind] = Path(tmp) / kind
+                save_faiss_index(index, str(built[kind]))
+                save_bm25_index(index, str(built[kind]))
+                print(f"built {kind} in {time.perf_counter() - t:.1f}s")
+
+            # The BM25 sidecar is loaded (or not) according to HYBRID, so reload after flipping it
+            retrieval.HYBRID = cfg["hybrid"]
+            retrieval.INDEX_PATHS["kb"] = str(built[kind])
+            retrieval.reload_indexes(["kb"])
+            retrieval.retrieve_candidates("warm up", {"kb": args.k}, diversify=cfg["mmr"])
+
+            metrics, lat = [], []
+            for q in queries:
+                start = time.perf_counter()
+                found, _ = retrieval.retrieve_candidates(q, {"kb": args.k}, diversify=cfg["mmr"])
+                lat.append((time.perf_counter() - start) * 1000.0)
+                metrics.append(score([d.page_content for d in found["kb"]], relevant[q], args.k))
+
+            size = index_bytes(built[kind], cfg["hybrid"])
+            row = {"config": name, **{m: float(np.mean([x[m] for x in metrics])) for m in metrics[0]}}
+            row.update({
+                "p50_ms": float(np.percentile(lat, 50)),
+                "p95_ms": float(np.percentile(lat, 95)),
+                "index_mb": sum(size.values()) / 2**20,
+                "bytes": size,
+            })
+            rows.append(row)
+
+    pareto(rows, args.k)
+    k = args.k
+    cols = ["recall@1", "recall@5", f"recall@{k}", f"mrr@{k}", f"ndcg@{k}"]
+    print(f"\n{'config':<17} " + " ".join(f"{c:>9}" for c in cols) + f" {'p50 ms':>8} {'p95 ms':>8} {'MB':>8}  pareto")
+    for r in sorted(rows, key=lambda r: r["p50_ms"]):
+        print(f"{r['config']:<17} " + " ".join(f"{r[c]:>9.3f}" for c in cols)
+              + f" {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['index_mb']:>8.1f}  {'*' if r['pareto'] else ''}")
+    if args.fake_embeddings:
+        print("\n(fake embeddings: dense-only quality numbers are not meaningful)")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({
+            "data": args.data, "passages": len(docs), "queries": len(queries), "k": k,
+            "fake_embeddings": args.fake_embeddings, "results": rows,
+        }, indent=2), encoding="utf-8")
+        print("Wrote", args.out)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,39 @@
 # eval/run_eval.py
+"""
+Runs the agent over a question set and reports quality, latency and token use.
+
+  python -m eval.run_eval
+  python -m eval.run_eval --questions questions.jsonl --workers 16 --out eval.json
+
+Questions run concurrently on --workers threads (EVAL_WORKERS, default 4).
+Each result row has the per-node wall time (retrieve / generate / validate,
+summed over retries), the retry count and the prompt/completion tokens and
+cost of every LLM call it made. Summaries give p50/p95/p99 of each, so base and
+TUNED_MODEL runs can be compared on speed as well as quality.
+
+The numbers are what serving would cost: the LLM response cache is off
+(--llm-cache replays cached calls and reports hits per stage) and the judge
+only sees the answers the tiered validator escalates (--shadow also has it
+score local decisions, to report agreement, at the price of extra judge
+calls inside validate_ms, tokens and cost).
+"""
 from __future__ import annotations
+import argparse
+import csv
 import os
 import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from collections import Counter
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+import numpy as np
 
 from agent.graph import build_graph
+from rag.llm_cache import get_llm_cache
+from rag.telemetry import span, write_prometheus
 
 load_dotenv()
 
@@ -21,37 +48,157 @@ QUESTIONS = [
     "I was charged twice. What should I do?",
 ]
 
-def run_once(model_name: str) -> List[Dict[str, Any]]:
+NODES = ("retrieve", "generate", "validate")
+
+# Response-cache schemas by the graph stage that makes the call
+CACHE_STAGES = {"RagAnswer": "generate", "ValidationResult": "validate"}
+
+def load_questions(path: str) -> List[str]:
+    """
+    Questions from a file: .txt (one per line, # comments), .jsonl / .json
+    (strings or objects with a "question" field) or .csv (a "question" column).
+    """
+    def text(item) -> str:
+        return (item.get("question") or item.get("query") or "") if isinstance(item, dict) else str(item)
+
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        elif path.endswith(".json"):
+            items = json.load(f)
+        elif path.endswith(".csv"):
+            items = list(csv.DictReader(f))
+        else:
+            items = [line for line in f if not line.lstrip().startswith("#")]
+    return [q for q in (text(i).strip() for i in items) if q]
+
+def run_question(graph, q: str) -> Dict[str, Any]:
+    from langchain_community.callbacks import get_openai_callback
+    state = {
+        "question": q,
+        "query": q,
+        "kb_k": 5,
+        "tickets_k": 3,
+        "kb_evidence": [],
+        "ticket_evidence": [],
+        "answer": None,
+        "decision": None,
+        "validator_feedback": None,
+        "retries": 0,
+        "timings": {},
+    }
+    start = time.perf_counter()
+    # The callback is context-local, so concurrent questions don't mix their token counts
+    with get_openai_callback() as cb, span("request", source="eval"):
+        try:
+            out, error = graph.invoke(state), None
+        except Exception as e:
+            out, error = {}, f"{type(e).__name__}: {e}"
+    total_ms = (time.perf_counter() - start) * 1000.0
+
+    ans = out["answer"].model_dump() if out.get("answer") else None
+    timings = out.get("timings") or {}
+    return {
+        "question": q,
+        "decision": out.get("decision"),
+        "feedback": out.get("validator_feedback"),
+        "confidence": ans.get("confidence") if ans else None,
+        "num_citations": len(ans.get("citations", [])) if ans else 0,
+        "num_similar_cases": len(ans.get("similar_cases", [])) if ans else 0,
+        "retries": out.get("retries", 0),
+        "total_ms": total_ms,
+        "node_ms": {n: timings.get(f"{n}_ms", 0.0) for n in NODES},
+        "timings": timings,
+        "usage": {
+            "llm_calls": cb.successful_requests,
+            "prompt_tokens": cb.prompt_tokens,
+            "completion_tokens": cb.completion_tokens,
+            "total_tokens": cb.total_tokens,
+            "cost_usd": cb.total_cost,
+        },
+        "validations": out.get("validation_info") or [],
+        "packing": out.get("pack_stats") or [],
+        "error": error,
+    }
+
+def run_once(model_name: str, questions: Optional[List[str]] = None, workers: int = 1) -> List[Dict[str, Any]]:
     os.environ["GEN_MODEL"] = model_name
     graph = build_graph()
+    questions = questions or QUESTIONS
 
-    results = []
-    for q in QUESTIONS:
-        state = {
-            "question": q,
-            "query": q,
-            "kb_k": 5,
-            "tickets_k": 3,
-            "kb_evidence": [],
-            "ticket_evidence": [],
-            "answer": None,
-            "decision": None,
-            "validator_feedback": None,
-            "retries": 0,
-        }
-        out = graph.invoke(state)
-
-        ans = out["answer"].model_dump() if out.get("answer") else None
-        results.append({
-            "question": q,
-            "decision": out.get("decision"),
-            "feedback": out.get("validator_feedback"),
-            "confidence": ans.get("confidence") if ans else None,
-            "num_citations": len(ans.get("citations", [])) if ans else 0,
-            "num_similar_cases": len(ans.get("similar_cases", [])) if ans else 0,
-        })
+    step = max(1, len(questions) // 10)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run_question, graph, q): i for i, q in enumerate(questions)}
+        # Progress is counted here, on the main thread, as questions finish
+        for done, fut in enumerate(as_completed(futures), start=1):
+            results[futures[fut]] = fut.result()
+            if len(questions) >= 50 and done % step == 0:
+                print(f"  {model_name}: {done}/{len(questions)}", file=sys.stderr)
+    # Rows stay in question order
     return results
 
+def percentiles(values) -> Dict[str, float]:
+    v = np.asarray(list(values), dtype=np.float64)
+    if v.size == 0:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(v, [50, 95, 99])
+    return {"mean": float(v.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(v.max())}
+
+def latency_summary(results: List[Dict[str, Any]], wall_s: Optional[float] = None) -> Dict[str, Any]:
+    ok = [r for r in results if not r.get("error")]
+    out = {
+        "total_ms": percentiles(r["total_ms"] for r in ok),
+        **{f"{n}_ms": percentiles(r["node_ms"][n] for r in ok) for n in NODES},
+        "retries": percentiles(r["retries"] for r in ok),
+    }
+    if wall_s:
+        out["wall_s"] = wall_s
+        out["questions_per_s"] = len(results) / wall_s
+    return out
+
+def usage_summary(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    usage = [r["usage"] for r in results if "usage" in r]
+    return {
+        "llm_calls": sum(u["llm_calls"] for u in usage),
+        "prompt_tokens": sum(u["prompt_tokens"] for u in usage),
+        "completion_tokens": sum(u["completion_tokens"] for u in usage),
+        "cost_usd": sum(u["cost_usd"] for u in usage),
+        "per_question": {
+            "prompt_tokens": percentiles(u["prompt_tokens"] for u in usage),
+            "completion_tokens": percentiles(u["completion_tokens"] for u in usage),
+            "cost_usd": percentiles(u["cost_usd"] for u in usage),
+        },
+    }
+
+def validation_summary(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """How often the tiered validator needed the LLM judge, and how often the judge agreed with local calls."""
+    vals = [v for r in results for v in r.get("validations", [])]
+    tiers = Counter(v["tier"] for v in vals)
+    scored = tiers["local"] + tiers["llm"]          # got past the hard checks
+    shadowed = [v for v in vals if "agrees" in v]
+    return {
+        "validations": len(vals),
+        "tiers": dict(tiers),
+        "escalation_rate": tiers["llm"] / scored if scored else 0.0,
+        "judge_agreement": sum(v["agrees"] for v in shadowed) / len(shadowed) if shadowed else None,
+        "shadow_checked": len(shadowed),
+    }
+
+def packing_summary(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Estimated evidence tokens the packer kept out of the generation prompts."""
+    packs = [p for r in results for p in r.get("packing", [])]
+    tokens_in = sum(p["kb_tokens_in"] + p["cases_tokens_in"] for p in packs)
+    saved = sum(p["tokens_saved"] for p in packs)
+    return {
+        "generations": len(packs),
+        "avg_tokens_saved": saved / len(packs) if packs else 0.0,
+        "saved_fraction": saved / tokens_in if tokens_in else 0.0,
+        "kb_duplicates": sum(p.get("kb_duplicates", 0) for p in packs),
+        "kb_trimmed": sum(p.get("kb_trimmed", 0) for p in packs),
+    }
+
 def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
     decisions = Counter(r["decision"] for r in results)
     confs = Counter(r["confidence"] for r in results)
@@ -61,24 +208,121 @@ def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
         "avg_citations": sum(r["num_citations"] for r in results) / max(1, len(results)),
         "avg_similar_cases": sum(r["num_similar_cases"] for r in results) / max(1, len(results)),
         "retry_rate": decisions.get("RETRY_WITH_MORE_CONTEXT", 0) / max(1, sum(decisions.values())),
+        "errors": sum(1 for r in results if r.get("error")),
+        "validator": validation_summary(results),
+        "packing": packing_summary(results),
+        "latency": latency_summary(results),
+        "usage": usage_summary(results),
     }
 
+def compare(base: Dict[str, Any], tuned: Dict[str, Any]) -> Dict[str, Any]:
+    """tuned minus base for the headline numbers."""
+    def get(summary, path):
+        for key in path:
+            summary = summary[key]
+        return summary
+
+    paths = {
+        "retry_rate": ("retry_rate",),
+        "avg_citations": ("avg_citations",),
+        "total_ms_p50": ("latency", "total_ms", "p50"),
+        "total_ms_p95": ("latency", "total_ms", "p95"),
+        "total_ms_p99": ("latency", "total_ms", "p99"),
+        "generate_ms_p50": ("latency", "generate_ms", "p50"),
+        "prompt_tokens": ("usage", "prompt_tokens"),
+        "completion_tokens": ("usage", "completion_tokens"),
+        "cost_usd": ("usage", "cost_usd"),
+    }
+    return {name: get(tuned, p) - get(base, p) for name, p in paths.items()}
+
+def _cache_counts() -> Dict[str, Dict[str, int]]:
+    cache = get_llm_cache()
+    return cache.stats()["by_schema"] if cache is not None else {}
+
+def cache_summary(before: Dict[str, Dict[str, int]], after: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    """Response-cache hits/misses per stage during one run (hits cost no tokens and ~no latency)."""
+    out = {}
+    for name, counts in after.items():
+        prev = before.get(name, {})
+        hits = counts["hits"] - prev.get("hits", 0)
+        misses = counts["misses"] - prev.get("misses", 0)
+        if hits or misses:
+            out[CACHE_STAGES.get(name, name)] = {
+                "hits": hits, "misses": misses, "hit_rate": hits / (hits + misses),
+            }
+    return out
+
+def evaluate(label: str, model: str, questions: List[str], workers: int) -> Dict[str, Any]:
+    print(f"{label.upper()}_MODEL =", model)
+    start = time.perf_counter()
+    cache_before = _cache_counts()
+    results = run_once(model, questions, workers)
+    summary = summarize(results)
+    summary["latency"] = latency_summary(results, time.perf_counter() - start)
+    if get_llm_cache() is not None:
+        summary["llm_cache"] = cache_summary(cache_before, _cache_counts())
+    print(f"\n{label.upper()} SUMMARY:\n", json.dumps(summary, indent=2))
+    print(f"\n{label.upper()} SAMPLE:\n", json.dumps(results[:2], indent=2))
+    return {"label": label, "model": model, "summary": summary, "results": results}
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", help="question file (.txt/.jsonl/.json/.csv); default: the built-in QUESTIONS")
+    ap.add_argument("--limit", type=int, default=0, help="only the first N questions")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("EVAL_WORKERS", "4")))
+    ap.add_argument("--out", help="write the full report (summaries + per-question rows) as JSON")
+    ap.add_argument("--shadow", action="store_true",
+                    help="judge locally decided answers too (agreement report; inflates validate_ms and cost)")
+    ap.add_argument("--llm-cache", action="store_true",
+                    help="replay cached LLM responses (per-stage hits are reported; latency/cost drop accordingly)")
+    args = ap.parse_args()
+
+    # Both are read when first used, so setting them here covers the whole run
+    os.environ["VALIDATOR_SHADOW"] = "1" if args.shadow else "0"
+    if not args.llm_cache:
+        os.environ["LLM_CACHE"] = "0"
     base = os.getenv("BASE_MODEL", "gpt-4o-mini")
     tuned = os.getenv("TUNED_MODEL", "")
 
-    print("BASE_MODEL =", base)
-    base_res = run_once(base)
-    print("\nBASE SUMMARY:\n", json.dumps(summarize(base_res), indent=2))
-    print("\nBASE SAMPLE:\n", json.dumps(base_res[:2], indent=2))
+    questions = load_questions(args.questions) if args.questions else list(QUESTIONS)
+    if args.limit:
+        questions = questions[:args.limit]
 
+    runs = [evaluate("base", base, questions, args.workers)]
     if tuned:
-        print("\nTUNED_MODEL =", tuned)
-        tuned_res = run_once(tuned)
-        print("\nTUNED SUMMARY:\n", json.dumps(summarize(tuned_res), indent=2))
-        print("\nTUNED SAMPLE:\n", json.dumps(tuned_res[:2], indent=2))
+        print()
+        runs.append(evaluate("tuned", tuned, questions, args.workers))
+        print("\nTUNED - BASE:\n", json.dumps(compare(runs[0]["summary"], runs[1]["summary"]), indent=2))
     else:
         print("\nSet TUNED_MODEL env var when the fine-tuned model is ready.")
 
+    cache = get_llm_cache()
+    if cache is not None:
+        # Reruns over unchanged evidence replay from here instead of calling the API
+        print("\nLLM response cache:", cache.stats())
+    if args.shadow:
+        print("Shadow judging was on: validate_ms, tokens and cost include judge calls serving would skip.")
+
+    prom_file = os.getenv("TELEMETRY_PROM_FILE", "")
+    if prom_file:
+        # Span durations and counters for the whole run (both models), Prometheus text format
+        write_prometheus(prom_file)
+        print("Wrote", prom_file)
+
+    if args.out:
+        report = {
+            "questions": args.questions or "builtin",
+            "num_questions": len(questions),
+            "workers": args.workers,
+            "shadow": args.shadow,
+            "llm_cache": args.llm_cache,
+            "runs": runs,
+        }
+        if len(runs) == 2:
+            report["tuned_minus_base"] = compare(runs[0]["summary"], runs[1]["summary"])
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print("\nWrote", args.out)
+
 if __name__ == "__main__":
     main()
@@ -5,7 +5,7 @@ import random
 import pandas as pd
 
 from rag.embeddings import get_embeddings_model
-from rag.vectorstore import load_faiss_index
+from rag.vectorstore import load_faiss_index, query_index
 
 DATA_OUT = Path("finetune/data")
 DATA_OUT.mkdir(parents=True, exist_ok=True)
@@ -24,7 +24,7 @@ def main(n: int = 200, seed: int = 7):
     df = pd.read_parquet("data/raw/twitter_support_subset.parquet").dropna()
     df = df.sample(n=min(n, len(df)), random_state=seed).reset_index(drop=True)
 
-    embeddings = get_embeddings_model()
+    embeddings = get_embeddings_model(cache=True)
     kb = load_faiss_index("data/index/kb_faiss", embeddings)
 
     rows = []
@@ -32,7 +32,7 @@ def main(n: int = 200, seed: int = 7):
         question = str(r["input"]).strip()
         support_reply = str(r["output"]).strip()
 
-        kb_docs = kb.similarity_search(question, k=5)
+        kb_docs = query_index(kb, question, k=5)
         kb_text = format_kb_for_training(kb_docs)
 
         # Heuristic confidence: if KB has "refund" and question has "refund", medium; else low.
@@ -96,6 +96,7 @@ def main(n: int = 200, seed: int = 7):
             f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
     print(f"Wrote {len(rows)} examples to {out_path}")
+    print("Embedding cache:", embeddings.stats())
 
 if __name__ == "__main__":
     main()
@@ -1,26 +1,64 @@
+from typing import Iterator
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from langchain_core.documents import Document
 
+from rag.keywords import compute_features
+
 def load_kb_passages(path: str) -> pd.DataFrame:
     df = pd.read_parquet(path)
     df = df.dropna(subset=["text"]).reset_index(drop=True)
     df["text"] = df["text"].astype(str)
     return df
 
+def _make_docs(texts: list[str], sources: list[str], ids) -> list[Document]:
+    return [
+        Document(
+            page_content=t,
+            # Keyword features are precomputed here so hard checks never rescan evidence text
+            metadata={"source": s, "chunk_id": int(i), "type": "kb_passage", **compute_features(t)},
+        )
+        for i, t, s in zip(ids, texts, sources)
+    ]
+
 def kb_to_documents(df: pd.DataFrame, limit: int | None = None) -> list[Document]:
     if limit is not None:
         df = df.head(limit)
 
-    docs = []
-    for i, row in df.iterrows():
-        docs.append(
-            Document(
-                page_content=row["text"],
-                metadata={
-                    "source": row.get("source", "kb"),
-                    "chunk_id": int(i),
-                    "type": "kb_passage",
-                },
-            )
-        )
-    return docs
+    texts = df["text"].tolist()
+    sources = df["source"].fillna("kb").tolist() if "source" in df.columns else ["kb"] * len(df)
+    # chunk_id is the positional row id after load_kb_passages' reset_index
+    return _make_docs(texts, sources, df.index)
+
+def iter_kb_document_batches(path: str, batch_size: int = 2048, limit: int | None = None) -> Iterator[list[Document]]:
+    """
+    Stream KB passages as bounded lists of Documents without loading the whole
+    parquet file. Only `text` (and `source` if present) are read.
+    chunk_ids match load_kb_passages + kb_to_documents (null texts skipped).
+    """
+    pf = pq.ParquetFile(path)
+    has_source = "source" in pf.schema_arrow.names
+    columns = ["text", "source"] if has_source else ["text"]
+
+    next_id = 0
+    for batch in pf.iter_batches(batch_size=batch_size, columns=columns):
+        keep = pc.is_valid(batch.column("text"))
+        batch = batch.filter(keep)
+        if limit is not None:
+            batch = batch.slice(0, max(0, limit - next_id))
+        if batch.num_rows == 0:
+            if limit is not None and next_id >= limit:
+                return
+            continue
+
+        texts = pc.cast(batch.column("text"), pa.string()).to_pylist()
+        if has_source:
+            sources = pc.fill_null(pc.cast(batch.column("source"), pa.string()), "kb").to_pylist()
+        else:
+            sources = ["kb"] * batch.num_rows
+
+        yield _make_docs(texts, sources, range(next_id, next_id + batch.num_rows))
+        next_id += batch.num_rows
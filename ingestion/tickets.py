@@ -1,35 +1,67 @@
 # ingestion/tickets.py
 from __future__ import annotations
+from typing import Iterator
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from langchain_core.documents import Document
 
 def load_ticket_pairs(path: str) -> pd.DataFrame:
-    df = pd.read_parquet(path)
+    df = pd.read_parquet(path, columns=["input", "output"])
     # normalize
     df = df.dropna(subset=["input", "output"]).reset_index(drop=True)
     df["input"] = df["input"].astype(str)
     df["output"] = df["output"].astype(str)
     return df
 
+def _make_docs(contents: list[str], ids) -> list[Document]:
+    return [
+        Document(
+            page_content=c,
+            metadata={
+                "source": "twitter_support_subset",
+                "row_id": int(i),
+                "type": "ticket_case",
+            },
+        )
+        for i, c in zip(ids, contents)
+    ]
+
 def tickets_to_documents(df: pd.DataFrame, limit: int | None = None) -> list[Document]:
     if limit is not None:
         df = df.head(limit)
 
-    docs: list[Document] = []
-    for i, row in df.iterrows():
-        # Put both the issue and resolution in the stored text
-        content = (
-            f"Customer: {row['input']}\n"
-            f"Support: {row['output']}"
-        )
-        docs.append(
-            Document(
-                page_content=content,
-                metadata={
-                    "source": "twitter_support_subset",
-                    "row_id": int(i),
-                    "type": "ticket_case",
-                },
-            )
-        )
-    return docs
+    # Put both the issue and resolution in the stored text
+    contents = ("Customer: " + df["input"] + "\nSupport: " + df["output"]).tolist()
+    return _make_docs(contents, df.index)
+
+def iter_ticket_document_batches(path: str, batch_size: int = 2048, limit: int | None = None) -> Iterator[list[Document]]:
+    """
+    Stream ticket pairs as bounded lists of Documents, reading only the
+    input/output columns. row_ids match load_ticket_pairs + tickets_to_documents.
+    """
+    pf = pq.ParquetFile(path)
+
+    next_id = 0
+    for batch in pf.iter_batches(batch_size=batch_size, columns=["input", "output"]):
+        keep = pc.and_(pc.is_valid(batch.column("input")), pc.is_valid(batch.column("output")))
+        batch = batch.filter(keep)
+        if limit is not None:
+            batch = batch.slice(0, max(0, limit - next_id))
+        if batch.num_rows == 0:
+            if limit is not None and next_id >= limit:
+                return
+            continue
+
+        contents = pc.binary_join_element_wise(
+            "Customer: ",
+            pc.cast(batch.column("input"), pa.string()),
+            "\nSupport: ",
+            pc.cast(batch.column("output"), pa.string()),
+            "",
+        ).to_pylist()
+
+        yield _make_docs(contents, range(next_id, next_id + batch.num_rows))
+        next_id += batch.num_rows
@@ -0,0 +1,104 @@
+# rag/ann.py
+"""
+FAISS index types beyond exact search, chosen by config:
+
+  flat   exact L2 (default, what FAISS.from_documents builds)
+  ivf    inverted lists over k-means cells; search `nprobe` cells
+  hnsw   graph index; search breadth `ef_search`
+  ivfpq  IVF with product-quantized codes: each vector is stored as `pq_m`
+         codes of nbits bits (8; fewer for tiny corpora) instead of d float32s,
+         so vectors take 32*d/(pq_m*nbits)x less space (96x for d=1536,
+         pq_m=64), plus an 8-byte id each and, fixed, the nlist coarse
+         centroids and the PQ codebooks
+
+Config keys come from env (INDEX_TYPE, INDEX_NLIST, INDEX_NPROBE, INDEX_HNSW_M,
+INDEX_EF_CONSTRUCTION, INDEX_EF_SEARCH, INDEX_PQ_M, INDEX_TRAIN_SIZE) and can be
+overridden per call. The resolved config is saved in the index manifest so a
+loaded index searches with the parameters it was tuned for.
+"""
+from __future__ import annotations
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+def index_config(index_type: Optional[str] = None, **overrides) -> dict:
+    cfg = {
+        "type": index_type or os.getenv("INDEX_TYPE", "flat"),
+        "nlist": int(os.getenv("INDEX_NLIST", "0")),          # 0 = derive from corpus size
+        "nprobe": int(os.getenv("INDEX_NPROBE", "16")),
+        "hnsw_m": int(os.getenv("INDEX_HNSW_M", "32")),
+        "ef_construction": int(os.getenv("INDEX_EF_CONSTRUCTION", "80")),
+        "ef_search": int(os.getenv("INDEX_EF_SEARCH", "64")),
+        "pq_m": int(os.getenv("INDEX_PQ_M", "64")),
+        "train_size": int(os.getenv("INDEX_TRAIN_SIZE", "100000")),
+    }
+    cfg.update({k: v for k, v in overrides.items() if v is not None})
+    if cfg["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {cfg['type']!r}; expected one of {INDEX_TYPES}")
+    return cfg
+
+def needs_training(cfg: dict) -> bool:
+    return cfg["type"] in ("ivf", "ivfpq")
+
+def _nlist(cfg: dict, n: int) -> int:
+    if cfg["nlist"]:
+        return cfg["nlist"]
+    # ~4*sqrt(N) cells, but keep >= 39 training points per cell as faiss recommends
+    return max(1, min(int(4 * math.sqrt(max(n, 1))), n // 39 or 1))
+
+def _pq_m(cfg: dict, dim: int) -> int:
+    # Sub-quantizer count must divide the dimension
+    m = min(cfg["pq_m"], dim)
+    while dim % m:
+        m -= 1
+    return m
+
+def make_faiss_index(dim: int, cfg: dict, n_hint: int):
+    """Create an empty (untrained) faiss index for `cfg`. `n_hint` sizes the IVF cell count."""
+    import faiss
+    kind = cfg["type"]
+    if kind == "flat":
+        return faiss.IndexFlatL2(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, cfg["hnsw_m"])
+        index.hnsw.efConstruction = cfg["ef_construction"]
+        return index
+    nlist = _nlist(cfg, n_hint)
+    cfg["nlist"] = nlist
+    quantizer = faiss.IndexFlatL2(dim)
+    if kind == "ivf":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    m = _pq_m(cfg, dim)
+    cfg["pq_m"] = m
+    # 8-bit codebooks need >= 256 training points; tiny corpora get smaller ones
+    nbits = max(1, min(8, int(math.log2(max(2, min(n_hint, cfg["train_size"]))))))
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits)
+
+def train(index, vectors: np.ndarray, cfg: dict, seed: int = 0) -> None:
+    if index.is_trained:
+        return
+    n = vectors.shape[0]
+    size = min(n, cfg["train_size"])
+    sample = vectors if size == n else vectors[np.random.default_rng(seed).choice(n, size, replace=False)]
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+def apply_search_params(index, cfg: dict) -> None:
+    import faiss
+    kind = cfg.get("type", "flat")
+    if kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = cfg["nprobe"]
+    elif kind == "hnsw":
+        index.hnsw.efSearch = cfg["ef_search"]
+
+def build_raw_index(vectors: np.ndarray, cfg: dict):
+    """Make, train, tune and fill a faiss index in one go (benchmarks, rebuilds)."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = make_faiss_index(vectors.shape[1], cfg, vectors.shape[0])
+    train(index, vectors, cfg)
+    apply_search_params(index, cfg)
+    index.add(vectors)
+    return index
@@ -0,0 +1,159 @@
+# rag/bm25.py
+"""
+In-process BM25 inverted index, stored next to a FAISS index.
+
+Postings are flat numpy arrays (uint32 doc positions + uint16 term freqs,
+sliced per term via offsets), so a query is a few vectorized scatter-adds
+instead of a Python loop over documents. Exact tokens such as "irs2go",
+"1040", "w-2" or order numbers survive tokenization.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_ARRAYS = "bm25.npz"
+BM25_META = "bm25_vocab.json"
+SIDECAR_FILES = (BM25_ARRAYS, BM25_META)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+# Function words; BM25's idf handles them, but overlap measures should skip them
+STOPWORDS = frozenset("""
+a an the and or but if then so than to of in on at by for with from into about as is are was were be been
+being it its this that these those there here you your yours we our us i me my they them their he she his
+her do does did can could will would should may might must have has had not no just also any all some
+what which who whom how when where why please
+""".split())
+
+def content_tokens(text: str) -> List[str]:
+    return [t for t in tokenize(text) if t not in STOPWORDS]
+
+class BM25Builder:
+    """Accumulates documents one at a time (works with streamed batches)."""
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self._docs: List[array] = []   # per term: doc positions
+        self._tfs: List[array] = []    # per term: term frequencies
+        self.doc_ids: List[str] = []
+        self.doc_lens = array("I")
+
+    def add(self, doc_id: str, text: str) -> None:
+        pos = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        counts: Dict[str, int] = {}
+        toks = tokenize(text)
+        for t in toks:
+            counts[t] = counts.get(t, 0) + 1
+        self.doc_lens.append(len(toks))
+        for t, c in counts.items():
+            tid = self.vocab.get(t)
+            if tid is None:
+                tid = self.vocab[t] = len(self._docs)
+                self._docs.append(array("I"))
+                self._tfs.append(array("H"))
+            self._docs[tid].append(pos)
+            self._tfs[tid].append(min(c, 65535))
+
+    def build(self, k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        lengths = np.fromiter((len(p) for p in self._docs), dtype=np.int64, count=len(self._docs))
+        offsets = np.zeros(len(self._docs) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        post_docs = np.frombuffer(b"".join(p.tobytes() for p in self._docs), dtype=np.uint32)
+        post_tfs = np.frombuffer(b"".join(p.tobytes() for p in self._tfs), dtype=np.uint16)
+        terms = [None] * len(self.vocab)
+        for t, i in self.vocab.items():
+            terms[i] = t
+        return BM25Index(terms, self.doc_ids, np.asarray(self.doc_lens, dtype=np.float32),
+                         offsets, post_docs, post_tfs, k1=k1, b=b)
+
+class BM25Index:
+    def __init__(self, terms: List[str], doc_ids: List[str], doc_lens: np.ndarray,
+                 offsets: np.ndarray, post_docs: np.ndarray, post_tfs: np.ndarray,
+                 k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.doc_ids = doc_ids
+        self.doc_lens = doc_lens
+        self.offsets = offsets
+        self.post_docs = post_docs
+        self.post_tfs = post_tfs
+        self.k1 = k1
+        self.b = b
+
+        n = len(doc_ids)
+        avgdl = float(doc_lens.mean()) if n else 1.0
+        # Per-doc length normalisation is query independent: precompute it once
+        self._norm = (k1 * (1.0 - b + b * doc_lens / max(avgdl, 1e-9))).astype(np.float32)
+        df = np.diff(offsets).astype(np.float32)
+        self._idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Tuple[str, str]], **kwargs) -> "BM25Index":
+        """docs: iterable of (doc_id, text)."""
+        builder = BM25Builder()
+        for doc_id, text in docs:
+            builder.add(doc_id, text)
+        return builder.build(**kwargs)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, score) by BM25; documents sharing no term with the query are never returned."""
+        tids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not tids or k <= 0:
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        k1 = self.k1
+        for tid in tids:
+            lo, hi = self.offsets[tid], self.offsets[tid + 1]
+            docs = self.post_docs[lo:hi]
+            tf = self.post_tfs[lo:hi].astype(np.float32)
+            # each doc appears once per term's postings, so fancy-index += is safe
+            scores[docs] += self._idf[tid] * tf * (k1 + 1.0) / (tf + self._norm[docs])
+        hit = np.flatnonzero(scores)
+        if len(hit) > k:
+            hit = hit[np.argpartition(scores[hit], -k)[-k:]]
+        hit = hit[np.argsort(-scores[hit], kind="stable")]
+        return [(self.doc_ids[i], float(scores[i])) for i in hit]
+
+    def save(self, path: str) -> None:
+        p = Path(path)
+        p.mkdir(parents=True, exist_ok=True)
+        # Write aside, then rename: readers never see a half-written file
+        with open(p / (BM25_ARRAYS + ".tmp"), "wb") as f:
+            np.savez(f, doc_lens=self.doc_lens, offsets=self.offsets,
+                     post_docs=self.post_docs, post_tfs=self.post_tfs)
+        meta = {"terms": self.terms, "doc_ids": self.doc_ids, "k1": self.k1, "b": self.b}
+        (p / (BM25_META + ".tmp")).write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(p / (BM25_META + ".tmp"), p / BM25_META)
+        os.replace(p / (BM25_ARRAYS + ".tmp"), p / BM25_ARRAYS)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """Returns None when no BM25 index was built for `path`."""
+        p = Path(path)
+        if not (p / BM25_ARRAYS).exists() or not (p / BM25_META).exists():
+            return None
+        meta = json.loads((p / BM25_META).read_text(encoding="utf-8"))
+        arrs = np.load(p / BM25_ARRAYS)
+        return cls(meta["terms"], meta["doc_ids"], arrs["doc_lens"], arrs["offsets"],
+                   arrs["post_docs"], arrs["post_tfs"], k1=meta["k1"], b=meta["b"])
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(id) = sum 1 / (k + rank). Returns (id, score), best first; ties keep first-seen order."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, _id in enumerate(ranking):
+            scores[_id] = scores.get(_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: -kv[1])
@@ -0,0 +1,172 @@
+# rag/embedding_cache.py
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = Path("data/cache/embeddings.sqlite")
+
+
+def normalize_text(text: str) -> str:
+    # Same passage with different whitespace/unicode form should hit the same entry
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    a = array("f")
+    a.frombytes(blob)
+    return a.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed on-disk cache in front of any Embeddings object.
+    Key = sha256(model | dimensions | normalized text), so a model or
+    dimension change never serves stale vectors.
+    """
+
+    def __init__(self, inner: Embeddings, path: str | Path = DEFAULT_CACHE_PATH):
+        self.inner = inner
+        self.model = getattr(inner, "model", type(inner).__name__)
+        self.dimensions = getattr(inner, "dimensions", None)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.model}|{self.dimensions}|{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> dict[str, bytes]:
+        found: dict[str, bytes] = {}
+        uniq = list(dict.fromkeys(keys))
+        # sqlite caps bound parameters per statement
+        for start in range(0, len(uniq), 500):
+            chunk = uniq[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        now = time.time()
+
+        with self._lock:
+            found = self._lookup(keys)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used=? WHERE key=?",
+                    [(now, k) for k in found],
+                )
+                self._conn.commit()
+
+        # Embed each missing text once, even if it repeats in the batch
+        missing: dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in missing:
+                missing[k] = t
+
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            rows = []
+            for k, vec in zip(missing, vectors):
+                blob = _pack(vec)
+                found[k] = blob
+                rows.append((k, blob, len(blob), now, now))
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._conn.commit()
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [_unpack(found[k]) for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM embeddings"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes_stored": nbytes,
+        }
+
+    def evict(self, max_age_seconds: Optional[float] = None, max_bytes: Optional[int] = None) -> int:
+        """
+        Drop entries not used within max_age_seconds, then least recently
+        used entries until the stored vectors fit in max_bytes.
+        Returns the number of evicted entries.
+        """
+        removed = 0
+        with self._lock:
+            if max_age_seconds is not None:
+                cur = self._conn.execute(
+                    "DELETE FROM embeddings WHERE last_used < ?",
+                    (time.time() - max_age_seconds,),
+                )
+                removed += cur.rowcount
+
+            if max_bytes is not None:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(nbytes), 0) FROM embeddings"
+                ).fetchone()[0]
+                if total > max_bytes:
+                    doomed = []
+                    for key, nbytes in self._conn.execute(
+                        "SELECT key, nbytes FROM embeddings ORDER BY last_used ASC"
+                    ):
+                        if total <= max_bytes:
+                            break
+                        doomed.append((key,))
+                        total -= nbytes
+                    self._conn.executemany("DELETE FROM embeddings WHERE key=?", doomed)
+                    removed += len(doomed)
+
+            self._conn.commit()
+        if removed:
+            with self._lock:
+                self._conn.execute("VACUUM")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
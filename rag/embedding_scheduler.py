@@ -0,0 +1,178 @@
+# rag/embedding_scheduler.py
+from __future__ import annotations
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `rate` is refilled per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, n: float = 1.0) -> float:
+        """
+        Block until `n` tokens are available, then take them. Returns seconds waited.
+        A request larger than `capacity` goes once the bucket is full and leaves it
+        in debt (negative), so later callers wait until it has been paid for.
+        """
+        need = min(n, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= need:
+                    self._tokens -= n
+                    return waited
+                wait = (need - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+
+def _is_rate_limited(exc: Exception) -> bool:
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    return type(exc).__name__ == "RateLimitError"
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    resp = getattr(exc, "response", None)
+    headers = getattr(resp, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars/token for English; only used for TPM budgeting
+    return len(text) // 4 + 1
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    Splits embed_documents into batches and sends up to `max_in_flight` of them
+    concurrently, paced by request- and token-per-minute buckets.
+
+    Rate adaptation is AIMD: a 429 halves the request rate (honouring
+    Retry-After), slow responses trim it, and each success creeps back towards
+    the configured ceiling. Failed batches are retried on their own and results
+    are reassembled in input order.
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        batch_size: int = 256,
+        max_in_flight: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 6,
+        target_latency: float = 5.0,
+    ):
+        self.inner = inner
+        self.model = getattr(inner, "model", type(inner).__name__)
+        self.dimensions = getattr(inner, "dimensions", None)
+
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.target_latency = target_latency
+
+        self._max_rps = requests_per_minute / 60.0
+        self._min_rps = max(self._max_rps / 64, 0.05)
+        self.requests = TokenBucket(self._max_rps, capacity=max(1.0, float(max_in_flight)))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, capacity=tokens_per_minute / 60.0)
+
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "retries": 0, "throttled": 0, "wait_s": 0.0}
+
+    def _adjust(self, throttled: bool = False, latency: float = 0.0) -> None:
+        rate = self.requests.rate
+        if throttled:
+            rate = rate / 2
+        elif latency > self.target_latency:
+            rate = rate * 0.9
+        else:
+            rate = rate + self._max_rps / 20
+        self.requests.set_rate(min(self._max_rps, max(self._min_rps, rate)))
+
+    def _bump(self, key: str, by: float = 1) -> None:
+        with self._lock:
+            self._stats[key] += by
+
+    def _run_batch(self, batch: List[str]) -> List[List[float]]:
+        n_tokens = sum(estimate_tokens(t) for t in batch)
+        failures = throttles = 0
+        while True:
+            waited = self.requests.acquire(1) + self.tokens.acquire(n_tokens)
+            self._bump("wait_s", waited)
+            start = time.monotonic()
+            try:
+                out = self.inner.embed_documents(batch)
+            except Exception as e:
+                # 429s get a much larger budget than hard failures: the bucket slows down instead
+                if _is_rate_limited(e):
+                    throttles += 1
+                    self._bump("throttled")
+                    self._adjust(throttled=True)
+                    if throttles > self.max_retries * 10:
+                        raise
+                    delay = _retry_after(e)
+                else:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise
+                    delay = None
+                self._bump("retries")
+                if delay is None:
+                    attempt = failures + throttles
+                    delay = min(30.0, 0.5 * 2 ** (attempt - 1)) * (0.5 + random.random())
+                time.sleep(delay)
+                continue
+            self._adjust(latency=time.monotonic() - start)
+            self._bump("batches")
+            return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._run_batch(batches[0])
+
+        results: List[List[List[float]]] = [None] * len(batches)  # type: ignore[list-item]
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {pool.submit(self._run_batch, b): i for i, b in enumerate(batches)}
+            for fut, i in futures.items():
+                results[i] = fut.result()
+        return [vec for batch in results for vec in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._run_batch([text])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["request_rate_per_s"] = round(self.requests.rate, 3)
+        return out
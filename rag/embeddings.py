@@ -1,9 +1,28 @@
 # rag/embeddings.py
+import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_openai import OpenAIEmbeddings
+def get_embeddings_model(cache: bool = False, scheduled: bool = False):
+    # Imported here: langchain_openai alone takes ~2s to import
+    from langchain_openai import OpenAIEmbeddings
 
-def get_embeddings_model():
     # A stable default for embeddings
-    return OpenAIEmbeddings(model="text-embedding-3-small")
+    if scheduled:
+        # The scheduler owns batching and retries; keep the client to one request per call
+        from rag.embedding_scheduler import ScheduledEmbeddings
+        batch_size = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+        embeddings = ScheduledEmbeddings(
+            OpenAIEmbeddings(model="text-embedding-3-small", chunk_size=batch_size, max_retries=0),
+            batch_size=batch_size,
+            max_in_flight=int(os.getenv("EMBED_MAX_IN_FLIGHT", "4")),
+            requests_per_minute=float(os.getenv("EMBED_RPM", "3000")),
+            tokens_per_minute=float(os.getenv("EMBED_TPM", "1000000")),
+        )
+    else:
+        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    if cache:
+        # Index builds and dataset builds re-embed mostly unchanged text
+        from rag.embedding_cache import CachedEmbeddings, DEFAULT_CACHE_PATH
+        embeddings = CachedEmbeddings(embeddings, os.getenv("EMBEDDING_CACHE_PATH", str(DEFAULT_CACHE_PATH)))
+    return embeddings
@@ -0,0 +1,159 @@
+# rag/evidence_packer.py
+"""
+Fits retrieved evidence into a token budget before it goes into the prompt.
+
+KB chunks are taken in rank order. A chunk whose word shingles overlap an
+already packed one by >= PACK_DEDUP_JACCARD is dropped as a near-duplicate,
+and a chunk longer than PACK_CHUNK_TOKENS (or than what is left of
+PACK_KB_TOKENS) keeps only its sentences most relevant to the question, in
+their original order. Packed chunks are copies with the same metadata, so
+their CITE_KEY=(source,chunk_id) is unchanged and citations to them still pass
+hard_check_citations_whitelist. Ticket cases get the same treatment within
+PACK_CASES_TOKENS.
+
+Token counts are estimates (~4 characters per token), not tokenizer output.
+"""
+from __future__ import annotations
+import os
+import re
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from rag.bm25 import content_tokens, tokenize
+from rag.embedding_scheduler import estimate_tokens
+
+_SENTENCES = re.compile(r"(?<=[.!?])\s+|\n+")
+_GAP = " ... "
+# Customer side of a ticket case is context only; longer messages are cut to this
+_CUSTOMER_CHARS = 400
+
+def packer_config() -> dict:
+    return {
+        "enabled": os.getenv("PACK_EVIDENCE", "1") != "0",
+        "kb_tokens": int(os.getenv("PACK_KB_TOKENS", "1200")),
+        "cases_tokens": int(os.getenv("PACK_CASES_TOKENS", "300")),
+        "chunk_tokens": int(os.getenv("PACK_CHUNK_TOKENS", "250")),
+        "case_tokens": int(os.getenv("PACK_CASE_TOKENS", "100")),
+        "min_chunk_tokens": int(os.getenv("PACK_MIN_CHUNK_TOKENS", "30")),
+        "dedup_jaccard": float(os.getenv("PACK_DEDUP_JACCARD", "0.8")),
+        "shingle": int(os.getenv("PACK_SHINGLE", "4")),
+    }
+
+def shingles(text: str, n: int = 4) -> frozenset:
+    toks = tokenize(text)
+    if len(toks) < n:
+        return frozenset(toks)
+    return frozenset(hash(tuple(toks[i:i + n])) for i in range(len(toks) - n + 1))
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def trim_to_query(text: str, query_terms: set, max_tokens: int) -> str:
+    """`text` if it fits, else its sentences most relevant to `query_terms` (original order) within max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = [s for s in _SENTENCES.split(text) if s.strip()]
+    # Most query-term overlap first; earlier sentences win ties
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(query_terms.intersection(content_tokens(sentences[i]))), i),
+    )
+    keep, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost <= max_tokens:
+            keep.append(i)
+            used += cost
+    if not keep:
+        # One sentence longer than the whole allowance: cut it on a word boundary
+        return sentences[ranked[0]][: max_tokens * 4].rsplit(" ", 1)[0] + _GAP.rstrip()
+    keep.sort()
+    out = sentences[keep[0]]
+    for prev, i in zip(keep, keep[1:]):
+        out += (" " if i == prev + 1 else _GAP) + sentences[i]
+    return out
+
+def _pack(items: List[str], query_terms: set, budget: int, per_item: int, cfg: dict,
+          overhead: List[int], dedup_on: List[str] | None = None) -> Tuple[List[int], List[str], Dict[str, int]]:
+    """
+    (indexes kept, their packed texts, counters) for texts in rank order.
+    Near-duplicates are judged on `dedup_on` when given, else on the texts themselves.
+    """
+    kept, texts, seen = [], [], []
+    counts = {"duplicates": 0, "over_budget": 0, "trimmed": 0}
+    remaining = budget
+    for i, text in enumerate(items):
+        sh = shingles(dedup_on[i] if dedup_on is not None else text, cfg["shingle"])
+        if any(jaccard(sh, other) >= cfg["dedup_jaccard"] for other in seen):
+            counts["duplicates"] += 1
+            continue
+        allowance = min(per_item, remaining - overhead[i])
+        if allowance < min(cfg["min_chunk_tokens"], estimate_tokens(text)):
+            counts["over_budget"] += 1
+            continue
+        packed = trim_to_query(text, query_terms, allowance)
+        counts["trimmed"] += packed != text
+        kept.append(i)
+        texts.append(packed)
+        seen.append(sh)
+        remaining -= estimate_tokens(packed) + overhead[i]
+    return kept, texts, counts
+
+def pack_evidence(question: str, kb_docs: List[Document], cases: List[dict],
+                  config: dict | None = None) -> Tuple[List[Document], List[dict], Dict]:
+    """
+    (packed KB docs, packed ticket cases, stats). stats["tokens_saved"] is the
+    estimated prompt tokens removed versus putting every chunk in whole.
+    """
+    cfg = config or packer_config()
+    terms = set(content_tokens(question))
+
+    def kb_overhead(d):
+        return estimate_tokens(f"CITE_KEY=({d.metadata.get('source', 'unknown')},{d.metadata.get('chunk_id', -1)})\n\n")
+
+    kb_in = sum(estimate_tokens(d.page_content) + kb_overhead(d) for d in kb_docs)
+    cases_in = sum(estimate_tokens(f"{c['customer']} | {c['support']}") + 8 for c in cases)
+    if not cfg["enabled"]:
+        return list(kb_docs), list(cases), {"kb_tokens_in": kb_in, "kb_tokens_out": kb_in,
+                                            "cases_tokens_in": cases_in, "cases_tokens_out": cases_in,
+                                            "tokens_saved": 0}
+
+    kept, texts, kb_counts = _pack(
+        [d.page_content for d in kb_docs], terms, cfg["kb_tokens"], cfg["chunk_tokens"], cfg,
+        [kb_overhead(d) for d in kb_docs],
+    )
+    packed_docs = [
+        Document(id=kb_docs[i].id, page_content=text, metadata=dict(kb_docs[i].metadata))
+        for i, text in zip(kept, texts)
+    ]
+
+    # Cases are deduplicated on the whole exchange (distinct tickets often share a
+    # canned reply) but trimmed on the support side, which is what the model imitates
+    c_kept, c_texts, case_counts = _pack(
+        [c["support"] for c in cases], terms, cfg["cases_tokens"], cfg["case_tokens"], cfg,
+        [estimate_tokens(c["customer"][:_CUSTOMER_CHARS]) + 8 for c in cases],
+        dedup_on=[f"{c['customer']} | {c['support']}" for c in cases],
+    )
+    packed_cases = [
+        {**cases[i], "customer": cases[i]["customer"][:_CUSTOMER_CHARS], "support": text}
+        for i, text in zip(c_kept, c_texts)
+    ]
+
+    kb_out = sum(estimate_tokens(d.page_content) + kb_overhead(d) for d in packed_docs)
+    cases_out = sum(estimate_tokens(f"{c['customer']} | {c['support']}") + 8 for c in packed_cases)
+    return packed_docs, packed_cases, {
+        "kb_tokens_in": kb_in,
+        "kb_tokens_out": kb_out,
+        "cases_tokens_in": cases_in,
+        "cases_tokens_out": cases_out,
+        "tokens_saved": (kb_in - kb_out) + (cases_in - cases_out),
+        "kb_chunks": f"{len(packed_docs)}/{len(kb_docs)}",
+        "kb_duplicates": kb_counts["duplicates"],
+        "kb_trimmed": kb_counts["trimmed"],
+        "kb_over_budget": kb_counts["over_budget"],
+        "cases_kept": f"{len(packed_cases)}/{len(cases)}",
+        "cases_duplicates": case_counts["duplicates"],
+    }
@@ -2,13 +2,56 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_openai import ChatOpenAI
+import os
+from typing import Callable, Optional
+
 from langchain_core.messages import SystemMessage, HumanMessage
+from rag.llm_cache import get_llm_cache
+from rag.llm_clients import get_llm, get_streaming_llm, get_structured_llm  # noqa: F401  (get_llm re-exported)
 from rag.schema import RagAnswer
+from rag.stream_json import StreamingJSONObject
+from rag.telemetry import inc, llm_config, span
+
+def _cache_lookup(messages, schema, model: str, temperature: float):
+    """(cache, key, hit); only temperature-0 calls are cached."""
+    cache = get_llm_cache() if temperature == 0 else None
+    if cache is None:
+        return None, None, None
+    key = cache.key(model, temperature, messages, schema)
+    return cache, key, cache.get(key, schema)
+
+def _count_call(s, model: str, hit) -> None:
+    s.set(cache_hit=hit is not None)
+    inc("llm_calls_total", 1, "LLM calls by model, answered by the API or the response cache",
+        model=model, cache="hit" if hit is not None else "miss")
+
+def invoke_structured(messages, schema, model: str = "gpt-4o-mini", temperature: float = 0):
+    """
+    get_structured_llm(schema, model, temperature).invoke(messages),
+    replayed from the on-disk response cache when the exact same call was made
+    before. Only temperature-0 calls are cached; LLM_CACHE=0 disables it.
+    """
+    with span("llm.invoke", model=model, schema=schema.__name__) as s:
+        cache, key, hit = _cache_lookup(messages, schema, model, temperature)
+        _count_call(s, model, hit)
+        if hit is not None:
+            return hit
+        out = get_structured_llm(schema, model, temperature).invoke(messages, llm_config())
+        if key is not None and out is not None:
+            cache.put(key, model, out)
+        return out
 
-def get_llm(model: str = "gpt-4o-mini"):
-    # We'll later swap in a fine-tuned model name here
-    return ChatOpenAI(model=model, temperature=0)
+async def ainvoke_structured(messages, schema, model: str = "gpt-4o-mini", temperature: float = 0):
+    """Async invoke_structured (the local sqlite lookup stays synchronous: it is sub-millisecond)."""
+    with span("llm.invoke", model=model, schema=schema.__name__) as s:
+        cache, key, hit = _cache_lookup(messages, schema, model, temperature)
+        _count_call(s, model, hit)
+        if hit is not None:
+            return hit
+        out = await get_structured_llm(schema, model, temperature).ainvoke(messages, llm_config())
+        if key is not None and out is not None:
+            cache.put(key, model, out)
+        return out
 
 def format_evidence(docs):
     lines = []
@@ -34,12 +77,10 @@ def format_cases(cases: list[dict]) -> str:
         lines.append(f"- (row_id={c['row_id']}) Customer: {c['customer']} | Support: {c['support']}")
     return "\n".join(lines)
 
-def generate_answer(question: str, kb_docs, ticket_cases) -> RagAnswer:
+def answer_messages(question: str, kb_docs, ticket_cases) -> list:
     kb_text = format_kb_evidence(kb_docs)
     cases_text = format_cases(ticket_cases)
 
-    llm = get_llm().with_structured_output(RagAnswer)
-
     system = SystemMessage(content=(
         "You are a support copilot.\n"
         "Rules:\n"
@@ -55,5 +96,90 @@ def generate_answer(question: str, kb_docs, ticket_cases) -> RagAnswer:
         f"KB_EVIDENCE:\n{kb_text}\n\n"
         f"SIMILAR_CASES (examples, not authority):\n{cases_text}\n"
     ))
+    return [system, user]
+
+def generation_model() -> str:
+    # Read per call so eval can switch between the base and the fine-tuned model
+    return os.getenv("GEN_MODEL", "gpt-4o-mini")
+
+def generate_answer(question: str, kb_docs, ticket_cases, model: Optional[str] = None) -> RagAnswer:
+    messages = answer_messages(question, kb_docs, ticket_cases)
+    return invoke_structured(messages, RagAnswer, model or generation_model())
+
+async def agenerate_answer(question: str, kb_docs, ticket_cases, model: Optional[str] = None) -> RagAnswer:
+    messages = answer_messages(question, kb_docs, ticket_cases)
+    return await ainvoke_structured(messages, RagAnswer, model or generation_model())
+
+def _replay(hit: RagAnswer, emit) -> RagAnswer:
+    data = hit.model_dump()
+    emit(("delta", "answer", hit.answer))
+    for name, value in data.items():
+        emit(("field", name, value))
+    emit(("done", data))
+    return hit
+
+def _parsed(parser: StreamingJSONObject, cache, key, model: str) -> RagAnswer:
+    if not parser.done:
+        raise ValueError("Streamed answer ended before the JSON object was complete.")
+    answer = RagAnswer.model_validate(parser.value)
+    if key is not None:
+        cache.put(key, model, answer)
+    return answer
+
+def generate_answer_stream(question: str, kb_docs, ticket_cases,
+                           on_event: Optional[Callable[[tuple], None]] = None,
+                           model: Optional[str] = None) -> RagAnswer:
+    """
+    Same answer as generate_answer, but streamed: on_event receives
+    ("delta", "answer", text) as answer tokens arrive, ("field", name, value)
+    as each field completes and ("done", dict) at the closing brace. Returns
+    as soon as the object is complete, without waiting for the stream to end.
+    Cache hits replay the same events at once.
+    """
+    emit = on_event or (lambda event: None)
+    model = model or generation_model()
+    messages = answer_messages(question, kb_docs, ticket_cases)
+    with span("llm.stream", model=model, schema="RagAnswer") as s:
+        cache, key, hit = _cache_lookup(messages, RagAnswer, model, 0)
+        _count_call(s, model, hit)
+        if hit is not None:
+            return _replay(hit, emit)
+
+        parser = StreamingJSONObject(string_fields=("answer",))
+        stream = get_streaming_llm(RagAnswer, model, 0).stream(messages, llm_config())
+        try:
+            for chunk in stream:
+                if isinstance(chunk.content, str):
+                    for event in parser.feed(chunk.content):
+                        emit(event)
+                if parser.done:
+                    break
+        finally:
+            stream.close()  # releases the connection if we stopped before the end
+        return _parsed(parser, cache, key, model)
+
+async def agenerate_answer_stream(question: str, kb_docs, ticket_cases,
+                                  on_event: Optional[Callable[[tuple], None]] = None,
+                                  model: Optional[str] = None) -> RagAnswer:
+    """Async generate_answer_stream."""
+    emit = on_event or (lambda event: None)
+    model = model or generation_model()
+    messages = answer_messages(question, kb_docs, ticket_cases)
+    with span("llm.stream", model=model, schema="RagAnswer") as s:
+        cache, key, hit = _cache_lookup(messages, RagAnswer, model, 0)
+        _count_call(s, model, hit)
+        if hit is not None:
+            return _replay(hit, emit)
 
-    return llm.invoke([system, user])
+        parser = StreamingJSONObject(string_fields=("answer",))
+        stream = get_streaming_llm(RagAnswer, model, 0).astream(messages, llm_config())
+        try:
+            async for chunk in stream:
+                if isinstance(chunk.content, str):
+                    for event in parser.feed(chunk.content):
+                        emit(event)
+                if parser.done:
+                    break
+        finally:
+            await stream.aclose()
+        return _parsed(parser, cache, key, model)
@@ -0,0 +1,109 @@
+# rag/keywords.py
+"""
+Keyword features shared by ingestion and the hard checks.
+
+Every keyword of TOPIC_KEYWORDS (plus the escalation stem) is compiled into
+one trie-shaped regex, so a text is matched against all of them in a single
+pass. Ingestion stores the result per KB chunk in metadata (kw_domain,
+kw_escalation, kw_hits), which turns the evidence-side hard checks into set
+operations; chunks indexed before this (or under an older keyword list) fall
+back to matching their text once.
+"""
+from __future__ import annotations
+import hashlib
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List
+
+# Simple topic hints (extend later)
+TOPIC_KEYWORDS = {
+    "tax_refund": [
+        "irs", "irs2go", "where's my refund", "wheres my refund",
+        "1040", "w-2", "tax year", "efile", "e-file", "tax return",
+        "state tax", "tax commission"
+    ],
+    "commerce_refund": ["order", "purchase", "merchant", "store", "card", "bank", "amazon", "refund", "return"],
+    "network": ["lte", "signal", "bars", "data", "internet", "load", "speed"],
+}
+ESCALATION = "escalat"
+
+def _trie_regex(words: List[str]) -> str:
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}   # a keyword ends here
+
+    def emit(node: dict) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional: the longest keyword on this path wins, shorter ones are backtracked to
+        return f"(?:{body})?" if "" in node else body
+    return emit(trie)
+
+class KeywordMatcher:
+    """
+    The set of keywords occurring in a text, with the same meaning as
+    `{k for k in keywords if k in text.lower()}`. The trie regex sits in a
+    lookahead so it is tried at every position; at each one it reports the
+    longest keyword, and keywords contained in that one are added from a
+    precomputed table.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = sorted({k.lower() for k in keywords if k})
+        self._pattern = re.compile(f"(?=({_trie_regex(self.keywords)}))")
+        self._within = {k: frozenset(j for j in self.keywords if j in k) for k in self.keywords}
+
+    def find(self, text: str) -> FrozenSet[str]:
+        hits: set = set()
+        for m in self._pattern.finditer(text.lower()):
+            hits |= self._within[m.group(1)]
+        return frozenset(hits)
+
+_MATCHER = KeywordMatcher([k for words in TOPIC_KEYWORDS.values() for k in words] + [ESCALATION])
+_TOPIC_SETS = {topic: frozenset(words) for topic, words in TOPIC_KEYWORDS.items()}
+
+# Stored features are only trusted if they were computed from this exact keyword list
+KEYWORDS_VERSION = hashlib.sha1("\x00".join(_MATCHER.keywords).encode("utf-8")).hexdigest()[:12]
+
+def match_keywords(text: str) -> FrozenSet[str]:
+    return _MATCHER.find(text)
+
+def topic_hits(hits: FrozenSet[str], topic: str) -> FrozenSet[str]:
+    return hits & _TOPIC_SETS[topic]
+
+def domain_of(hits: FrozenSet[str]) -> str:
+    if topic_hits(hits, "tax_refund"):
+        return "tax_refund"
+    # if the text says refund but not tax-y, treat as commerce by default
+    if "refund" in hits:
+        return "commerce_refund"
+    if topic_hits(hits, "network"):
+        return "network"
+    return "unknown"
+
+def compute_features(text: str) -> Dict:
+    """Metadata fields for one chunk (JSON-serializable)."""
+    hits = match_keywords(text)
+    return {
+        "kw_domain": domain_of(hits),
+        "kw_escalation": ESCALATION in hits,
+        "kw_hits": sorted(hits - {ESCALATION}),
+        "kw_version": KEYWORDS_VERSION,
+    }
+
+@lru_cache(maxsize=8192)
+def _text_features(text: str) -> tuple:
+    f = compute_features(text)
+    return f["kw_domain"], f["kw_escalation"], frozenset(f["kw_hits"])
+
+def chunk_features(doc) -> tuple:
+    """(domain, mentions escalation, keyword hits) from metadata, else from the text."""
+    md = doc.metadata
+    if md.get("kw_version") == KEYWORDS_VERSION:
+        return md["kw_domain"], md["kw_escalation"], frozenset(md["kw_hits"])
+    return _text_features(doc.page_content)
@@ -0,0 +1,159 @@
+# rag/llm_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Sequence, Type
+
+from pydantic import BaseModel
+
+from rag.resources import registry
+
+DEFAULT_CACHE_PATH = Path("data/cache/llm_responses.sqlite")
+
+
+class LLMResponseCache:
+    """
+    Exact-match on-disk cache of structured LLM outputs.
+    Key = sha256(model | temperature | messages | output JSON schema), so a
+    prompt, evidence, model or schema change is always a miss. Values are the
+    pydantic object's JSON and are replayed through the same schema.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_CACHE_PATH, max_bytes: Optional[int] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.by_schema: dict = {}   # schema name -> {"hits", "misses"}, i.e. per graph stage
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, temperature: float, messages: Sequence, schema: Type[BaseModel]) -> str:
+        raw = json.dumps({
+            "model": model,
+            "temperature": temperature,
+            "messages": [{"type": m.type, "content": m.content} for m in messages],
+            "schema": schema.model_json_schema(),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, schema: Type[BaseModel]) -> Optional[BaseModel]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key=?", (key,)).fetchone()
+            counts = self.by_schema.setdefault(schema.__name__, {"hits": 0, "misses": 0})
+            if row is None:
+                self.misses += 1
+                counts["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used=? WHERE key=?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            counts["hits"] += 1
+        return schema.model_validate_json(row[0])
+
+    def put(self, key: str, model: str, value: BaseModel) -> None:
+        blob = value.model_dump_json()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, blob, len(blob.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._puts += 1
+            check = self.max_bytes is not None and self._puts % 100 == 0
+        if check:
+            # Checking the size on every write would cost a full-table SUM each time
+            self.evict(max_bytes=self.max_bytes)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM responses"
+            ).fetchone()
+            by_schema = {name: dict(c) for name, c in self.by_schema.items()}
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "by_schema": by_schema,
+            "entries": entries,
+            "bytes_stored": nbytes,
+        }
+
+    def evict(self, max_age_seconds: Optional[float] = None, max_bytes: Optional[int] = None) -> int:
+        """
+        Drop responses not used within max_age_seconds, then least recently
+        used ones until the stored responses fit in max_bytes.
+        Returns the number of evicted entries.
+        """
+        removed = 0
+        with self._lock:
+            if max_age_seconds is not None:
+                cur = self._conn.execute(
+                    "DELETE FROM responses WHERE last_used < ?",
+                    (time.time() - max_age_seconds,),
+                )
+                removed += cur.rowcount
+
+            if max_bytes is not None:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(nbytes), 0) FROM responses"
+                ).fetchone()[0]
+                if total > max_bytes:
+                    doomed = []
+                    for key, nbytes in self._conn.execute(
+                        "SELECT key, nbytes FROM responses ORDER BY last_used ASC"
+                    ):
+                        if total <= max_bytes:
+                            break
+                        doomed.append((key,))
+                        total -= nbytes
+                    self._conn.executemany("DELETE FROM responses WHERE key=?", doomed)
+                    removed += len(doomed)
+
+            self._conn.commit()
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _cache_factory() -> Optional[LLMResponseCache]:
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    max_mb = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+    return LLMResponseCache(
+        os.getenv("LLM_CACHE_PATH", str(DEFAULT_CACHE_PATH)),
+        max_bytes=int(max_mb * 2**20) if max_mb > 0 else None,
+    )
+
+registry.register("llm_cache", _cache_factory)
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Shared response cache, or None when disabled with LLM_CACHE=0."""
+    return registry.get("llm_cache")
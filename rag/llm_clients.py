@@ -0,0 +1,214 @@
+# rag/llm_clients.py
+"""
+Process-wide LLM clients on one shared, tuned HTTP connection pool.
+
+Every ChatOpenAI (any model / temperature) and every structured-output
+runnable built from it lives in the resource registry, keyed by
+(model, temperature[, schema]), and talks through the same httpx clients.
+Requests therefore reuse keep-alive connections instead of each client
+opening its own. Pool limits and timeouts come from env:
+
+  LLM_MAX_CONNECTIONS     (64)   concurrent connections to the API
+  LLM_MAX_KEEPALIVE       (32)   idle connections kept open
+  LLM_KEEPALIVE_EXPIRY    (30)   seconds an idle connection is kept
+  LLM_TIMEOUT             (60)   read/write/pool timeout, seconds
+  LLM_CONNECT_TIMEOUT     (5)
+  LLM_MAX_RETRIES         (2)    openai client retries
+
+pool_stats() reports how close the pool runs to its connection limit.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+
+import httpx
+
+from rag.resources import registry
+
+class PoolMeter:
+    """
+    Counts requests inside the transport, from send until the response body is
+    closed (queued for a connection or holding one). in_flight above `limit`
+    means requests are waiting on the pool.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+        self.saturated = 0      # requests that found every connection busy and had to queue
+        self.busy_ms = 0.0
+
+    def enter(self) -> float:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.saturated += 1
+            self.in_flight += 1
+            self.requests += 1
+            self.peak = max(self.peak, self.in_flight)
+        return time.perf_counter()
+
+    def exit(self, start: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.busy_ms += (time.perf_counter() - start) * 1000.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak,
+                "utilization": self.in_flight / self.limit if self.limit else 0.0,
+                "requests": self.requests,
+                "saturated_requests": self.saturated,
+                "saturation_rate": self.saturated / self.requests if self.requests else 0.0,
+                "avg_request_ms": self.busy_ms / self.requests if self.requests else 0.0,
+            }
+
+class _MeteredStream(httpx.SyncByteStream):
+    def __init__(self, inner, meter: PoolMeter, start: float):
+        self._inner, self._meter, self._start = inner, meter, start
+        self._done = False
+
+    def __iter__(self):
+        yield from self._inner
+
+    def close(self) -> None:
+        try:
+            self._inner.close()
+        finally:
+            if not self._done:
+                self._done = True
+                self._meter.exit(self._start)
+
+class _MeteredAsyncStream(httpx.AsyncByteStream):
+    def __init__(self, inner, meter: PoolMeter, start: float):
+        self._inner, self._meter, self._start = inner, meter, start
+        self._done = False
+
+    async def __aiter__(self):
+        async for chunk in self._inner:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._inner.aclose()
+        finally:
+            if not self._done:
+                self._done = True
+                self._meter.exit(self._start)
+
+class MeteredTransport(httpx.HTTPTransport):
+    def __init__(self, meter: PoolMeter, **kwargs):
+        super().__init__(**kwargs)
+        self.meter = meter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = self.meter.enter()
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self.meter.exit(start)
+            raise
+        response.stream = _MeteredStream(response.stream, self.meter, start)
+        return response
+
+class MeteredAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, meter: PoolMeter, **kwargs):
+        super().__init__(**kwargs)
+        self.meter = meter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = self.meter.enter()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self.meter.exit(start)
+            raise
+        response.stream = _MeteredAsyncStream(response.stream, self.meter, start)
+        return response
+
+def pool_config() -> dict:
+    return {
+        "max_connections": int(os.getenv("LLM_MAX_CONNECTIONS", "64")),
+        "max_keepalive": int(os.getenv("LLM_MAX_KEEPALIVE", "32")),
+        "keepalive_expiry": float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30")),
+        "timeout": float(os.getenv("LLM_TIMEOUT", "60")),
+        "connect_timeout": float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+        "max_retries": int(os.getenv("LLM_MAX_RETRIES", "2")),
+    }
+
+def _limits_and_timeout(cfg: dict):
+    limits = httpx.Limits(
+        max_connections=cfg["max_connections"],
+        max_keepalive_connections=cfg["max_keepalive"],
+        keepalive_expiry=cfg["keepalive_expiry"],
+    )
+    return limits, httpx.Timeout(cfg["timeout"], connect=cfg["connect_timeout"])
+
+# Sync and async traffic share one meter so the metrics describe total API concurrency
+registry.register("llm_pool_meter", lambda: PoolMeter(pool_config()["max_connections"]))
+
+def _http_client():
+    limits, timeout = _limits_and_timeout(pool_config())
+    transport = MeteredTransport(registry.get("llm_pool_meter"), limits=limits)
+    return httpx.Client(transport=transport, timeout=timeout)
+
+def _http_async_client():
+    # An AsyncClient binds to the event loop it first runs on: one serving loop per process
+    limits, timeout = _limits_and_timeout(pool_config())
+    transport = MeteredAsyncTransport(registry.get("llm_pool_meter"), limits=limits)
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+registry.register("llm_http_client", _http_client)
+registry.register("llm_http_async_client", _http_async_client)
+
+def get_llm(model: str = "gpt-4o-mini", temperature: float = 0):
+    """Shared ChatOpenAI for (model, temperature), on the pooled HTTP clients."""
+    # We'll later swap in a fine-tuned model name here
+    def build():
+        from langchain_openai import ChatOpenAI
+        cfg = pool_config()
+        return ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            max_retries=cfg["max_retries"],
+            http_client=registry.get("llm_http_client"),
+            http_async_client=registry.get("llm_http_async_client"),
+        )
+    return registry.get_or_create(("llm", model, temperature), build)
+
+def get_structured_llm(schema, model: str = "gpt-4o-mini", temperature: float = 0):
+    """Shared get_llm(model, temperature).with_structured_output(schema) runnable."""
+    return registry.get_or_create(
+        ("llm", model, temperature, schema),
+        lambda: get_llm(model, temperature).with_structured_output(schema),
+    )
+
+def get_streaming_llm(schema, model: str = "gpt-4o-mini", temperature: float = 0):
+    """
+    get_llm(model, temperature) bound to the same JSON-schema response format
+    with_structured_output uses, but yielding the raw JSON text as it streams.
+    """
+    return registry.get_or_create(
+        ("llm", model, temperature, schema, "stream"),
+        lambda: get_llm(model, temperature).bind(response_format=schema),
+    )
+
+def pool_stats() -> dict:
+    stats = registry.get("llm_pool_meter").stats()
+    for name in ("llm_http_client", "llm_http_async_client"):
+        if not registry.is_loaded(name):
+            continue
+        # httpcore's pool lists its open connections; idle ones are ready for reuse
+        pool = getattr(registry.get(name)._transport, "_pool", None)
+        conns = list(getattr(pool, "connections", []))
+        stats[name.replace("llm_http_", "") + "_connections"] = {
+            "open": len(conns),
+            "idle": sum(1 for c in conns if c.is_idle()),
+        }
+    return stats
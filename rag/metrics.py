@@ -0,0 +1,78 @@
+# rag/metrics.py
+from __future__ import annotations
+import bisect
+import threading
+from typing import Dict, Sequence
+
+# Bucket upper bounds for millisecond latencies and for batch sizes
+LATENCY_MS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram (Prometheus-style upper bounds plus
+    +Inf). Quantiles are interpolated within a bucket, so they are estimates
+    bounded by the bucket edges.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_MS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            counts, total, top = list(self._counts), self.count, self.max
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else top
+                return min(lo + (hi - lo) * (rank - seen) / c, top)
+            seen += c
+        return top
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self.count, self.sum, self.max = 0, 0.0, 0.0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts, total, s, top = list(self._counts), self.count, self.sum, self.max
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "count": total,
+            "sum": s,
+            "mean": s / total if total else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": top,
+            "buckets": dict(zip(labels, counts)),
+        }
+
+class Counter:
+    """Thread-safe monotonically increasing count."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, n: float = 1) -> None:
+        with self._lock:
+            self.value += n
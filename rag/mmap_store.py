@@ -0,0 +1,236 @@
+# rag/mmap_store.py
+"""
+Read-only, memory-mapped vector index format (no pickle).
+
+Layout of an index directory:
+  meta.json        {"format": "mmap-v1", "count": N, "dim": d, ...}
+  vectors.f32      float32 [N, d], row-major
+  norms.f32        float32 [N], squared L2 norm of each row
+  doc_offsets.u64  uint64 [N + 1], byte offsets of each record in docs.jsonl
+  docs.jsonl       one {"id", "page_content", "metadata"} record per row
+  ids.json         docstore id of each row (resolves BM25 hits to rows)
+  manifest.json    row keys/hashes carried over from the source index
+
+Every file is opened with mmap, so N worker processes on a node share one copy
+in the OS page cache and "loading" is a handful of open() calls.
+"""
+from __future__ import annotations
+import json
+import mmap
+import pickle
+import shutil
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from rag.bm25 import SIDECAR_FILES
+from rag.vectorstore import MANIFEST, read_manifest, staging_dir, swap_in
+
+FORMAT = "mmap-v1"
+
+def is_mmap_index(path: str) -> bool:
+    meta = Path(path) / "meta.json"
+    if not meta.exists():
+        return False
+    return json.loads(meta.read_text(encoding="utf-8")).get("format") == FORMAT
+
+class MmapVectorStore:
+    """
+    Exact L2 search over a memory-mapped matrix. Mirrors the subset of the
+    langchain FAISS API used by this repo (similarity_search*, embedding_function),
+    and returns squared L2 distances like IndexFlatL2.
+    """
+
+    tombstones: set = frozenset()  # compacted on conversion
+
+    def __init__(self, path: str, embedding_function):
+        self.path = Path(path)
+        self.embedding_function = embedding_function
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        n, d = self.meta["count"], self.meta["dim"]
+
+        self.vectors = np.memmap(self.path / "vectors.f32", dtype=np.float32, mode="r", shape=(n, d))
+        self.norms = np.memmap(self.path / "norms.f32", dtype=np.float32, mode="r", shape=(n,))
+        self.offsets = np.memmap(self.path / "doc_offsets.u64", dtype=np.uint64, mode="r", shape=(n + 1,))
+        with open(self.path / "docs.jsonl", "rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if n else b""
+        self._rows: Optional[dict] = None
+
+    @classmethod
+    def load(cls, path: str, embeddings) -> "MmapVectorStore":
+        return cls(path, embeddings)
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def document(self, i: int) -> Document:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        rec = json.loads(self._docs[start:end])
+        return Document(id=rec["id"], page_content=rec["page_content"], metadata=rec["metadata"])
+
+    def _row_map(self) -> dict:
+        if self._rows is None:
+            # Only hybrid retrieval / MMR need id -> row, so build the map on first use
+            ids_file = self.path / "ids.json"
+            if ids_file.exists():
+                all_ids = json.loads(ids_file.read_text(encoding="utf-8"))
+            else:
+                all_ids = [self.document(i).id for i in range(len(self))]
+            self._rows = {_id: i for i, _id in enumerate(all_ids)}
+        return self._rows
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        rows = self._row_map()
+        return [self.document(rows[_id]) for _id in ids if _id in rows]
+
+    def vectors_for(self, ids: List[str]) -> np.ndarray:
+        rows = self._row_map()
+        return np.asarray(self.vectors[[rows[_id] for _id in ids]])
+
+    def distances(self, embedding) -> np.ndarray:
+        q = np.asarray(embedding, dtype=np.float32)
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, one mat-vec over the mapped matrix
+        return self.norms - 2.0 * (self.vectors @ q) + float(q @ q)
+
+    def search_ids(self, embedding, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(self)
+        if n == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        dist = self.distances(embedding)
+        k = min(k, n)
+        top = np.argpartition(dist, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(dist[top], kind="stable")]
+        return top, dist[top]
+
+    def search_ids_batch(self, embeddings, k: int, max_cells: int = 1 << 24) -> Tuple[np.ndarray, np.ndarray]:
+        """search_ids for a [b, d] matrix of queries: one mat-mat product per chunk of queries."""
+        q = np.asarray(embeddings, dtype=np.float32)
+        n = len(self)
+        k = min(k, n)
+        if n == 0 or k <= 0:
+            return np.empty((len(q), 0), dtype=np.int64), np.empty((len(q), 0), dtype=np.float32)
+        ids, dists = [], []
+        # Bound the [chunk, n] distance matrix (64 MB of float32 by default)
+        step = max(1, max_cells // n)
+        for lo in range(0, len(q), step):
+            qc = q[lo:lo + step]
+            dist = self.norms[None, :] - 2.0 * (qc @ self.vectors.T) + np.einsum("ij,ij->i", qc, qc)[:, None]
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k] if k < n else np.tile(np.arange(n), (len(qc), 1))
+            d = np.take_along_axis(dist, top, axis=1)
+            order = np.argsort(d, axis=1, kind="stable")
+            ids.append(np.take_along_axis(top, order, axis=1))
+            dists.append(np.take_along_axis(d, order, axis=1))
+        return np.concatenate(ids), np.concatenate(dists)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4,
+        filter: Optional[Callable[[dict], bool]] = None, fetch_k: int = 20, **kwargs,
+    ) -> List[Tuple[Document, float]]:
+        ids, dist = self.search_ids(embedding, fetch_k if filter is not None else k)
+        out = []
+        for i, score in zip(ids, dist):
+            doc = self.document(int(i))
+            if filter is None or filter(doc.metadata):
+                out.append((doc, float(score)))
+        return out[:k]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, **kwargs)
+
+def _reconstruct_all(index, chunk: int = 65536):
+    """Yield the stored vectors of a faiss index in order, chunk by chunk."""
+    import faiss
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except (RuntimeError, AttributeError):
+        pass  # not an IVF index
+    n = index.ntotal
+    for start in range(0, n, chunk):
+        yield index.reconstruct_n(start, min(chunk, n - start))
+
+def is_lossy(index) -> bool:
+    """True for indexes that keep compressed codes (IVF-PQ, PQ, SQ) instead of the vectors."""
+    import faiss
+    name = type(faiss.downcast_index(index)).__name__
+    return "PQ" in name or "ScalarQuantizer" in name
+
+def convert_faiss_to_mmap(src: str, dst: str, embeddings=None) -> int:
+    """
+    Convert a langchain FAISS directory (index.faiss + index.pkl) into the mmap
+    format. Tombstoned rows are dropped. Returns the number of rows written.
+    Unpickling happens here, once, instead of in every serving process.
+
+    Lossy indexes (ivfpq) only hold PQ codes; reconstructing them would bake the
+    quantization error into what is then served as exact search. Those are
+    refused unless `embeddings` is given, in which case rows are re-embedded
+    from their page_content.
+    """
+    import faiss
+
+    src_p = Path(src)
+    index = faiss.read_index(str(src_p / "index.faiss"))
+    lossy = is_lossy(index)
+    if lossy and embeddings is None:
+        raise ValueError(
+            f"{src} is a {type(faiss.downcast_index(index)).__name__}: its stored vectors are lossy "
+            "PQ reconstructions. Re-embed instead (convert_index_to_mmap --reembed)."
+        )
+    with open(src_p / "index.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    tmp = staging_dir(dst)
+    n_out, dim = 0, index.d
+    offsets, ids = [0], []
+    with open(tmp / "vectors.f32", "wb") as vf, open(tmp / "norms.f32", "wb") as nf, \
+         open(tmp / "docs.jsonl", "wb") as df:
+        row = 0
+        for block in _reconstruct_all(index):
+            keep, texts = [], []
+            for j in range(block.shape[0]):
+                _id = index_to_docstore_id[row + j]
+                doc = docstore.search(_id)
+                if doc.metadata.get("tombstone"):
+                    continue
+                keep.append(j)
+                texts.append(doc.page_content)
+                ids.append(_id)
+                rec = {"id": _id, "page_content": doc.page_content, "metadata": doc.metadata}
+                line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                df.write(line)
+                offsets.append(offsets[-1] + len(line))
+            row += block.shape[0]
+
+            if lossy:
+                block = np.asarray(embeddings.embed_documents(texts), dtype=np.float32).reshape(-1, dim)
+            else:
+                block = block[keep]
+            block = np.ascontiguousarray(block, dtype=np.float32)
+            vf.write(block.tobytes())
+            nf.write(np.einsum("ij,ij->i", block, block).astype(np.float32).tobytes())
+            n_out += len(keep)
+
+    np.asarray(offsets, dtype=np.uint64).tofile(tmp / "doc_offsets.u64")
+    (tmp / "ids.json").write_text(json.dumps(ids), encoding="utf-8")
+    # Same docstore ids on both sides, so the BM25 sidecar carries over unchanged
+    for name in SIDECAR_FILES:
+        if (src_p / name).exists():
+            shutil.copy2(src_p / name, tmp / name)
+
+    manifest = read_manifest(src)
+    manifest["tombstones"] = []
+    (tmp / MANIFEST).write_text(json.dumps(manifest), encoding="utf-8")
+    meta = {"format": FORMAT, "count": n_out, "dim": dim, "distance": "l2", "source": str(src_p)}
+    (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    swap_in(tmp, dst)
+    return n_out
+
+def default_mmap_path(src: str) -> str:
+    p = Path(src)
+    name = p.name[: -len("_faiss")] if p.name.endswith("_faiss") else p.name
+    return str(p.with_name(name + "_mmap"))
@@ -0,0 +1,44 @@
+# rag/mmr.py
+"""
+Maximal marginal relevance over an already-retrieved candidate pool.
+
+Works on the candidates' stored vectors (no re-embedding). Each of the k
+greedy steps is one mat-vec over the pool, so the cost is O(k * n * d)
+rather than the O(n^2 * d) of a full candidate-candidate similarity matrix.
+"""
+from __future__ import annotations
+from typing import List, Optional
+
+import numpy as np
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int,
+               lambda_mult: float = 0.5, relevance: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Pick k row indices of `candidates` [n, d] maximizing
+        lambda * relevance - (1 - lambda) * max cosine to already-picked rows.
+    `relevance` defaults to cosine similarity with `query`; pass fused scores
+    (scaled to [0, 1]) to keep a hybrid ranking's notion of relevance.
+    """
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    cand = _unit(np.asarray(candidates, dtype=np.float32))
+    if relevance is None:
+        relevance = cand @ _unit(np.asarray(query, dtype=np.float32))
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    picked = [int(np.argmax(relevance))]
+    redundancy = cand @ cand[picked[0]]
+    score = np.empty(n, dtype=np.float32)
+    for _ in range(min(k, n) - 1):
+        np.multiply(relevance, lambda_mult, out=score)
+        score -= (1.0 - lambda_mult) * redundancy
+        score[picked] = -np.inf
+        nxt = int(np.argmax(score))
+        picked.append(nxt)
+        np.maximum(redundancy, cand @ cand[nxt], out=redundancy)
+    return picked
@@ -0,0 +1,106 @@
+# rag/resources.py
+from __future__ import annotations
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+class ResourceRegistry:
+    """
+    Process-wide home for expensive objects (embedding clients, FAISS indexes,
+    LLM clients). Nothing is built at import time: a resource is created on
+    first get() and reused afterwards. Servers can call warm_up() to pay that
+    cost before taking traffic.
+    """
+
+    def __init__(self):
+        self._factories: Dict[Hashable, Callable[[], Any]] = {}
+        self._instances: Dict[Hashable, Any] = {}
+        # name -> the factory an override replaced (None if there was none), for restore()
+        self._originals: Dict[Hashable, Optional[Callable[[], Any]]] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: Hashable, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            if name in self._originals:
+                # Overridden: keep serving the override, restore() brings this one back
+                self._originals[name] = factory
+            else:
+                self._factories[name] = factory
+
+    def get(self, name: Hashable) -> Any:
+        # Membership, not truthiness: an optional resource may legitimately build to None
+        if name in self._instances:
+            return self._instances[name]
+        with self._lock:
+            # double-checked: another thread may have built it while we waited
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"No resource registered under {name!r}")
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def get_or_create(self, name: Hashable, factory: Callable[[], Any]) -> Any:
+        # For open-ended keys such as (model, temperature) LLM clients
+        if name not in self._factories:
+            with self._lock:
+                self._factories.setdefault(name, factory)
+        return self.get(name)
+
+    def override(self, name: Hashable, instance: Any) -> None:
+        """
+        Swap in a ready-made instance (e.g. a fake backend) under `name`. It
+        replaces the factory too, so it survives reset(); restore() undoes it.
+        """
+        with self._lock:
+            if name not in self._originals:
+                self._originals[name] = self._factories.get(name)
+            self._factories[name] = lambda: instance
+            self._instances[name] = instance
+
+    def restore(self, name: Optional[Hashable] = None) -> None:
+        """Undo override() for `name` (default: every overridden name); the next get() rebuilds."""
+        with self._lock:
+            for n in [name] if name is not None else list(self._originals):
+                if n not in self._originals:
+                    continue
+                original = self._originals.pop(n)
+                if original is None:
+                    self._factories.pop(n, None)
+                else:
+                    self._factories[n] = original
+                self._instances.pop(n, None)
+
+    def reset(self, name: Optional[Hashable] = None) -> None:
+        """Forget built instances so the next get() rebuilds them."""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def is_loaded(self, name: Hashable) -> bool:
+        return name in self._instances
+
+    def names(self) -> list:
+        return list(self._factories)
+
+    def warm_up(self, names: Optional[Iterable[Hashable]] = None) -> Dict[Hashable, float]:
+        """Build the given (default: all registered) resources now. Returns seconds spent per resource."""
+        timings = {}
+        for name in list(names if names is not None else self._factories):
+            start = time.perf_counter()
+            self.get(name)
+            timings[name] = time.perf_counter() - start
+        return timings
+
+registry = ResourceRegistry()
+
+def _embeddings_factory():
+    from rag.embeddings import get_embeddings_model
+    return get_embeddings_model()
+
+registry.register("embeddings", _embeddings_factory)
+
+def get_embeddings():
+    """Shared query-time embeddings client."""
+    return registry.get("embeddings")
@@ -0,0 +1,125 @@
+# rag/stream_json.py
+"""
+Incremental parser for one JSON object arriving in chunks (a streamed
+structured-output response).
+
+feed(chunk) returns events as soon as the text allows:
+  ("delta", key, text)   newly decoded characters of a top-level string field
+                         listed in `string_fields` (e.g. the user-facing answer)
+  ("field", key, value)  a top-level field's value is complete
+  ("done", obj)          the closing brace arrived; `obj` is the whole object
+"""
+from __future__ import annotations
+import json
+import re
+from typing import Iterable, List, Tuple
+
+# A raw JSON string prefix is only safe to decode if it doesn't stop mid-escape
+_PARTIAL_ESCAPE = re.compile(r"(?<!\\)((?:\\\\)*)\\(u[0-9a-fA-F]{0,3})?$")
+_HIGH_SURROGATE = re.compile(r"(?<!\\)((?:\\\\)*)\\u[dD][89abAB][0-9a-fA-F]{2}$")
+
+def _safe_prefix(raw: str) -> str:
+    # Trim a dangling escape, then a high surrogate still waiting for its pair.
+    # Escaped backslash pairs in front of either are kept.
+    for pattern in (_PARTIAL_ESCAPE, _HIGH_SURROGATE):
+        m = pattern.search(raw)
+        if m:
+            raw = raw[:m.start() + len(m.group(1))]
+    return raw
+
+class StreamingJSONObject:
+    def __init__(self, string_fields: Iterable[str] = ()):
+        self.string_fields = set(string_fields)
+        self.value: dict = {}
+        self.done = False
+        self._text: List[str] = []
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._phase = "start"      # start | key | colon | value | comma (at depth 1)
+        self._key = None
+        self._key_start = 0
+        self._value_start = None
+        self._emitted = 0          # decoded chars already sent for the streaming field
+        self._decoded_to = 0       # raw position the streaming field has been decoded up to
+
+    def _slice(self, start: int, end: int) -> str:
+        return "".join(self._text[start:end])
+
+    def _finish_value(self, end: int, events: list) -> None:
+        raw = self._slice(self._value_start, end).strip()
+        value = json.loads(raw)
+        if self._key in self.string_fields and isinstance(value, str) and len(value) > self._emitted:
+            events.append(("delta", self._key, value[self._emitted:]))
+        self.value[self._key] = value
+        events.append(("field", self._key, value))
+        self._phase, self._value_start, self._emitted, self._decoded_to = "comma", None, 0, 0
+
+    def _streaming_string(self) -> bool:
+        return (self._in_str and self._depth == 1 and self._phase == "value"
+                and self._key in self.string_fields)
+
+    def feed(self, chunk: str) -> List[Tuple]:
+        events: list = []
+        if self.done or not chunk:
+            return events
+        for ch in chunk:
+            pos = len(self._text)
+            self._text.append(ch)
+
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._phase == "key":
+                        self._key = json.loads(self._slice(self._key_start, pos + 1))
+                        self._phase = "colon"
+                    elif self._depth == 1 and self._phase == "value":
+                        self._finish_value(pos + 1, events)
+                continue
+
+            if ch == '"':
+                self._in_str = True
+                if self._depth == 1 and self._phase == "key":
+                    self._key_start = pos
+                elif self._depth == 1 and self._phase == "value":
+                    self._value_start = pos
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._phase = "key"
+                elif self._depth == 2 and self._phase == "value":
+                    self._value_start = pos
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._phase == "value":
+                    self._finish_value(pos + 1, events)
+                elif self._depth == 0:
+                    if self._phase == "value" and self._value_start is not None:
+                        self._finish_value(pos, events)   # trailing scalar
+                    self.done = True
+                    events.append(("done", self.value))
+                    break
+            elif self._depth == 1:
+                if ch == ":":
+                    self._phase, self._value_start = "value", None
+                elif ch == ",":
+                    if self._phase == "value" and self._value_start is not None:
+                        self._finish_value(pos, events)   # number / true / false / null
+                    self._phase = "key"
+                elif not ch.isspace() and self._phase == "value" and self._value_start is None:
+                    self._value_start = pos
+
+        if self._streaming_string() and self._value_start is not None:
+            # Decode only what arrived since the last safe boundary, so a long answer stays O(n)
+            start = max(self._decoded_to, self._value_start + 1)
+            raw = _safe_prefix(self._slice(start, len(self._text)))
+            if raw:
+                text = json.loads(f'"{raw}"')
+                self._decoded_to = start + len(raw)
+                events.append(("delta", self._key, text))
+                self._emitted += len(text)
+        return events
@@ -0,0 +1,276 @@
+# rag/telemetry.py
+"""
+Spans and metrics for the graph nodes and every external call (embeddings,
+FAISS/BM25 searches, LLM calls).
+
+  with span("faiss.search", index="kb", k=10) as s:
+      ...
+      s.set(hits=len(docs))
+
+Every finished span feeds the copilot_span_duration_ms histogram and, if
+TELEMETRY_TRACE_FILE is set, is appended to that file as one JSON line
+(trace_id / span_id / parent_id, start, duration_ms, attributes, error). Spans
+nest through a context variable, so the spans of one request share a trace_id
+across awaits, LangGraph's node threads and the retrieval pool. A
+micro-batcher's embedding call or search serves several requests at once, so
+it starts a trace of its own.
+
+counter(), histogram() and gauge() add metrics; prometheus_text() renders them
+all in the Prometheus text format (scripts.serve exposes it on
+GET /metrics/prometheus; write_prometheus() writes it for a textfile collector).
+
+TELEMETRY=0 turns everything into no-ops: span() returns one shared inert
+object and counters are not touched, so the calls can stay in the hot path.
+"""
+from __future__ import annotations
+import contextvars
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from rag.metrics import LATENCY_MS_BUCKETS, Counter, Histogram
+
+PREFIX = "copilot_"
+
+_enabled = os.getenv("TELEMETRY", "1") != "0"
+_trace_path = os.getenv("TELEMETRY_TRACE_FILE", "")
+_trace_file = None
+_trace_lock = threading.Lock()
+
+_current: contextvars.ContextVar = contextvars.ContextVar("telemetry_span", default=None)
+
+_metrics: Dict[Tuple[str, Tuple], Any] = {}
+_gauges: Dict[Tuple[str, Tuple], Callable[[], float]] = {}
+_help: Dict[str, str] = {}
+_metrics_lock = threading.Lock()
+
+def enabled() -> bool:
+    return _enabled
+
+def configure(enabled: Optional[bool] = None, trace_path: Optional[str] = None) -> None:
+    """Switch telemetry on/off or (re)point the JSONL trace file ("" stops tracing) at runtime."""
+    global _enabled, _trace_path, _trace_file
+    if enabled is not None:
+        _enabled = enabled
+    if trace_path is not None:
+        with _trace_lock:
+            if _trace_file is not None:
+                _trace_file.close()
+            _trace_file, _trace_path = None, trace_path
+
+def _write_trace(record: dict) -> None:
+    global _trace_file
+    line = json.dumps(record, default=str) + "\n"
+    with _trace_lock:
+        if _trace_file is None:
+            _trace_file = open(_trace_path, "a", encoding="utf-8")
+        _trace_file.write(line)
+        _trace_file.flush()
+
+# ---------------------------------------------------------------- metrics
+
+def _labels(labels: dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _metric(kind, name: str, help: str, labels: dict, *args):
+    key = (name, _labels(labels))
+    m = _metrics.get(key)
+    if m is None:
+        with _metrics_lock:
+            m = _metrics.get(key)
+            if m is None:
+                m = _metrics[key] = kind(*args)
+                _help.setdefault(name, help)
+    return m
+
+def counter(name: str, help: str = "", **labels) -> Counter:
+    return _metric(Counter, name, help, labels)
+
+def histogram(name: str, help: str = "", buckets=LATENCY_MS_BUCKETS, **labels) -> Histogram:
+    return _metric(Histogram, name, help, labels, buckets)
+
+def gauge(name: str, fn: Callable[[], float], help: str = "", **labels) -> None:
+    """Register a value read at export time (queue depth, pool in-flight, ...)."""
+    with _metrics_lock:
+        _gauges[(name, _labels(labels))] = fn
+        _help.setdefault(name, help)
+
+def inc(name: str, n: float = 1, help: str = "", **labels) -> None:
+    """counter(name, **labels).inc(n), skipped when telemetry is off."""
+    if _enabled:
+        counter(name, help, **labels).inc(n)
+
+def _fmt_value(v: float) -> str:
+    # Full precision: ":g" keeps 6 digits, so a counter past 1e6 stalls or jumps under rate()
+    v = float(v)
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if v.is_integer() and abs(v) < 2**53:
+        return str(int(v))
+    return repr(v)
+
+def _fmt_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+def prometheus_text() -> str:
+    """Every counter, histogram and gauge in the Prometheus text exposition format (0.0.4)."""
+    with _metrics_lock:
+        metrics = sorted(_metrics.items(), key=lambda item: item[0])
+        gauges = sorted(_gauges.items(), key=lambda item: item[0])
+    lines, typed = [], set()
+
+    def header(name: str, kind: str) -> None:
+        if name not in typed:
+            typed.add(name)
+            if _help.get(name):
+                lines.append(f"# HELP {PREFIX}{name} {_help[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    for (name, labels), m in metrics:
+        full = PREFIX + name
+        if isinstance(m, Counter):
+            header(name, "counter")
+            lines.append(f"{full}{_fmt_labels(labels)} {_fmt_value(m.value)}")
+            continue
+        header(name, "histogram")
+        snap = m.snapshot()
+        cumulative = 0
+        for le, c in snap["buckets"].items():
+            cumulative += c
+            lines.append(f"{full}_bucket{_fmt_labels(labels, (('le', le),))} {cumulative}")
+        lines.append(f"{full}_sum{_fmt_labels(labels)} {_fmt_value(snap['sum'])}")
+        lines.append(f"{full}_count{_fmt_labels(labels)} {snap['count']}")
+    for (name, labels), fn in gauges:
+        try:
+            value = float(fn())
+        except Exception:
+            continue
+        header(name, "gauge")
+        lines.append(f"{PREFIX}{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str) -> None:
+    """Atomically write prometheus_text() to `path` (node_exporter textfile collector style)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+# ---------------------------------------------------------------- spans
+
+class Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "_wall", "_token")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = f"{random.getrandbits(64):016x}"
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+        self.parent_id = parent.span_id if parent is not None else None
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, **amounts) -> "Span":
+        """Add to numeric attributes (e.g. tokens over several LLM calls)."""
+        for k, v in amounts.items():
+            self.attrs[k] = self.attrs.get(k, 0) + v
+        return self
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        self._wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        ms = (time.perf_counter() - self.start) * 1000.0
+        _current.reset(self._token)
+        histogram("span_duration_ms", "Wall time of instrumented operations", span=self.name).observe(ms)
+        if exc_type is not None:
+            counter("span_errors_total", "Instrumented operations that raised", span=self.name).inc()
+        if _trace_path:
+            _write_trace({
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "start": self._wall,
+                "duration_ms": round(ms, 3),
+                "attrs": self.attrs,
+                "error": f"{exc_type.__name__}: {exc}" if exc_type is not None else None,
+            })
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> "_NoopSpan":
+        return self
+
+    def add(self, **amounts) -> "_NoopSpan":
+        return self
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+_NOOP = _NoopSpan()
+
+def span(name: str, **attrs):
+    return Span(name, attrs) if _enabled else _NOOP
+
+def current_span():
+    """The innermost open span (an inert one outside any span or when telemetry is off)."""
+    s = _current.get() if _enabled else None
+    return s if s is not None else _NOOP
+
+# ---------------------------------------------------------------- LLM token usage
+
+_usage_handler = None
+
+def llm_config() -> Optional[dict]:
+    """
+    RunnableConfig for LLM calls: a callback that adds the call's token usage
+    to the current span and to copilot_llm_tokens_total. None when off.
+    """
+    global _usage_handler
+    if not _enabled:
+        return None
+    if _usage_handler is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class _UsageHandler(BaseCallbackHandler):
+            run_inline = True   # keep it in the caller's context, where the span is
+
+            def on_llm_end(self, response, **kwargs) -> None:
+                usage = (response.llm_output or {}).get("token_usage") or {}
+                model = (response.llm_output or {}).get("model_name", "unknown")
+                prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+                if not usage:
+                    for gens in response.generations:
+                        for g in gens:
+                            meta = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+                            prompt += meta.get("input_tokens", 0)
+                            completion += meta.get("output_tokens", 0)
+                current_span().add(prompt_tokens=prompt, completion_tokens=completion)
+                inc("llm_tokens_total", prompt, "LLM tokens by model and kind", model=model, kind="prompt")
+                inc("llm_tokens_total", completion, "LLM tokens by model and kind", model=model, kind="completion")
+
+        _usage_handler = _UsageHandler()
+    return {"callbacks": [_usage_handler]}
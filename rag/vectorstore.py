@@ -1,12 +1,449 @@
 # rag/vectorstore.py
-from langchain_community.vectorstores import FAISS
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
+
+import numpy as np
 from langchain_core.documents import Document
 
-def build_faiss_index(docs: list[Document], embeddings):
-    return FAISS.from_documents(docs, embeddings)
+from rag.ann import apply_search_params, build_raw_index, index_config, make_faiss_index, needs_training, train
+from rag.bm25 import BM25_ARRAYS, SIDECAR_FILES, BM25Index
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+def _faiss_cls():
+    # langchain_community's vectorstore stack is slow to import; pay for it on first use
+    from langchain_community.vectorstores import FAISS
+    return FAISS
+
+MANIFEST = "manifest.json"
+
+# One writer per index directory at a time (updates vs. background compaction)
+_write_locks: dict[str, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+
+def _write_lock(path: str) -> threading.Lock:
+    with _write_locks_guard:
+        return _write_locks.setdefault(str(Path(path).resolve()), threading.Lock())
+
+# Manifests written with row keys / hashes from an older scheme are rebuilt from the docstore
+KEY_SCHEME = 3
+
+# Ignored by content_hash: positional ids shift when rows are deleted, and derived
+# keyword features (kw_*, see rag.keywords) change with TOPIC_KEYWORDS, not the row.
+# Either is refreshed in place by update_faiss_index without re-embedding.
+_POSITIONAL = ("chunk_id", "row_id")
+_DERIVED_PREFIX = "kw_"
+
+def _hashed_metadata(md: dict) -> dict:
+    return {k: v for k, v in md.items()
+            if k != "tombstone" and k not in _POSITIONAL and not k.startswith(_DERIVED_PREFIX)}
+
+def doc_key(doc: Document) -> str:
+    # Row identity from content, not position: deleting one row must not re-key the ones after it
+    digest = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+    return f"{doc.metadata.get('source', 'unknown')}#{digest}"
+
+def doc_keys(docs: Iterable[Document], counts: dict | None = None) -> list[str]:
+    """
+    doc_key per doc, with a ~n suffix on the n-th repeat of the same text so
+    keys stay unique. Pass the same `counts` across the batches of one pass.
+    """
+    counts = {} if counts is None else counts
+    out = []
+    for d in docs:
+        key = doc_key(d)
+        n = counts.get(key, 0)
+        counts[key] = n + 1
+        out.append(key if n == 0 else f"{key}~{n}")
+    return out
+
+def content_hash(doc: Document) -> str:
+    raw = doc.page_content + "\x00" + json.dumps(_hashed_metadata(doc.metadata), sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def doc_id(key: str, h: str) -> str:
+    # A changed row gets a new id, so the old vector can be tombstoned independently
+    return f"{key}@{h[:12]}"
+
+def build_faiss_index(docs: list[Document], embeddings, config: dict | None = None,
+                      key_counts: dict | None = None):
+    """
+    Embed and index `docs`. `config` (see rag.ann.index_config) selects flat,
+    ivf, hnsw or ivfpq; ANN types are trained on a sample of these docs.
+    """
+    cfg = config or index_config()
+    ids = [doc_id(key, content_hash(d)) for key, d in zip(doc_keys(docs, key_counts), docs)]
+    FAISS = _faiss_cls()
+    if cfg["type"] == "flat":
+        index = FAISS.from_documents(docs, embeddings, ids=ids)
+    else:
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        texts = [d.page_content for d in docs]
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        raw = make_faiss_index(vectors.shape[1], cfg, len(docs))
+        train(raw, vectors, cfg)
+        apply_search_params(raw, cfg)
+        index = FAISS(embeddings, raw, InMemoryDocstore(), {})
+        index.add_embeddings(zip(texts, vectors.tolist()), metadatas=[d.metadata for d in docs], ids=ids)
+    index.index_config = cfg
+    return index
+
+def build_faiss_index_streaming(batches: Iterable[list[Document]], embeddings, config: dict | None = None):
+    """
+    Build from bounded Document batches (see ingestion.*.iter_*_document_batches),
+    embedding and adding one batch at a time instead of materializing every doc first.
+    IVF types buffer the first `train_size` docs so training sees a representative sample.
+    """
+    cfg = config or index_config()
+    index = None
+    pending: list[Document] = []
+    counts: dict = {}
+    for batch in batches:
+        if not batch:
+            continue
+        if index is None:
+            pending.extend(batch)
+            if needs_training(cfg) and len(pending) < cfg["train_size"]:
+                continue
+            index, pending = build_faiss_index(pending, embeddings, cfg, counts), []
+        else:
+            index.add_documents(batch, ids=[doc_id(key, content_hash(d)) for key, d in zip(doc_keys(batch, counts), batch)])
+    if index is None and pending:
+        index = build_faiss_index(pending, embeddings, cfg, counts)
+    if index is None:
+        raise ValueError("No documents to index.")
+    return index
+
+def _as_batches(docs) -> Iterable[list[Document]]:
+    # Accept either a flat list of Documents or an iterable of Document batches
+    if isinstance(docs, list) and (not docs or isinstance(docs[0], Document)):
+        return [docs]
+    return docs
+
+def load_index(path: str, embeddings):
+    """Load whichever on-disk format lives at `path`: memory-mapped (meta.json) or FAISS + pickle."""
+    from rag.mmap_store import MmapVectorStore, is_mmap_index
+    if is_mmap_index(path):
+        return MmapVectorStore.load(path, embeddings)
+    return load_faiss_index(path, embeddings)
 
 def load_faiss_index(path: str, embeddings):
-    return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    index = _faiss_cls().load_local(path, embeddings, allow_dangerous_deserialization=True)
+    manifest = read_manifest(path)
+    index.tombstones = set(manifest.get("tombstones", []))
+    cfg = manifest.get("index_config") or {"type": "flat"}
+    # Search-time knobs can be retuned per process without rebuilding
+    for key, env in (("nprobe", "INDEX_NPROBE"), ("ef_search", "INDEX_EF_SEARCH")):
+        if os.getenv(env):
+            cfg[key] = int(os.environ[env])
+    apply_search_params(index.index, cfg)
+    index.index_config = cfg
+    return index
+
+def index_version(path: str) -> tuple:
+    # Changes whenever the index on disk is rebuilt, updated or compacted
+    p = Path(path)
+    files = (p / MANIFEST, p / "index.faiss", p / "meta.json", p / BM25_ARRAYS)
+    mtime = max((f.stat().st_mtime_ns for f in files if f.exists()), default=0)
+    return (read_manifest(path).get("version", 0), mtime)
+
+def _is_live(metadata: dict) -> bool:
+    return not metadata.get("tombstone")
+
+def _search_kwargs(index: FAISS, k: int) -> dict:
+    tombstones = getattr(index, "tombstones", None)
+    if not tombstones:
+        return {}
+    # Over-fetch just enough to still return k live docs
+    return {"filter": _is_live, "fetch_k": k + min(len(tombstones), 4 * k)}
 
 def query_index(index: FAISS, query: str, k: int = 5):
-    return index.similarity_search(query, k=k)
+    return index.similarity_search(query, k=k, **_search_kwargs(index, k))
+
+def query_index_by_vector(index: FAISS, vector: list[float], k: int = 5):
+    # For callers that embed the query once and search several indexes with it
+    return index.similarity_search_by_vector(vector, k=k, **_search_kwargs(index, k))
+
+def batch_query_index_by_vectors(index, vectors, ks: list[int]) -> list[list[Document]]:
+    """
+    query_index_by_vector for many query vectors with one matrix search:
+    fetch the largest k for every row, then cut each row to its own k.
+    """
+    if not len(ks):
+        return []
+    fetch = max(ks)
+    fetch = _search_kwargs(index, fetch).get("fetch_k", fetch)
+    q = np.asarray(vectors, dtype=np.float32)
+    if hasattr(index, "search_ids_batch"):
+        rows, _ = index.search_ids_batch(q, fetch)
+        lookup = index.document
+    else:
+        if getattr(index, "_normalize_L2", False):
+            q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        _, rows = index.index.search(q, fetch)
+        lookup = lambda i: index.docstore.search(index.index_to_docstore_id[i])
+
+    out = []
+    for row, k in zip(rows, ks):
+        docs = []
+        for i in row:
+            if len(docs) == k:
+                break
+            if i < 0:
+                continue
+            doc = lookup(int(i))
+            if isinstance(doc, Document) and _is_live(doc.metadata):
+                docs.append(doc)
+        out.append(docs)
+    return out
+
+def stored_id(doc: Document) -> str:
+    # Docstore id of a search hit; older pickles predate Document.id
+    return getattr(doc, "id", None) or doc_id(doc_key(doc), content_hash(doc))
+
+def get_documents(index, ids: list[str]) -> list[Document]:
+    """Live documents for docstore ids, in order; unknown or tombstoned ids are skipped."""
+    if hasattr(index, "get_by_ids"):
+        docs = index.get_by_ids(ids)
+    else:
+        docs = [index.docstore.search(_id) for _id in ids]
+    return [d for d in docs if isinstance(d, Document) and _is_live(d.metadata)]
+
+def stored_vectors(index, ids: list[str]) -> np.ndarray:
+    """Indexed vectors [len(ids), d] for docstore ids (for reranking without re-embedding)."""
+    if hasattr(index, "vectors_for"):
+        return index.vectors_for(ids)
+    rows = getattr(index, "_docstore_rows", None)
+    if rows is None or len(rows) != len(index.index_to_docstore_id):
+        rows = index._docstore_rows = {_id: i for i, _id in index.index_to_docstore_id.items()}
+    positions = np.asarray([rows[_id] for _id in ids], dtype=np.int64)
+    try:
+        return index.index.reconstruct_batch(positions)
+    except RuntimeError:
+        # IVF lists need a direct map before rows can be reconstructed by position
+        import faiss
+        faiss.extract_index_ivf(index.index).make_direct_map()
+        return index.index.reconstruct_batch(positions)
+
+def live_documents(index) -> Iterable[tuple[str, Document]]:
+    """(docstore id, doc) for every non-tombstoned row, FAISS or mmap."""
+    if hasattr(index, "index_to_docstore_id"):
+        for _id in index.index_to_docstore_id.values():
+            d = index.docstore.search(_id)
+            if isinstance(d, Document) and _is_live(d.metadata):
+                yield _id, d
+    else:
+        for i in range(len(index)):
+            d = index.document(i)
+            yield d.id, d
+
+def save_bm25_index(index, path: str) -> BM25Index:
+    """Build the lexical (BM25) sidecar from the index's live docs and store it next to the index."""
+    bm25 = BM25Index.from_documents((_id, d.page_content) for _id, d in live_documents(index))
+    with _write_lock(path):
+        bm25.save(path)
+    return bm25
+
+# --- Incremental updates -------------------------------------------------
+
+def read_manifest(path: str) -> dict:
+    p = Path(path) / MANIFEST
+    if not p.exists():
+        return {}
+    return json.loads(p.read_text(encoding="utf-8"))
+
+def _manifest_from_index(index: FAISS) -> dict:
+    # Indexes built before manifests (or before KEY_SCHEME): derive row keys and hashes from the docstore
+    rows, tombstones, counts = {}, [], {}
+    for _id in index.index_to_docstore_id.values():
+        d = index.docstore.search(_id)
+        if d.metadata.get("tombstone"):
+            tombstones.append(_id)
+        else:
+            rows[doc_keys([d], counts)[0]] = [_id, content_hash(d)]
+    return {"version": 0, "key_scheme": KEY_SCHEME, "rows": rows, "tombstones": tombstones}
+
+def staging_dir(path: str) -> Path:
+    target = Path(path)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    return tmp
+
+def swap_in(tmp: Path, path: str) -> None:
+    # Two renames instead of writing in place: readers see the old or the new dir, never a mix
+    target = Path(path)
+    old = target.with_name(target.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if target.exists():
+        target.rename(old)
+    tmp.rename(target)
+    shutil.rmtree(old, ignore_errors=True)
+
+def save_faiss_index(index: FAISS, path: str, manifest: dict | None = None):
+    """
+    Save index + manifest. Writes into a sibling temp dir and swaps it in, so
+    readers never see a half-written index.
+    """
+    if manifest is None:
+        manifest = _manifest_from_index(index)
+        manifest["version"] = read_manifest(path).get("version", 0) + 1
+
+    manifest.setdefault("index_config", getattr(index, "index_config", None) or {"type": "flat"})
+
+    tmp = staging_dir(path)
+    index.save_local(str(tmp))
+    (tmp / MANIFEST).write_text(json.dumps(manifest), encoding="utf-8")
+    # Keep the BM25 sidecar across updates/compaction; ids of dropped rows just stop resolving
+    for name in SIDECAR_FILES:
+        if (Path(path) / name).exists():
+            shutil.copy2(Path(path) / name, tmp / name)
+    swap_in(tmp, path)
+    index.tombstones = set(manifest.get("tombstones", []))
+
+def compact_faiss_index(path: str, embeddings) -> int:
+    """Physically drop tombstoned vectors and rewrite the index. Returns how many were dropped."""
+    with _write_lock(path):
+        index = load_faiss_index(path, embeddings)
+        manifest = read_manifest(path) or _manifest_from_index(index)
+        dead = [t for t in manifest.get("tombstones", []) if t in index.docstore._dict]
+        if dead:
+            try:
+                index.delete(dead)
+            except RuntimeError:
+                # HNSW graphs cannot remove vectors; rebuild from the live ones
+                index = _rebuild_without(index, set(dead))
+        manifest["tombstones"] = []
+        manifest["version"] = manifest.get("version", 0) + 1
+        save_faiss_index(index, path, manifest)
+        return len(dead)
+
+def _rebuild_without(index: FAISS, dead: set):
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    keep = [(i, _id) for i, _id in sorted(index.index_to_docstore_id.items()) if _id not in dead]
+    vectors = index.index.reconstruct_n(0, index.index.ntotal)[[i for i, _ in keep]]
+    cfg = dict(getattr(index, "index_config", None) or {"type": "flat"})
+    raw = build_raw_index(vectors, cfg)
+    docstore = InMemoryDocstore({_id: index.docstore.search(_id) for _, _id in keep})
+    rebuilt = _faiss_cls()(index.embedding_function, raw, docstore, {j: _id for j, (_, _id) in enumerate(keep)})
+    rebuilt.index_config = cfg
+    return rebuilt
+
+def compact_in_background(path: str, embeddings) -> threading.Thread:
+    # Non-daemon: a build script exiting right after an update still finishes compaction
+    t = threading.Thread(target=compact_faiss_index, args=(path, embeddings), name=f"compact:{path}")
+    t.start()
+    return t
+
+def update_faiss_index(path: str, docs, embeddings,
+                       compact_ratio: float = 0.2, background: bool = True, config: dict | None = None):
+    """
+    Bring the index at `path` in line with `docs` without re-embedding unchanged rows.
+    `docs` is a list of Documents or an iterable of Document batches. Rows are
+    keyed by source + text (doc_keys), so an edited row is a delete plus an add.
+      - added / changed rows are embedded and appended, one batch at a time
+      - a row whose content matches a tombstoned version is revived, not re-added
+      - unchanged rows whose unhashed metadata moved (chunk_id, kw_*) are updated in place
+      - deleted rows and the old version of changed rows are tombstoned
+        (hidden from search, still in the FAISS matrix)
+      - once tombstones exceed `compact_ratio` of the index, compaction runs
+        (in a background thread unless background=False)
+    `config` only applies when there is no index yet; existing ones keep their type.
+    Returns (index, stats).
+    """
+    if not (Path(path) / "index.faiss").exists():
+        index = build_faiss_index_streaming(_as_batches(docs), embeddings, config)
+        save_faiss_index(index, path)
+        n = len(index.index_to_docstore_id)
+        stats = {"added": n, "changed": 0, "deleted": 0, "revived": 0, "refreshed": 0,
+                 "tombstones": 0, "compacting": False}
+        return index, stats
+
+    with _write_lock(path):
+        index = load_faiss_index(path, embeddings)
+        manifest = read_manifest(path)
+        if manifest.get("key_scheme") != KEY_SCHEME:
+            manifest = {**manifest, **_manifest_from_index(index), "version": manifest.get("version", 0)}
+        rows: dict = manifest.get("rows", {})
+        tombstones: list = manifest.get("tombstones", [])
+        dead = set(tombstones)
+
+        seen: set[str] = set()
+        counts: dict = {}
+        n_added = n_changed = n_revived = n_refreshed = 0
+        stale = []
+        for batch in _as_batches(docs):
+            fresh = []
+            for key, d in zip(doc_keys(batch, counts), batch):
+                h = content_hash(d)
+                seen.add(key)
+                prev = rows.get(key)
+                if prev is not None and prev[1] == h:
+                    stored = index.docstore.search(prev[0])
+                    if isinstance(stored, Document) and stored.metadata != d.metadata:
+                        # Only unhashed fields moved (chunk_id, kw_* features): metadata-only update
+                        stored.metadata = {**d.metadata}
+                        n_refreshed += 1
+                    continue
+                _id = doc_id(key, h)
+                stored = index.docstore.search(_id)
+                if isinstance(stored, Document):
+                    # Same content as a tombstoned version (A -> B -> A): revive it instead of re-adding
+                    stored.metadata = {**d.metadata}
+                    dead.discard(_id)
+                    n_revived += 1
+                else:
+                    fresh.append((_id, d))
+                    if prev is None:
+                        n_added += 1
+                    else:
+                        n_changed += 1
+                if prev is not None:
+                    stale.append(prev[0])
+                rows[key] = [_id, h]
+            if fresh:
+                index.add_documents([d for _, d in fresh], ids=[_id for _id, _ in fresh])
+
+        deleted = [key for key in rows if key not in seen]
+        for key in deleted:
+            stale.append(rows.pop(key)[0])
+
+        for _id in stale:
+            d = index.docstore.search(_id)
+            if isinstance(d, Document):
+                d.metadata["tombstone"] = True
+        tombstones = [t for t in tombstones if t in dead] + stale
+
+        manifest = {
+            "version": manifest.get("version", 0) + 1,
+            "key_scheme": KEY_SCHEME,
+            "rows": rows,
+            "tombstones": tombstones,
+            "index_config": manifest.get("index_config") or index.index_config,
+        }
+        save_faiss_index(index, path, manifest)
+
+    compacting = bool(tombstones) and len(tombstones) / max(1, index.index.ntotal) > compact_ratio
+    if compacting:
+        if background:
+            compact_in_background(path, embeddings)
+        else:
+            compact_faiss_index(path, embeddings)
+
+    stats = {
+        "added": n_added,
+        "changed": n_changed,
+        "deleted": len(deleted),
+        "revived": n_revived,
+        "refreshed": n_refreshed,
+        "tombstones": len(tombstones),
+        "compacting": compacting,
+    }
+    return index, stats
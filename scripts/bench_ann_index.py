@@ -0,0 +1,92 @@
+# scripts/bench_ann_index.py
+"""
+Recall@k vs. latency for each index type, against exact (flat) search on the same vectors.
+
+  python -m scripts.bench_ann_index --index data/index/kb_faiss
+  python -m scripts.bench_ann_index --synthetic 200000 --dim 384 --nprobe 8 16 32 --ef-search 32 64 128
+
+Queries are held-out corpus vectors with a little noise, so no embedding calls are made.
+"""
+from __future__ import annotations
+import argparse
+import time
+
+import numpy as np
+
+from rag.ann import apply_search_params, build_raw_index, index_config
+
+def load_vectors(path: str) -> np.ndarray:
+    import faiss
+    index = faiss.read_index(f"{path}/index.faiss")
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except (RuntimeError, AttributeError):
+        pass
+    return index.reconstruct_n(0, index.ntotal)
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # Clustered, unit-norm: closer to real embedding geometry than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, n // 500), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def percentile_ms(samples: list[float], p: float) -> float:
+    return float(np.percentile(np.asarray(samples) * 1000.0, p))
+
+def run(index, queries: np.ndarray, k: int):
+    lat, hits = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        lat.append(time.perf_counter() - start)
+        hits.append(ids[0])
+    return np.vstack(hits), lat
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", default=None, help="existing *_faiss dir to take vectors from")
+    ap.add_argument("--synthetic", type=int, default=50000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--types", nargs="+", default=["ivf", "hnsw", "ivfpq"])
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    ap.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = ap.parse_args()
+
+    base = load_vectors(args.index) if args.index else synthetic_vectors(args.synthetic, args.dim)
+    rng = np.random.default_rng(1)
+    q_idx = rng.choice(len(base), min(args.queries, len(base)), replace=False)
+    queries = base[q_idx] + 0.02 * rng.normal(size=(len(q_idx), base.shape[1])).astype(np.float32)
+    print(f"corpus={len(base)} dim={base.shape[1]} queries={len(queries)} k={args.k}")
+
+    flat = build_raw_index(base, index_config("flat"))
+    truth, flat_lat = run(flat, queries, args.k)
+
+    import faiss
+    rows = [("flat", "-", 0.0, 1.0, percentile_ms(flat_lat, 50), percentile_ms(flat_lat, 99),
+             faiss.serialize_index(flat).nbytes)]
+
+    for kind in args.types:
+        cfg = index_config(kind)
+        start = time.perf_counter()
+        index = build_raw_index(base, cfg)
+        build_s = time.perf_counter() - start
+        size = faiss.serialize_index(index).nbytes
+
+        knobs = args.ef_search if kind == "hnsw" else args.nprobe
+        for knob in knobs:
+            cfg["ef_search" if kind == "hnsw" else "nprobe"] = knob
+            apply_search_params(index, cfg)
+            found, lat = run(index, queries, args.k)
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            label = f"ef_search={knob}" if kind == "hnsw" else f"nprobe={knob}"
+            rows.append((kind, label, build_s, recall, percentile_ms(lat, 50), percentile_ms(lat, 99), size))
+
+    print(f"\n{'type':<7} {'params':<14} {'build_s':>8} {'recall@k':>9} {'p50_ms':>8} {'p99_ms':>8} {'size_mb':>8}")
+    for kind, label, build_s, recall, p50, p99, size in rows:
+        print(f"{kind:<7} {label:<14} {build_s:>8.2f} {recall:>9.3f} {p50:>8.3f} {p99:>8.3f} {size / 2**20:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# scripts/bench_microbatch.py
+"""
+Retrieval under concurrent load with and without cross-request micro-batching,
+embedding against the local fake server (no network, no cost).
+
+  python -m scripts.bench_microbatch --concurrency 32 --requests 1000 --latency-ms 80
+  python -m scripts.bench_microbatch --windows 0.5 2 5
+
+Uses the indexes at KB_INDEX_PATH / TICKETS_INDEX_PATH. Every query is unique
+so the embedding and result caches never answer.
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from scripts.fake_openai_server import serve_in_thread
+
+def run(retrieval, n: int, concurrency: int, tag: str) -> dict:
+    questions = [f"my refund for order {tag}-{i} has not arrived, what should I do?" for i in range(n)]
+    latencies = []
+
+    def one(q):
+        start = time.perf_counter()
+        retrieval.retrieve_evidence(q, kb_k=5, tickets_k=3)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, questions))
+    wall = time.perf_counter() - start
+    lat = np.asarray(latencies) * 1000.0
+    return {"qps": n / wall, "p50": float(np.percentile(lat, 50)), "p99": float(np.percentile(lat, 99))}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--latency-ms", type=float, default=80.0)
+    ap.add_argument("--windows", type=float, nargs="+", default=[2.0], help="MICROBATCH_WINDOW_MS values to try")
+    ap.add_argument("--max-batch", type=int, default=32)
+    args = ap.parse_args()
+
+    server = serve_in_thread(latency_ms=args.latency_ms)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    from agent import retrieval
+    from rag.resources import registry
+    retrieval.warm_up()
+
+    print(f"{'mode':<18} {'qps':>8} {'p50 ms':>8} {'p99 ms':>8} {'API calls':>10} "
+          f"{'avg batch':>10} {'queue p99':>10}")
+
+    def report(label: str, r: dict, calls: int, stats: dict) -> None:
+        emb = stats.get("query_embed_batcher", {})
+        print(f"{label:<18} {r['qps']:>8.1f} {r['p50']:>8.1f} {r['p99']:>8.1f} {calls:>10} "
+              f"{emb.get('avg_batch', 1.0):>10.2f} {emb.get('queue_ms', {}).get('p99', 0.0):>10.2f}")
+
+    retrieval.MICROBATCH = False
+    before = server.stats["requests"]
+    r = run(retrieval, args.requests, args.concurrency, "off")
+    report("unbatched", r, server.stats["requests"] - before, {})
+
+    retrieval.MICROBATCH = True
+    retrieval.MICROBATCH_MAX = args.max_batch
+    for window in args.windows:
+        names = ["query_embed_batcher"] + [f"{n}_search_batcher" for n in retrieval.INDEX_PATHS]
+        for name in names:
+            # Fresh batchers (and histograms) per window setting
+            registry.reset(name)
+        retrieval.MICROBATCH_WINDOW_MS = window
+        before = server.stats["requests"]
+        r = run(retrieval, args.requests, args.concurrency, f"w{window}")
+        stats = retrieval.batch_stats()
+        report(f"batched {window:g} ms", r, server.stats["requests"] - before, stats)
+        for name in names[1:]:
+            s = stats.get(name)
+            if s:
+                print(f"  {name}: avg batch {s['avg_batch']:.2f}, run p50 {s['run_ms']['p50']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
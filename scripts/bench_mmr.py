@@ -0,0 +1,75 @@
+# scripts/bench_mmr.py
+"""
+Added latency of MMR diversification for candidate pools of 50..500, plus how
+many distinct "answers" end up in the top-k with and without it.
+
+  python -m scripts.bench_mmr
+  python -m scripts.bench_mmr --pools 50 100 200 500 --dim 1536 --k 5
+
+The corpus is synthetic: groups of near-identical paraphrase vectors, like the
+duplicated Amazon QA passages. Stored vectors come back from a flat FAISS index
+via reconstruct_batch, as in retrieval, and that fetch is timed separately.
+"""
+from __future__ import annotations
+import argparse
+import time
+
+import numpy as np
+
+from rag.ann import build_raw_index, index_config
+from rag.mmr import mmr_select
+
+def paraphrase_corpus(groups: int, per_group: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(groups, dim)).astype(np.float32)
+    labels = np.repeat(np.arange(groups), per_group)
+    x = centers[labels] + 0.05 * rng.normal(size=(len(labels), dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True), labels
+
+def percentile_ms(samples: list[float], p: float) -> float:
+    return float(np.percentile(np.asarray(samples) * 1000.0, p))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pools", type=int, nargs="+", default=[50, 100, 200, 500])
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--lambda-mult", type=float, default=0.5)
+    ap.add_argument("--groups", type=int, default=2000)
+    ap.add_argument("--per-group", type=int, default=8)
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+
+    vectors, labels = paraphrase_corpus(args.groups, args.per_group, args.dim)
+    index = build_raw_index(vectors, index_config("flat"))
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(args.dim)
+    print(f"corpus={len(vectors)} dim={args.dim} k={args.k} queries={len(queries)}")
+
+    print(f"\n{'pool':>5} {'search_p50':>10} {'fetch_p50':>10} {'mmr_p50':>8} {'mmr_p99':>8} "
+          f"{'distinct@k':>10} {'mmr_distinct@k':>14}")
+    for pool in args.pools:
+        search, fetch, mmr, plain_distinct, mmr_distinct = [], [], [], [], []
+        for q in queries:
+            t = time.perf_counter()
+            _, ids = index.search(q[None, :], pool)
+            search.append(time.perf_counter() - t)
+            ids = ids[0]
+
+            t = time.perf_counter()
+            cand = index.reconstruct_batch(ids)
+            fetch.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            picked = mmr_select(q, cand, args.k, args.lambda_mult)
+            mmr.append(time.perf_counter() - t)
+
+            plain_distinct.append(len(set(labels[ids[: args.k]])))
+            mmr_distinct.append(len(set(labels[ids[picked]])))
+        print(f"{pool:>5} {percentile_ms(search, 50):>10.3f} {percentile_ms(fetch, 50):>10.3f} "
+              f"{percentile_ms(mmr, 50):>8.3f} {percentile_ms(mmr, 99):>8.3f} "
+              f"{np.mean(plain_distinct):>10.2f} {np.mean(mmr_distinct):>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# scripts/bench_suite.py
+"""
+Offline, deterministic benchmark suite: no network, no API key, no cost.
+Embeddings and LLMs are the in-process fakes of scripts.fake_backends; the
+corpus is synthetic (seeded) and written to a temp dir at each size.
+
+  python -m scripts.bench_suite                          # run, compare with baselines
+  python -m scripts.bench_suite --save                   # run and store as the new baselines
+  python -m scripts.bench_suite --sizes 1000 --only search,e2e --threshold 0.3
+
+Benchmarks (median ms per call):
+  ingest_kb / ingest_tickets  parquet -> Documents (incl. keyword features)
+  build_index                 embed + FAISS flat build + BM25 sidecar
+  search / search_batch32     one dense search / 32 queries in one matrix search
+  retrieve                    retrieve_candidates (dense + BM25 + RRF + MMR)
+  format_evidence / pack_evidence / hard_checks
+  e2e                         build_graph().invoke, fake LLM at --llm-latency-ms (default 0,
+                              so this is the pipeline's own overhead)
+
+Timings are divided by a fixed CPU calibration workload before they are
+compared, so baselines recorded on one machine stay usable on another. A
+benchmark regresses when its normalized time exceeds the baseline by more than
+--threshold (default 25%) and by more than --min-ms; the exit code is then 1.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Before any agent/rag module reads its config: no response cache, no batching
+# window in a single-caller benchmark
+os.environ["LLM_CACHE"] = "0"
+os.environ["MICROBATCH"] = "0"
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+import numpy as np
+import pandas as pd
+
+BASELINES = Path(__file__).with_name("bench_baselines.json")
+
+_TOPICS = {
+    "commerce": ["order", "refund", "purchase", "card", "store", "return", "merchant", "bank"],
+    "network": ["signal", "lte", "data", "speed", "internet", "bars", "load"],
+    "tax": ["irs", "tax return", "1040", "efile", "state tax"],
+    "account": ["password", "login", "email", "reset", "locked", "account"],
+}
+_FILLER = ("the customer asked about their issue and we checked the account history before replying "
+           "please allow a few business days for processing and contact us again if needed").split()
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    topic = rng.choice(list(_TOPICS))
+    out = []
+    for _ in range(words):
+        out.append(rng.choice(_TOPICS[topic]) if rng.random() < 0.25 else rng.choice(_FILLER))
+        if rng.random() < 0.08:
+            out[-1] += "."
+    return " ".join(out).capitalize() + "."
+
+def write_corpus(root: Path, n: int, seed: int = 0) -> Dict[str, Path]:
+    rng = random.Random(seed)
+    kb = pd.DataFrame({
+        "text": [synthetic_text(rng, rng.randint(40, 160)) for _ in range(n)],
+        "source": [rng.choice(["amazon", "k8s", "msmarco"]) for _ in range(n)],
+    })
+    tickets = pd.DataFrame({
+        "input": [synthetic_text(rng, rng.randint(8, 30)) for _ in range(n)],
+        "output": [synthetic_text(rng, rng.randint(10, 40)) for _ in range(n)],
+    })
+    paths = {"kb": root / "kb.parquet", "tickets": root / "tickets.parquet"}
+    kb.to_parquet(paths["kb"])
+    tickets.to_parquet(paths["tickets"])
+    return paths
+
+def questions(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    templates = [
+        "My refund for order {i} has not arrived, what should I do?",
+        "Full bars LTE but nothing loads on my phone ({i}).",
+        "I was charged twice on my card, ticket {i}.",
+        "I am locked out of my account {i}, how do I reset my password?",
+    ]
+    return [rng.choice(templates).format(i=i) for i in range(n)]
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000.0)
+    return {"ms": statistics.median(samples), "p95_ms": float(np.percentile(samples, 95)), "n": repeat}
+
+def calibrate() -> float:
+    """Median ms of a fixed hashing + small matmul workload (the unit all timings are divided by)."""
+    m = np.random.default_rng(0).normal(size=(192, 192))
+    blobs = [str(i).encode() * 8 for i in range(20000)]
+
+    def work():
+        for b in blobs:
+            hashlib.sha1(b).digest()
+        for _ in range(10):
+            m @ m
+    return measure(work, repeat=7, warmup=2)["ms"]
+
+def run_size(n: int, root: Path, args, results: Dict[str, dict], selected) -> None:
+    from agent import retrieval
+    from agent.graph import build_graph
+    from ingestion.kb_passages import iter_kb_document_batches
+    from ingestion.tickets import iter_ticket_document_batches
+    from rag.resources import get_embeddings
+    from rag.vectorstore import batch_query_index_by_vectors, build_faiss_index, query_index_by_vector, \
+        save_bm25_index, save_faiss_index
+    from scripts.fake_backends import fake_vectors
+
+    def record(name: str, fn, repeat: int, warmup: int = 1) -> None:
+        if name in selected:
+            r = measure(fn, repeat, warmup)
+            results[f"{name}@{n}"] = r
+            print(f"  {name + '@' + str(n):<28} {r['ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f}", flush=True)
+
+    paths = write_corpus(root, n)
+    emb = get_embeddings()
+    docs = {}
+
+    def ingest(name, it):
+        docs[name] = [d for batch in it(str(paths[name])) for d in batch]
+    record("ingest_kb", lambda: ingest("kb", iter_kb_document_batches), repeat=3)
+    record("ingest_tickets", lambda: ingest("tickets", iter_ticket_document_batches), repeat=3)
+    for name, it in (("kb", iter_kb_document_batches), ("tickets", iter_ticket_document_batches)):
+        if name not in docs:
+            ingest(name, it)
+
+    indexes = {}
+
+    def build(name):
+        indexes[name] = build_faiss_index(docs[name], emb)
+    record("build_index", lambda: build("kb"), repeat=3, warmup=0)
+    for name in ("kb", "tickets"):
+        if name not in indexes:
+            build(name)
+        save_faiss_index(indexes[name], str(root / f"{name}_faiss"))
+        save_bm25_index(indexes[name], str(root / f"{name}_faiss"))
+
+    qs = questions(args.queries)
+    vectors = fake_vectors(qs).astype(np.float32)
+    it = iter(range(10**9))
+    record("search", lambda: query_index_by_vector(indexes["kb"], vectors[next(it) % len(vectors)].tolist(), k=10),
+           repeat=args.queries)
+    batch = [v.tolist() for v in vectors[:32]]
+    record("search_batch32", lambda: batch_query_index_by_vectors(indexes["kb"], batch, [10] * len(batch)),
+           repeat=20)
+
+    # Point retrieval at this size's indexes; every query is unique so caches don't answer
+    for name in ("kb", "tickets"):
+        retrieval.INDEX_PATHS[name] = str(root / f"{name}_faiss")
+    retrieval.reload_indexes()
+    uq = iter(questions(args.queries * 4 + 10, seed=n))
+    record("retrieve", lambda: retrieval.retrieve_candidates(next(uq), {"kb": 10, "tickets": 3}),
+           repeat=args.queries)
+
+    if "e2e" in selected:
+        graph = build_graph()
+        eq = iter(questions(args.e2e + 10, seed=n + 7))
+
+        def e2e():
+            q = f"{next(eq)} [{n}]"
+            return graph.invoke({"question": q, "query": q, "kb_k": 5, "tickets_k": 3, "kb_evidence": [],
+                                 "ticket_evidence": [], "answer": None, "decision": None,
+                                 "validator_feedback": None, "retries": 0, "timings": {}})
+        record("e2e", e2e, repeat=args.e2e)
+
+def run_fixed(args, results: Dict[str, dict], selected) -> None:
+    """Size-independent benchmarks over one fixed evidence set."""
+    from langchain_core.documents import Document
+    from agent.retrieval import ticket_docs_to_cases
+    from agent.validator import _hard_check
+    from rag.evidence_packer import pack_evidence
+    from rag.generator import answer_messages
+    from rag.keywords import compute_features
+
+    rng = random.Random(3)
+    kb = [Document(page_content=t, metadata={"source": "amazon", "chunk_id": i, **compute_features(t)})
+          for i, t in enumerate(synthetic_text(rng, 120) for _ in range(10))]
+    tickets = [Document(page_content=f"Customer: {synthetic_text(rng, 20)}\nSupport: {synthetic_text(rng, 30)}",
+                        metadata={"row_id": i}) for i in range(3)]
+    cases = ticket_docs_to_cases(tickets)
+    q = "My refund for order 17 has not arrived, what should I do?"
+    answer = {"answer": "Refunds take 5-10 business days; contact the store about your order.",
+              "citations": [{"source": "amazon", "chunk_id": 0}], "confidence": "medium",
+              "next_steps": ["Check the order status."], "similar_cases": [], "missing_info": None}
+    answer_json = json.dumps(answer)
+
+    def record(name, fn, repeat):
+        if name in selected:
+            r = measure(fn, repeat, warmup=5)
+            results[name] = r
+            print(f"  {name:<28} {r['ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f}", flush=True)
+
+    record("format_evidence", lambda: answer_messages(q, kb[:5], cases), repeat=500)
+    record("pack_evidence", lambda: pack_evidence(q, kb, cases), repeat=200)
+    record("hard_checks", lambda: _hard_check(q, answer_json, kb[:5]), repeat=2000)
+
+def compare(results: Dict[str, dict], calib: float, baseline: dict, threshold: float, min_ms: float) -> List[str]:
+    base = baseline.get("results", {})
+    scale = calib / baseline["calibration_ms"] if baseline.get("calibration_ms") else 1.0
+    regressions = []
+    print(f"\n{'benchmark':<30} {'baseline':>10} {'now':>10} {'change':>8}   (baseline scaled x{scale:.2f})")
+    for name, r in results.items():
+        if name not in base:
+            print(f"{name:<30} {'-':>10} {r['ms']:>10.3f}      new")
+            continue
+        expected = base[name]["ms"] * scale
+        change = r["ms"] / expected - 1.0 if expected else 0.0
+        bad = change > threshold and r["ms"] - expected > min_ms
+        print(f"{name:<30} {expected:>10.3f} {r['ms']:>10.3f} {change:>+7.0%}{'   REGRESSION' if bad else ''}")
+        if bad:
+            regressions.append(name)
+    return regressions
+
+SIZED = ("ingest_kb", "ingest_tickets", "build_index", "search", "search_batch32", "retrieve", "e2e")
+ALL = SIZED + ("format_evidence", "pack_evidence", "hard_checks")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000], help="KB/ticket corpus sizes")
+    ap.add_argument("--only", default="", help=f"comma-separated subset of: {', '.join(ALL)}")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--e2e", type=int, default=50, help="graph runs per size")
+    ap.add_argument("--llm-latency-ms", type=float, default=0.0)
+    ap.add_argument("--baseline", default=str(BASELINES))
+    ap.add_argument("--save", action="store_true", help="store these results as the baselines")
+    ap.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_THRESHOLD", "0.25")))
+    ap.add_argument("--min-ms", type=float, default=0.02, help="ignore regressions smaller than this (noise floor)")
+    ap.add_argument("--out", help="also write this run's results as JSON")
+    args = ap.parse_args()
+    selected = set(args.only.split(",")) if args.only else set(ALL)
+
+    from scripts.fake_backends import install_fake_backends
+    install_fake_backends(llm_latency_ms=args.llm_latency_ms)
+
+    calib = calibrate()
+    print(f"calibration: {calib:.2f} ms")
+    results: Dict[str, dict] = {}
+    run_fixed(args, results, selected)
+    for n in args.sizes if selected & set(SIZED) else []:
+        print(f"size {n}:")
+        with tempfile.TemporaryDirectory(prefix=f"bench{n}_") as tmp:
+            run_size(n, Path(tmp), args, results, selected)
+
+    report = {"calibration_ms": calib, "sizes": args.sizes, "results": results}
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    baseline_path = Path(args.baseline)
+    if args.save:
+        old = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        if old.get("calibration_ms"):
+            # Keep one unit for the whole file: rescale entries not rerun this time
+            scale = calib / old["calibration_ms"]
+            kept = {k: {**v, "ms": v["ms"] * scale, "p95_ms": v["p95_ms"] * scale}
+                    for k, v in old.get("results", {}).items() if k not in results}
+            report["results"] = {**kept, **results}
+            report["sizes"] = sorted(set(old.get("sizes", [])) | set(args.sizes))
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"\nSaved baselines -> {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"\nNo baselines at {baseline_path}; run with --save to create them.")
+        return
+    regressions = compare(results, calib, json.loads(baseline_path.read_text(encoding="utf-8")),
+                          args.threshold, args.min_ms)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
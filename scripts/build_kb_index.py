@@ -1,20 +1,35 @@
+import argparse
 from pathlib import Path
+from rag.ann import INDEX_TYPES, index_config
 from rag.embeddings import get_embeddings_model
-from rag.vectorstore import build_faiss_index
-from ingestion.kb_passages import load_kb_passages, kb_to_documents
+from rag.vectorstore import build_faiss_index_streaming, save_bm25_index, save_faiss_index, update_faiss_index
+from ingestion.kb_passages import iter_kb_document_batches
 
 INDEX_DIR = Path("data/index/kb_faiss")
 
-def main(limit: int = 20000):
-    df = load_kb_passages("data/raw/kb_amazonqa.parquet")
-    docs = kb_to_documents(df, limit=limit)
+def main(limit: int = 20000, full: bool = False, index_type: str | None = None):
+    # Bounded batches straight from parquet; the full frame is never materialized
+    batches = iter_kb_document_batches("data/raw/kb_amazonqa.parquet", limit=limit)
 
-    embeddings = get_embeddings_model()
-    index = build_faiss_index(docs, embeddings)
-
-    INDEX_DIR.mkdir(parents=True, exist_ok=True)
-    index.save_local(str(INDEX_DIR))
-    print(f"Saved KB index -> {INDEX_DIR} (docs={len(docs)})")
+    embeddings = get_embeddings_model(cache=True, scheduled=True)
+    config = index_config(index_type)
+    INDEX_DIR.parent.mkdir(parents=True, exist_ok=True)
+    if full:
+        index = build_faiss_index_streaming(batches, embeddings, config)
+        save_faiss_index(index, str(INDEX_DIR))
+        print(f"Saved KB index -> {INDEX_DIR} (docs={len(index.index_to_docstore_id)})")
+    else:
+        index, stats = update_faiss_index(str(INDEX_DIR), batches, embeddings, config=config)
+        print(f"Updated KB index -> {INDEX_DIR} (docs={len(index.index_to_docstore_id)}) {stats}")
+    # Lexical sidecar for hybrid retrieval; no embedding calls, rebuilt from the live docs
+    bm25 = save_bm25_index(index, str(INDEX_DIR))
+    print(f"Saved BM25 index -> {INDEX_DIR} (docs={len(bm25)}, terms={len(bm25.terms)})")
+    print("Embedding cache:", embeddings.stats())
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--limit", type=int, default=20000)
+    ap.add_argument("--full", action="store_true", help="rebuild from scratch instead of updating incrementally")
+    ap.add_argument("--index-type", choices=INDEX_TYPES, default=None, help="default: $INDEX_TYPE or flat")
+    args = ap.parse_args()
+    main(limit=args.limit, full=args.full, index_type=args.index_type)
@@ -0,0 +1,38 @@
+# scripts/convert_index_to_mmap.py
+"""
+Convert data/index/*_faiss directories into the memory-mapped format.
+
+  python -m scripts.convert_index_to_mmap                      # kb + tickets
+  python -m scripts.convert_index_to_mmap data/index/kb_faiss  # one index
+  python -m scripts.convert_index_to_mmap --reembed            # ivfpq indexes
+
+Then serve from them with KB_INDEX_PATH=data/index/kb_mmap TICKETS_INDEX_PATH=data/index/tickets_mmap.
+IVF-PQ indexes only store compressed codes, so they are refused unless --reembed
+is given; rows are then re-embedded (through the embedding cache) from their text.
+"""
+from __future__ import annotations
+import argparse
+import time
+
+from rag.mmap_store import convert_faiss_to_mmap, default_mmap_path
+
+DEFAULT_SOURCES = ["data/index/kb_faiss", "data/index/tickets_faiss"]
+
+def main(sources: list[str], reembed: bool = False):
+    embeddings = None
+    if reembed:
+        from rag.embeddings import get_embeddings_model
+        embeddings = get_embeddings_model(cache=True, scheduled=True)
+    for src in sources:
+        dst = default_mmap_path(src)
+        start = time.perf_counter()
+        n = convert_faiss_to_mmap(src, dst, embeddings=embeddings)
+        print(f"{src} -> {dst} (rows={n}, {time.perf_counter() - start:.1f}s)")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("sources", nargs="*", default=DEFAULT_SOURCES)
+    ap.add_argument("--reembed", action="store_true",
+                    help="re-embed rows instead of reading stored vectors (required for ivfpq)")
+    args = ap.parse_args()
+    main(args.sources, reembed=args.reembed)
@@ -22,6 +22,9 @@ def main(n: int = 5000):
                 "text": t,
                 "is_selected": int(is_selected[j]) if j < len(is_selected) else 0,
                 "source": "msmarco",
+                # Kept so is_selected can be scored against its query (eval.retrieval_bench)
+                "query": ex.get("query", ""),
+                "query_id": int(ex.get("query_id", -1)),
             })
 
     df = pd.DataFrame(rows).dropna()
@@ -0,0 +1,31 @@
+# scripts/embedding_cache.py
+from __future__ import annotations
+import argparse
+import os
+
+from rag.embedding_cache import CachedEmbeddings, DEFAULT_CACHE_PATH
+from rag.embeddings import get_embeddings_model
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or prune the on-disk embedding cache.")
+    ap.add_argument("--max-age-days", type=float, default=None)
+    ap.add_argument("--max-mb", type=float, default=None)
+    args = ap.parse_args()
+
+    path = os.getenv("EMBEDDING_CACHE_PATH", str(DEFAULT_CACHE_PATH))
+    cache = get_embeddings_model(cache=True)
+    assert isinstance(cache, CachedEmbeddings)
+
+    print("cache:", path)
+    print("before:", cache.stats())
+
+    if args.max_age_days is not None or args.max_mb is not None:
+        removed = cache.evict(
+            max_age_seconds=args.max_age_days * 86400 if args.max_age_days is not None else None,
+            max_bytes=int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None,
+        )
+        print(f"evicted {removed} entries")
+        print("after:", cache.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# scripts/fake_backends.py
+"""
+In-process, deterministic stand-ins for the embeddings client and the LLMs,
+for benchmarks that must not touch the network (see scripts.bench_suite).
+
+  from scripts.fake_backends import install_fake_backends
+  install_fake_backends(llm_latency_ms=0)
+
+Embeddings are the same hash-derived unit vectors as scripts.fake_openai_server
+(text-embedding-3-small's 1536 dimensions), computed with numpy. Structured
+LLM calls return the same canned, schema-valid objects: RagAnswer cites the
+first CITE_KEY in the prompt and the judge PASSes. Each call sleeps
+`llm_latency_ms`; streams emit ~4 characters per chunk, `token_ms` apart.
+
+Everything is injected through the resource registry, under the keys
+rag.llm_clients uses, so the graph, retrieval and validator code run unchanged.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import time
+from typing import Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from scripts.fake_openai_server import DIM, fake_structured
+
+def fake_vectors(texts: List[str], dim: int = DIM) -> np.ndarray:
+    """fake_openai_server.fake_vector for many texts at once."""
+    raw = b"".join(hashlib.shake_256(t.encode("utf-8")).digest(dim * 2) for t in texts)
+    x = np.frombuffer(raw, dtype="<u2").reshape(len(texts), dim) / 32768.0 - 1.0
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1.0, norms)
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, dim: int = DIM, latency_ms: float = 0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return fake_vectors(list(texts), self.dim).tolist() if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def _prompt(messages) -> str:
+    return "\n".join(m.content if hasattr(m, "content") else str(m) for m in messages)
+
+class FakeStructuredLLM:
+    """Stands in for get_llm(...).with_structured_output(schema)."""
+
+    def __init__(self, schema, latency_ms: float = 0.0):
+        self.schema = schema
+        self.latency_ms = latency_ms
+        self._json_schema = schema.model_json_schema()
+        self.calls = 0
+
+    def _answer(self, messages):
+        self.calls += 1
+        return self.schema.model_validate(fake_structured(self._json_schema, _prompt(messages)))
+
+    def invoke(self, messages, config: Optional[dict] = None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return self._answer(messages)
+
+    async def ainvoke(self, messages, config: Optional[dict] = None, **kwargs):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        return self._answer(messages)
+
+class FakeStreamingLLM(FakeStructuredLLM):
+    """Stands in for get_streaming_llm(schema): the JSON text in ~4-character chunks."""
+
+    def __init__(self, schema, latency_ms: float = 0.0, token_ms: float = 0.0):
+        super().__init__(schema, latency_ms)
+        self.token_ms = token_ms
+
+    def _pieces(self, messages) -> Iterable[str]:
+        text = self._answer(messages).model_dump_json()
+        return (text[i:i + 4] for i in range(0, len(text), 4))
+
+    def stream(self, messages, config: Optional[dict] = None, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        for piece in self._pieces(messages):
+            if self.token_ms:
+                time.sleep(self.token_ms / 1000.0)
+            yield AIMessageChunk(content=piece)
+
+    async def astream(self, messages, config: Optional[dict] = None, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        for piece in self._pieces(messages):
+            if self.token_ms:
+                await asyncio.sleep(self.token_ms / 1000.0)
+            yield AIMessageChunk(content=piece)
+
+def install_fake_backends(llm_latency_ms: float = 0.0, token_ms: float = 0.0, embed_latency_ms: float = 0.0,
+                          models: Optional[List[str]] = None) -> dict:
+    """
+    Override the "embeddings" resource and the structured / streaming LLM
+    resources of `models` (default: the generation model and the judge's).
+    Returns the installed fakes by role so callers can read their call counts.
+    """
+    from rag.generator import generation_model
+    from rag.resources import registry
+    from rag.schema import RagAnswer
+    from agent.validator import ValidationResult
+
+    embeddings = FakeEmbeddings(latency_ms=embed_latency_ms)
+    registry.override("embeddings", embeddings)
+    fakes = {"embeddings": embeddings}
+    for model in dict.fromkeys(models or [generation_model(), "gpt-4o-mini"]):
+        for schema in (RagAnswer, ValidationResult):
+            fake = FakeStructuredLLM(schema, llm_latency_ms)
+            registry.override(("llm", model, 0, schema), fake)
+            fakes[f"{model}/{schema.__name__}"] = fake
+        registry.override(("llm", model, 0, RagAnswer, "stream"), FakeStreamingLLM(RagAnswer, llm_latency_ms, token_ms))
+    return fakes
+
+if __name__ == "__main__":
+    # Quick self-check: same vectors as the HTTP fake server
+    from scripts.fake_openai_server import fake_vector
+    a = np.asarray(fake_vector("hello"))
+    b = fake_vectors(["hello"])[0]
+    print(json.dumps({"dim": len(b), "max_abs_diff": float(np.abs(a - b).max())}))
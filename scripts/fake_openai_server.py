@@ -0,0 +1,223 @@
+# scripts/fake_openai_server.py
+"""
+Local stand-in for the OpenAI embeddings and chat completions endpoints, for
+load-testing without network or cost. Point clients at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+  python -m scripts.fake_openai_server --port 8765 --latency-ms 80 --rpm 600
+
+Chat completions honour `response_format` JSON schemas (RagAnswer cites the
+first CITE_KEY in the prompt, ValidationResult PASSes) and `stream=True`
+(SSE, one chunk per ~4 characters, `--token-ms` apart).
+"""
+from __future__ import annotations
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIM = 1536
+
+def fake_vector(text: str, dim: int = DIM) -> list[float]:
+    # Deterministic, unit-norm, and identical texts map to identical vectors
+    raw = hashlib.shake_256(text.encode("utf-8")).digest(dim * 2)
+    vals = [v / 32768.0 - 1.0 for v in struct.unpack(f"<{dim}H", raw)]
+    norm = sum(v * v for v in vals) ** 0.5 or 1.0
+    return [v / norm for v in vals]
+
+_CITE_RE = re.compile(r"CITE_KEY=\((?P<source>[^,]+),(?P<chunk_id>-?\d+)\)\n(?P<text>[^\n]*)")
+
+def _resolve(schema: dict, defs: dict) -> dict:
+    if "$ref" in schema:
+        return defs[schema["$ref"].split("/")[-1]]
+    return schema
+
+def fake_structured(schema: dict, prompt: str) -> dict:
+    """A schema-valid object; grounded in the prompt's first CITE_KEY where the schema allows."""
+    defs = schema.get("$defs", {})
+    cite = _CITE_RE.search(prompt)
+
+    def value(name: str, sub: dict):
+        if any(s.get("type") == "null" for s in sub.get("anyOf", [])):
+            return None  # optional fields stay empty
+        sub = _resolve(sub, defs)
+        if "enum" in sub:
+            return "PASS" if "PASS" in sub["enum"] else sub["enum"][0]
+        kind = sub.get("type")
+        if kind == "object":
+            return {k: value(k, v) for k, v in sub.get("properties", {}).items()}
+        if kind == "array":
+            if name == "citations" and cite:
+                return [{"source": cite["source"], "chunk_id": int(cite["chunk_id"])}]
+            if name == "next_steps":
+                return ["Follow the steps in the cited article.", "Reply here if the issue persists."]
+            return []
+        if kind == "integer":
+            return 0
+        if kind == "number":
+            return 0.0
+        if kind == "boolean":
+            return True
+        if name == "answer":
+            return f"According to the knowledge base: {cite['text'] if cite else 'no relevant article was found.'}"
+        if name == "confidence":
+            return "high" if cite else "low"
+        if name == "feedback":
+            return "Every instruction is supported by the KB evidence."
+        return name
+
+    return {k: value(k, v) for k, v in schema.get("properties", {}).items()}
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latency_ms: float = 50.0, jitter_ms: float = 20.0, rpm: float = 0.0,
+                 token_ms: float = 15.0):
+        super().__init__(addr, FakeOpenAIHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.rpm = rpm
+        self._lock = threading.Lock()
+        self._window: list[float] = []
+        self.stats = {"requests": 0, "throttled": 0}
+
+    def admit(self) -> bool:
+        # Sliding one-minute window; rpm <= 0 disables throttling
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.rpm <= 0:
+                return True
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 60.0]
+            if len(self._window) >= self.rpm:
+                self.stats["throttled"] += 1
+                return False
+            self._window.append(now)
+            return True
+
+    def delay(self) -> None:
+        time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0)
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict | None = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        req = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.endswith(("/embeddings", "/chat/completions")):
+            return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        if not self.server.admit():
+            return self._send(
+                429,
+                {"error": {"message": "Rate limit reached (fake server)", "type": "rate_limit_exceeded"}},
+                {"Retry-After": "1"},
+            )
+        self.server.delay()
+
+        if self.path.endswith("/chat/completions"):
+            return self._chat(req)
+
+        inputs = req.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = int(req.get("dimensions") or DIM)
+
+        data, n_tokens = [], 0
+        for i, item in enumerate(inputs):
+            text = item if isinstance(item, str) else " ".join(map(str, item))
+            n_tokens += len(text) // 4 + 1
+            vec = fake_vector(text, dim)
+            if req.get("encoding_format") == "base64":
+                vec = base64.b64encode(struct.pack(f"<{dim}f", *vec)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vec})
+
+        self._send(200, {
+            "object": "list",
+            "data": data,
+            "model": req.get("model", "fake"),
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        })
+
+    def _chat(self, req: dict):
+        prompt = "\n".join(str(m.get("content", "")) for m in req.get("messages", []))
+        fmt = req.get("response_format") or {}
+        if fmt.get("type") == "json_schema":
+            content = json.dumps(fake_structured(fmt["json_schema"].get("schema", {}), prompt))
+        else:
+            content = "This is a fake completion."
+        pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+        n_prompt, n_out = len(prompt) // 4 + 1, len(pieces)
+        usage = {"prompt_tokens": n_prompt, "completion_tokens": n_out, "total_tokens": n_prompt + n_out}
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": req.get("model", "fake")}
+
+        if not req.get("stream"):
+            time.sleep(self.server.token_ms * n_out / 1000.0)
+            return self._send(200, {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(choices, **extra):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": choices, **extra}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for piece in pieces:
+            time.sleep(self.server.token_ms / 1000.0)
+            event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (req.get("stream_options") or {}).get("include_usage"):
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def serve_in_thread(port: int = 0, **kwargs) -> FakeOpenAIServer:
+    """Start a server on a background thread; port=0 picks a free port (see server.server_port)."""
+    server = FakeOpenAIServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=20.0)
+    ap.add_argument("--rpm", type=float, default=0.0, help="requests/minute before 429s (0 = unlimited)")
+    ap.add_argument("--token-ms", type=float, default=15.0, help="chat: delay per streamed chunk")
+    args = ap.parse_args()
+
+    server = FakeOpenAIServer(("127.0.0.1", args.port), args.latency_ms, args.jitter_ms, args.rpm, args.token_ms)
+    print(f"Fake OpenAI server on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,24 @@
 # scripts/hello_agentic.py
+import argparse
+
 from agent.graph import build_graph
 
-def main():
+def run_streaming(graph, init_state):
+    # "custom" carries answer tokens/fields as they arrive; "values" the state after each node
+    init_state["stream"] = True
+    out = init_state
+    for mode, chunk in graph.stream(init_state, stream_mode=["custom", "values"]):
+        if mode == "values":
+            out = chunk
+        elif chunk["event"] == "answer_delta":
+            print(chunk["text"], end="", flush=True)
+        elif chunk["event"] == "field" and chunk["name"] != "answer":
+            print(f"\n  [{chunk['name']}] {chunk['value']}", end="", flush=True)
+        elif chunk["event"] == "decision":
+            print(f"\n  -> {chunk['decision']}\n")
+    return out
+
+def main(stream: bool = False):
     graph = build_graph()
 
     question = "My EU refund hasn't arrived. What should I do?"
@@ -16,14 +33,18 @@ def main():
         "decision": None,
         "validator_feedback": None,
         "retries": 0,
+        "timings": {},
     }
 
-    out = graph.invoke(init_state)
+    out = run_streaming(graph, init_state) if stream else graph.invoke(init_state)
 
     print("\nDECISION:", out.get("decision"))
     print("VALIDATOR_FEEDBACK:", out.get("validator_feedback"))
+    print("TIMINGS_MS:", {k: round(v, 1) for k, v in (out.get("timings") or {}).items()})
     if out.get("answer"):
         print("\nANSWER JSON:\n", out["answer"].model_dump_json(indent=2))
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stream", action="store_true", help="print the answer as it is generated")
+    main(stream=ap.parse_args().stream)
@@ -0,0 +1,88 @@
+# scripts/load_test.py
+"""
+Closed-loop load test for scripts.serve: `concurrency` clients each send
+POST /answer back to back until `requests` have been sent.
+
+  python -m scripts.fake_openai_server --port 8765 --latency-ms 80 &
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python -m scripts.serve --port 8080 &
+  python -m scripts.load_test --url http://127.0.0.1:8080 --requests 500 --concurrency 64
+
+Reports throughput, latency percentiles and response codes (503 = shed by
+backpressure, 504 = per-request timeout).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+from eval.run_eval import QUESTIONS
+
+async def run(url: str, n_requests: int, concurrency: int, questions: list[str], timeout: float) -> dict:
+    statuses: Counter = Counter()
+    latencies: list[float] = []
+    sent = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            nonlocal sent
+            while sent < n_requests:
+                question = questions[sent % len(questions)]
+                sent += 1
+                start = time.perf_counter()
+                try:
+                    r = await client.post("/answer", json={"question": question})
+                    statuses[r.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                    continue
+                if r.status_code == 200:
+                    latencies.append((time.perf_counter() - start) * 1000.0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+        server_metrics = (await client.get("/metrics")).json()
+
+    lat = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "wall_s": wall,
+        "throughput_rps": statuses[200] / wall if wall else 0.0,
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "statuses": dict(statuses),
+        "server": server_metrics,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8080")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--timeout", type=float, default=60.0, help="client-side timeout, seconds")
+    ap.add_argument("--unique", action="store_true",
+                    help="suffix each question with its request number so caches don't serve it")
+    args = ap.parse_args()
+
+    questions = QUESTIONS
+    if args.unique:
+        questions = [f"{QUESTIONS[i % len(QUESTIONS)]} (#{i})" for i in range(args.requests)]
+
+    r = asyncio.run(run(args.url, args.requests, args.concurrency, questions, args.timeout))
+    print(f"{r['requests']} requests, concurrency {r['concurrency']}: {r['wall_s']:.2f}s, "
+          f"{r['throughput_rps']:.1f} req/s")
+    print(f"latency p50 {r['p50_ms']:.0f} ms | p95 {r['p95_ms']:.0f} ms | p99 {r['p99_ms']:.0f} ms")
+    print("responses:", r["statuses"])
+    pool = r["server"].get("llm_pool", {})
+    print(f"server: peak LLM connections in flight {pool.get('peak_in_flight')}, "
+          f"saturation rate {pool.get('saturation_rate', 0.0):.1%}")
+
+if __name__ == "__main__":
+    main()
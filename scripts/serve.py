@@ -0,0 +1,267 @@
+# scripts/serve.py
+"""
+Concurrent HTTP front end for the agent graph: every request runs
+graph.ainvoke on one event loop, so a slow LLM call holds a coroutine, not a
+thread.
+
+  python -m scripts.serve --port 8080 --concurrency 32 --max-queue 256 --timeout 30
+
+  POST /answer   {"question": "..."}  -> answer, decision, feedback, timings, tokens_saved
+  GET  /healthz
+  GET  /metrics  request counts, latency percentiles, LLM pool, caches
+  GET  /metrics/prometheus  span durations, counters and gauges (rag.telemetry)
+
+At most `concurrency` graphs run at once; up to `max-queue` more wait for a
+slot. Beyond that requests are rejected with 503 + Retry-After instead of
+piling up, and a request not finished within `timeout` seconds (queueing
+included) gets 504. With TELEMETRY_PROM_FILE set, the Prometheus text is also
+written to that file every TELEMETRY_PROM_INTERVAL seconds (default 15). Point OPENAI_BASE_URL at scripts.fake_openai_server to
+load-test without API calls (see scripts.load_test).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from agent.graph import build_cached_graph, build_graph, warm_up
+from agent.retrieval import batch_stats, cache_stats
+from rag.llm_cache import get_llm_cache
+from rag.llm_clients import pool_stats
+from rag import telemetry
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error",
+            503: "Service Unavailable", 504: "Gateway Timeout"}
+MAX_BODY = 64 * 1024
+_ROUTES = ("/answer", "/healthz", "/metrics", "/metrics/prometheus")
+
+def initial_state(question: str, kb_k: int = 5, tickets_k: int = 3) -> dict:
+    return {
+        "question": question,
+        "query": question,
+        "kb_k": kb_k,
+        "tickets_k": tickets_k,
+        "kb_evidence": [],
+        "ticket_evidence": [],
+        "answer": None,
+        "decision": None,
+        "validator_feedback": None,
+        "retries": 0,
+        "timings": {},
+    }
+
+class AnswerServer:
+    def __init__(self, graph, concurrency: int = 32, max_queue: int = 256, timeout: float = 30.0):
+        self.graph = graph
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending = 0                      # running + waiting for a slot
+        self._running = 0
+        self.statuses: Counter = Counter()
+        self.latencies_ms: deque = deque(maxlen=10000)
+        self.started = time.time()
+        telemetry.gauge("serve_running", lambda: self._running, "Graph invocations running")
+        telemetry.gauge("serve_queued", lambda: self._pending - self._running, "Requests waiting for a slot")
+        telemetry.gauge("llm_pool_in_flight", lambda: pool_stats()["in_flight"], "LLM HTTP requests in flight")
+
+    async def _run(self, question: str) -> dict:
+        async with self._slots:
+            self._running += 1
+            try:
+                with telemetry.span("request", path="/answer") as s:
+                    out = await self.graph.ainvoke(initial_state(question))
+                    s.set(decision=out.get("decision"), retries=out.get("retries", 0))
+                    return out
+            finally:
+                self._running -= 1
+
+    async def answer(self, body: bytes):
+        """(status, payload, extra headers) for POST /answer."""
+        try:
+            question = (json.loads(body or b"{}").get("question") or "").strip()
+        except (ValueError, AttributeError):
+            question = ""
+        if not question:
+            return 400, {"error": 'expected JSON body {"question": "..."}'}, {}
+
+        if self._pending >= self.concurrency + self.max_queue:
+            # Backpressure: shed load now rather than time out later
+            return 503, {"error": "server busy"}, {"Retry-After": "1"}
+
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            out = await asyncio.wait_for(self._run(question), self.timeout)
+        except asyncio.TimeoutError:
+            return 504, {"error": f"no answer within {self.timeout:.0f}s"}, {}
+        finally:
+            self._pending -= 1
+        ms = (time.perf_counter() - start) * 1000.0
+        self.latencies_ms.append(ms)
+
+        answer = out.get("answer")
+        return 200, {
+            "question": question,
+            "answer": answer.model_dump() if answer is not None else None,
+            "decision": out.get("decision"),
+            "validator_feedback": out.get("validator_feedback"),
+            "retries": out.get("retries", 0),
+            "timings": {k: round(v, 2) for k, v in (out.get("timings") or {}).items()},
+            "tokens_saved": sum(p["tokens_saved"] for p in out.get("pack_stats") or []),
+            "latency_ms": round(ms, 2),
+        }, {}
+
+    def metrics(self) -> dict:
+        lat = np.asarray(self.latencies_ms, dtype=np.float64)
+        m = {
+            "uptime_s": round(time.time() - self.started, 1),
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queued": self._pending - self._running,
+            "responses": dict(self.statuses),
+            "latency_ms": {
+                f"p{p}": round(float(np.percentile(lat, p)), 2) for p in (50, 95, 99)
+            } if len(lat) else {},
+            "llm_pool": pool_stats(),
+            "retrieval_cache": cache_stats(),
+            "microbatch": batch_stats(),
+        }
+        if hasattr(self.graph, "stats"):
+            m["answer_cache"] = self.graph.stats()
+        llm_cache = get_llm_cache()
+        if llm_cache is not None:
+            m["llm_cache"] = llm_cache.stats()
+        return m
+
+    async def route(self, method: str, path: str, body: bytes):
+        path = path.split("?", 1)[0]
+        if path == "/answer":
+            if method != "POST":
+                return 405, {"error": "use POST"}, {}
+            return await self.answer(body)
+        if path == "/healthz":
+            return 200, {"status": "ok"}, {}
+        if path == "/metrics":
+            return 200, self.metrics(), {}
+        if path == "/metrics/prometheus":
+            return 200, telemetry.prometheus_text(), {}
+        return 404, {"error": f"unknown path {path}"}, {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Minimal HTTP/1.1 with keep-alive; one request at a time per connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if length > MAX_BODY:
+                    status, payload, extra = 413, {"error": "request body too large"}, {}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    start = time.perf_counter()
+                    try:
+                        status, payload, extra = await self.route(method, path, body)
+                    except Exception as e:
+                        status, payload, extra = 500, {"error": f"{type(e).__name__}: {e}"}, {}
+                    if telemetry.enabled():
+                        route = path.split("?", 1)[0]
+                        route = route if route in _ROUTES else "other"   # bounded label values
+                        telemetry.histogram("http_request_ms", "HTTP request latency", path=route).observe(
+                            (time.perf_counter() - start) * 1000.0)
+                self.statuses[status] += 1
+                telemetry.inc("http_responses_total", 1, "HTTP responses by status", status=status)
+
+                if isinstance(payload, str):
+                    data, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4"
+                else:
+                    data, ctype = json.dumps(payload, default=str).encode("utf-8"), "application/json"
+                head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                        f"Content-Type: {ctype}",
+                        f"Content-Length: {len(data)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+async def _write_prometheus_every(path: str, seconds: float) -> None:
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await asyncio.to_thread(telemetry.write_prometheus, path)
+        except OSError as e:
+            # A full disk or a missing directory must not stop serving; retry next tick
+            print(f"Prometheus file write failed: {e}", file=sys.stderr)
+
+async def serve(host: str, port: int, graph, concurrency: int, max_queue: int, timeout: float) -> None:
+    app = AnswerServer(graph, concurrency, max_queue, timeout)
+    server = await asyncio.start_server(app.handle, host, port, backlog=1024)
+    prom_file = os.getenv("TELEMETRY_PROM_FILE", "")
+    prom_writer = None
+    if prom_file:
+        interval = float(os.getenv("TELEMETRY_PROM_INTERVAL", "15"))
+        prom_writer = asyncio.create_task(_write_prometheus_every(prom_file, interval))
+    print(f"Serving on http://{host}:{port} "
+          f"(concurrency={concurrency}, max_queue={max_queue}, timeout={timeout:.0f}s)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if prom_writer is not None:
+            prom_writer.cancel()
+            # Awaiting it re-raises anything the writer died of instead of dropping it
+            with contextlib.suppress(asyncio.CancelledError):
+                await prom_writer
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--concurrency", type=int, default=int(os.getenv("SERVE_CONCURRENCY", "32")),
+                    help="graph invocations running at once")
+    ap.add_argument("--max-queue", type=int, default=int(os.getenv("SERVE_MAX_QUEUE", "256")),
+                    help="requests waiting for a slot before 503s")
+    ap.add_argument("--timeout", type=float, default=float(os.getenv("SERVE_TIMEOUT", "30")),
+                    help="seconds per request, queueing included, before 504")
+    ap.add_argument("--answer-cache", action="store_true", help="serve paraphrases from the semantic answer cache")
+    args = ap.parse_args()
+
+    print("Warm-up (s):", {k: round(v, 3) for k, v in warm_up().items()})
+    graph = build_cached_graph() if args.answer_cache else build_graph()
+    try:
+        asyncio.run(serve(args.host, args.port, graph, args.concurrency, args.max_queue, args.timeout))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
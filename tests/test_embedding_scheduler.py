@@ -0,0 +1,26 @@
+# tests/test_embedding_scheduler.py
+import time
+
+from rag.embedding_scheduler import ScheduledEmbeddings, TokenBucket, estimate_tokens
+from scripts.fake_backends import FakeEmbeddings
+
+def test_oversized_acquire_is_charged_in_full():
+    bucket = TokenBucket(rate=1000.0, capacity=10.0)
+    assert bucket.acquire(150) == 0.0
+    # The next caller pays off the 140-token debt first (~0.14 s at 1000/s)
+    start = time.monotonic()
+    bucket.acquire(1)
+    assert time.monotonic() - start >= 0.12
+
+def test_batch_larger_than_tpm_bucket_is_charged_in_full():
+    tpm = 600  # bucket capacity 10 tokens
+    emb = ScheduledEmbeddings(FakeEmbeddings(dim=8), batch_size=64, tokens_per_minute=tpm)
+    texts = ["how do I get a refund for my order " * 4] * 8
+    n_tokens = sum(estimate_tokens(t) for t in texts)
+    assert n_tokens > emb.tokens.capacity
+
+    emb.embed_documents(texts)
+    with emb.tokens._lock:
+        emb.tokens._refill()
+        balance = emb.tokens._tokens
+    assert balance < emb.tokens.capacity - n_tokens + 1
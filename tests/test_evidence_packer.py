@@ -0,0 +1,27 @@
+# tests/test_evidence_packer.py
+from langchain_core.documents import Document
+
+from rag.evidence_packer import pack_evidence, packer_config
+
+CANNED = "Thanks for reaching out. Please allow 5 business days for the refund to appear on your statement."
+
+def test_cases_sharing_a_canned_reply_are_kept():
+    cases = [
+        {"customer": "I returned the blue jacket two weeks ago and have not been refunded.", "support": CANNED},
+        {"customer": "My subscription was cancelled but I was still charged for March.", "support": CANNED},
+    ]
+    _, packed, stats = pack_evidence("where is my refund", [], cases, packer_config())
+    assert [c["customer"] for c in packed] == [c["customer"] for c in cases]
+    assert stats["cases_duplicates"] == 0
+
+def test_repeated_exchange_is_still_deduplicated():
+    case = {"customer": "Where is my refund for order 1234?", "support": CANNED}
+    _, packed, stats = pack_evidence("where is my refund", [], [case, dict(case)], packer_config())
+    assert len(packed) == 1 and stats["cases_duplicates"] == 1
+
+def test_packed_chunks_do_not_share_metadata():
+    doc = Document(id="x", page_content="Refunds take 5 business days.", metadata={"source": "kb", "chunk_id": 3})
+    packed, _, _ = pack_evidence("refund", [doc], [], packer_config())
+    packed[0].metadata["score"] = 1.0
+    assert "score" not in doc.metadata
+    assert (packed[0].metadata["source"], packed[0].metadata["chunk_id"]) == ("kb", 3)
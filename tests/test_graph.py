@@ -0,0 +1,73 @@
+# tests/test_graph.py
+import pytest
+
+from agent import graph as g
+from agent.validator import ValidationResult
+from rag.schema import RagAnswer
+
+def _state():
+    return {"question": "refund late?", "query": "refund late?", "kb_k": 5, "tickets_k": 3,
+            "kb_evidence": [], "ticket_evidence": [], "answer": None, "decision": None,
+            "validator_feedback": None, "retries": 0, "timings": {}}
+
+@pytest.fixture
+def stub_graph(monkeypatch):
+    calls = {"generate": 0, "validate": 0}
+
+    def retrieve(query, depths):
+        return {name: [] for name in depths}, {}
+
+    def generate(*args, **kwargs):
+        calls["generate"] += 1
+        return answer.model_copy()
+
+    def validate(decision):
+        def run(question, answer_json, docs):
+            calls["validate"] += 1
+            return ValidationResult(decision=decision, feedback="stub"), {"tier": "local"}
+        return run
+
+    answer = RagAnswer(answer="Refunds take 5-10 days.", citations=[], similar_cases=[],
+                       next_steps=[], confidence="low")
+    monkeypatch.setattr(g, "retrieve_candidates", retrieve)
+    monkeypatch.setattr(g, "generate_answer", generate)
+
+    def build(decision):
+        monkeypatch.setattr(g, "validate_tiered", validate(decision))
+        return g.build_graph()
+    return build, calls
+
+def test_retries_counts_retries_performed(stub_graph):
+    build, calls = stub_graph
+    out = build("RETRY_WITH_MORE_CONTEXT").invoke(_state())
+    # RETRY twice: one retry ran, then the bound ended the graph
+    assert calls == {"generate": 2, "validate": 2}
+    assert out["retries"] == g.MAX_RETRIES == 1
+
+def test_no_retry_on_pass(stub_graph):
+    build, calls = stub_graph
+    out = build("PASS").invoke(_state())
+    assert calls == {"generate": 1, "validate": 1}
+    assert out["retries"] == 0
+
+def test_cited_hashes_use_manifest_row_keys(tmp_path):
+    from langchain_core.documents import Document
+    from rag.schema import Citation
+    from rag.vectorstore import read_manifest, update_faiss_index
+    from scripts.fake_backends import FakeEmbeddings
+
+    docs = [Document(page_content=t, metadata={"source": "kb", "chunk_id": i})
+            for i, t in enumerate(["same reply", "same reply", "other"])]
+    index, _ = update_faiss_index(str(tmp_path), docs, FakeEmbeddings(), background=False)
+    rows = read_manifest(str(tmp_path))["rows"]
+    evidence = list(index.docstore._dict.values())
+
+    answer = RagAnswer(answer="x", citations=[Citation(source="kb", chunk_id=1)], similar_cases=[],
+                       next_steps=[], confidence="low")
+    cited = g.cited_hashes(answer, evidence, rows)
+    # The repeated text is stored under its ~1 key; doc_key() alone would name the first copy
+    [(key, h)] = cited.items()
+    assert key.endswith("~1") and rows[key][1] == h
+
+    missing = answer.model_copy(update={"citations": [Citation(source="kb", chunk_id=9)]})
+    assert g.cited_hashes(missing, evidence, rows) is None
@@ -0,0 +1,32 @@
+# tests/test_mmap_store.py
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from rag.ann import index_config
+from rag.mmap_store import MmapVectorStore, convert_faiss_to_mmap
+from rag.vectorstore import build_faiss_index, save_faiss_index
+from scripts.fake_backends import FakeEmbeddings, fake_vectors
+
+def _ivfpq_index(path, texts, emb):
+    docs = [Document(page_content=t, metadata={"source": "kb", "chunk_id": i}) for i, t in enumerate(texts)]
+    cfg = index_config("ivfpq", nlist=4, pq_m=16)
+    save_faiss_index(build_faiss_index(docs, emb, cfg), str(path))
+
+def test_ivfpq_is_refused_without_reembedding(tmp_path):
+    emb = FakeEmbeddings()
+    _ivfpq_index(tmp_path / "kb_faiss", [f"article {i}" for i in range(300)], emb)
+    with pytest.raises(ValueError, match="--reembed"):
+        convert_faiss_to_mmap(str(tmp_path / "kb_faiss"), str(tmp_path / "kb_mmap"))
+    assert not (tmp_path / "kb_mmap").exists()
+
+def test_ivfpq_reembeds_exact_vectors(tmp_path):
+    emb = FakeEmbeddings()
+    texts = [f"article {i}" for i in range(300)]
+    _ivfpq_index(tmp_path / "kb_faiss", texts, emb)
+    n = convert_faiss_to_mmap(str(tmp_path / "kb_faiss"), str(tmp_path / "kb_mmap"), embeddings=emb)
+    assert n == len(texts)
+
+    store = MmapVectorStore.load(str(tmp_path / "kb_mmap"), emb)
+    rows = [store.document(i).page_content for i in range(n)]
+    np.testing.assert_array_equal(np.asarray(store.vectors), fake_vectors(rows).astype(np.float32))
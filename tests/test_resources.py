@@ -0,0 +1,30 @@
+# tests/test_resources.py
+from rag.resources import ResourceRegistry
+
+def test_override_survives_reset():
+    reg = ResourceRegistry()
+    reg.register("embeddings", lambda: "real")
+    assert reg.get("embeddings") == "real"
+
+    reg.override("embeddings", "fake")
+    reg.reset("embeddings")          # what reload_indexes does
+    assert reg.get("embeddings") == "fake"
+    reg.reset()
+    assert reg.get("embeddings") == "fake"
+
+    reg.restore("embeddings")
+    assert reg.get("embeddings") == "real"
+
+def test_register_while_overridden_applies_after_restore():
+    reg = ResourceRegistry()
+    reg.override("llm_cache", None)
+    reg.register("llm_cache", lambda: "cache")   # e.g. the module imported after the override
+    assert reg.get("llm_cache") is None
+    reg.restore()
+    assert reg.get("llm_cache") == "cache"
+
+def test_restore_without_original_unregisters():
+    reg = ResourceRegistry()
+    reg.override(("llm", "m", 0), "fake")
+    reg.restore()
+    assert ("llm", "m", 0) not in reg.names()
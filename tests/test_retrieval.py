@@ -0,0 +1,29 @@
+# tests/test_retrieval.py
+import pytest
+
+from agent import retrieval
+from rag.resources import registry
+from scripts.fake_backends import FakeEmbeddings
+
+@pytest.fixture
+def emb(monkeypatch):
+    fake = FakeEmbeddings()
+    registry.override("embeddings", fake)
+    monkeypatch.setattr(retrieval, "MICROBATCH", False)
+    retrieval._query_vectors.clear()
+    yield fake
+    registry.restore("embeddings")
+    retrieval._query_vectors.clear()
+
+def test_cache_tiers_agree_on_case(emb):
+    # Embeddings tell "IRS" from "irs", so the result cache must too
+    assert retrieval.normalize_query("IRS refund") != retrieval.normalize_query("irs refund")
+    upper = retrieval.embed_query("IRS refund")
+    lower = retrieval.embed_query("irs refund")
+    assert emb.calls == 2 and upper != lower
+
+def test_whitespace_variants_share_one_embedding(emb):
+    first = retrieval.embed_query("IRS refund")
+    assert retrieval.embed_query("  IRS   refund\n") == first
+    assert emb.calls == 1
+    assert retrieval.normalize_query("  IRS   refund\n") == retrieval.normalize_query("IRS refund")
@@ -0,0 +1,31 @@
+# tests/test_stream_json.py
+import json
+
+from rag.stream_json import StreamingJSONObject
+
+def _run(text, size):
+    parser = StreamingJSONObject(string_fields=["answer"])
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return events
+
+def test_deltas_rebuild_the_field_for_any_chunking():
+    obj = {"answer": 'Refund "soon" \\ tab\\t café \U0001F600 done.\n' * 3, "confidence": "high", "k": [1, 2]}
+    text = json.dumps(obj)
+    for size in (1, 2, 3, 5, 7, len(text)):
+        events = _run(text, size)
+        deltas = "".join(e[2] for e in events if e[0] == "delta")
+        assert deltas == obj["answer"], size
+        assert events[-1] == ("done", obj)
+
+def test_long_field_is_decoded_incrementally():
+    answer = "x" * 50_000
+    text = json.dumps({"answer": answer})
+    parser = StreamingJSONObject(string_fields=["answer"])
+    for i in range(0, len(text), 4):
+        parser.feed(text[i:i + 4])
+        # While the field streams, only the tail since the last decoded position is re-read
+        if parser._streaming_string():
+            assert len(parser._text) - max(parser._decoded_to, parser._value_start + 1) <= 4
+    assert parser.value == {"answer": answer}
@@ -0,0 +1,30 @@
+# tests/test_telemetry.py
+from rag import telemetry
+
+def _line(text, prefix):
+    return next(line for line in text.splitlines() if line.startswith(prefix))
+
+def test_exporter_keeps_full_precision():
+    telemetry.counter("test_tokens_total", kind="prompt").inc(1234567)
+    h = telemetry.histogram("test_span_ms")
+    h.observe(2345678.25)
+    h.observe(0.1)
+    telemetry.gauge("test_queue_depth", lambda: 12345678.5)
+
+    text = telemetry.prometheus_text()
+    assert _line(text, 'copilot_test_tokens_total{kind="prompt"}') == 'copilot_test_tokens_total{kind="prompt"} 1234567'
+    assert _line(text, "copilot_test_span_ms_sum").split()[1] == repr(2345678.25 + 0.1)
+    assert _line(text, "copilot_test_span_ms_count").split()[1] == "2"
+    assert _line(text, "copilot_test_queue_depth").split()[1] == "12345678.5"
+
+def test_counter_increments_stay_visible_past_a_million():
+    c = telemetry.counter("test_big_total")
+    c.inc(1_000_000)
+    before = _line(telemetry.prometheus_text(), "copilot_test_big_total").split()[1]
+    c.inc(3)
+    after = _line(telemetry.prometheus_text(), "copilot_test_big_total").split()[1]
+    assert float(after) - float(before) == 3
+
+def test_special_values():
+    assert telemetry._fmt_value(float("inf")) == "+Inf"
+    assert telemetry._fmt_value(float("nan")) == "NaN"
@@ -0,0 +1,49 @@
+# tests/test_validator.py
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from agent import validator
+from agent.validator import ValidationResult, numbers, validate_tiered
+
+CHUNK = Document(
+    page_content=("Escalate billing issues if charge is pending more than 7 days. "
+                  "Refunds take 5-10 business days. EU refunds may take longer."),
+    metadata={"source": "runbook.md", "chunk_id": 1},
+)
+
+def _answer(text):
+    return json.dumps({"answer": text, "citations": [{"source": "runbook.md", "chunk_id": 1}],
+                       "confidence": "high", "next_steps": [], "similar_cases": []})
+
+@pytest.fixture
+def judge(monkeypatch):
+    calls = []
+
+    def fake(messages, schema, model, temperature=0):
+        calls.append(messages)
+        return ValidationResult(decision="RETRY_WITH_MORE_CONTEXT", feedback="invented threshold")
+    monkeypatch.setattr(validator, "invoke_structured", fake)
+    return calls
+
+def test_numbers_are_normalized():
+    assert numbers("Wait 5-10 business days, up to 1,000 USD or two weeks (2.5%).") == {"5", "10", "1000", "2", "2.5"}
+
+def test_supported_answer_passes_locally(judge):
+    result, info = validate_tiered(
+        "Charged twice, pending for days?",
+        _answer("Escalate billing issues if charge is pending more than 7 days."), [CHUNK])
+    assert (result.decision, info["tier"]) == ("PASS", "local")
+    assert judge == []
+
+@pytest.mark.parametrize("text", [
+    "Escalate billing issues if charge is pending more than 2 days.",
+    "Escalate billing issues if charge is pending more than two days.",
+    "Refunds take 5-10 business days. EU refunds may take longer than 30 days.",
+])
+def test_invented_number_goes_to_the_judge(judge, text):
+    result, info = validate_tiered("Charged twice, pending for days?", _answer(text), [CHUNK])
+    assert info["tier"] == "llm" and info["unsupported_numbers"]
+    assert result.decision == "RETRY_WITH_MORE_CONTEXT"
+    assert len(judge) == 1
@@ -0,0 +1,63 @@
+# tests/test_vectorstore.py
+from langchain_core.documents import Document
+
+from rag.vectorstore import read_manifest, update_faiss_index
+from scripts.fake_backends import FakeEmbeddings
+
+def _kb(texts):
+    return [Document(page_content=t, metadata={"source": "kb", "chunk_id": i}) for i, t in enumerate(texts)]
+
+def _update(path, texts, embeddings, compact_ratio=1.0):
+    # No compaction unless asked: tombstones stay in the docstore between updates
+    return update_faiss_index(str(path), _kb(texts), embeddings, compact_ratio=compact_ratio, background=False)
+
+def test_revert_to_tombstoned_version(tmp_path):
+    emb = FakeEmbeddings()
+    _update(tmp_path, ["refund policy A"], emb)
+    _update(tmp_path, ["refund policy B"], emb)
+    calls = emb.calls
+
+    # A -> B -> A before compaction: A's id is still in the docstore, tombstoned
+    index, stats = _update(tmp_path, ["refund policy A"], emb)
+    assert stats["revived"] == 1 and stats["added"] == 0
+    assert emb.calls == calls  # nothing re-embedded
+
+    hits = index.similarity_search("refund policy A", k=5, filter=lambda md: not md.get("tombstone"), fetch_k=10)
+    assert [d.page_content for d in hits] == ["refund policy A"]
+    live = [_id for _id, h in read_manifest(str(tmp_path))["rows"].values()]
+    assert not set(live) & set(read_manifest(str(tmp_path))["tombstones"])
+
+def test_deleting_a_middle_row_only_deletes_it(tmp_path):
+    emb = FakeEmbeddings()
+    _update(tmp_path, ["a", "b", "c", "d"], emb)
+    calls = emb.calls
+
+    index, stats = _update(tmp_path, ["a", "c", "d"], emb)
+    assert (stats["added"], stats["changed"], stats["deleted"]) == (0, 0, 1)
+    assert emb.calls == calls
+    # Shifted rows keep their vectors; only chunk_id is refreshed
+    assert stats["refreshed"] == 2
+    by_text = {d.page_content: d.metadata["chunk_id"] for d in index.docstore._dict.values()
+               if not d.metadata.get("tombstone")}
+    assert by_text == {"a": 0, "c": 1, "d": 2}
+
+def test_duplicate_texts_get_distinct_keys(tmp_path):
+    emb = FakeEmbeddings()
+    index, stats = _update(tmp_path, ["same", "same", "other"], emb)
+    assert stats["added"] == 3
+    _, stats = _update(tmp_path, ["same", "other"], emb)
+    assert (stats["added"], stats["deleted"]) == (0, 1)
+
+def test_keyword_features_refresh_without_reembedding(tmp_path, monkeypatch):
+    from rag import keywords
+    from ingestion.kb_passages import _make_docs
+    emb = FakeEmbeddings()
+    texts = ["my refund never arrived", "reset my password"]
+    update_faiss_index(str(tmp_path), _make_docs(texts, ["kb"] * 2, range(2)), emb, background=False)
+    calls = emb.calls
+
+    monkeypatch.setattr(keywords, "KEYWORDS_VERSION", "test-bump")
+    index, stats = update_faiss_index(str(tmp_path), _make_docs(texts, ["kb"] * 2, range(2)), emb, background=False)
+    assert (stats["added"], stats["changed"], stats["refreshed"]) == (0, 0, 2)
+    assert emb.calls == calls
+    assert {d.metadata["kw_version"] for d in index.docstore._dict.values()} == {"test-bump"}